@@ -0,0 +1,64 @@
+"""
+Фильтры REST API для MyBiz проекта.
+"""
+import django_filters
+from rest_framework import filters
+
+from mybiz_core.models import Product
+from services.product_services import ProductService
+from services.search_services import ProductSearchIndex, SEARCH_MODES
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    Фильтры списка товаров.
+
+    category и category__slug отбирают товары категории вместе со всеми подкатегориями.
+    """
+    category = django_filters.NumberFilter(method='filter_category')
+    category__slug = django_filters.CharFilter(method='filter_category_slug')
+
+    class Meta:
+        model = Product
+        fields = {
+            'price': ['gte', 'lte'],
+            'in_stock': ['exact'],
+            'is_new': ['exact'],
+            'is_featured': ['exact'],
+            'brand': ['exact'],
+        }
+
+    def filter_category(self, queryset, name, value):
+        return ProductService.filter_by_category(queryset, pk=value)
+
+    def filter_category_slug(self, queryset, name, value):
+        return ProductService.filter_by_category(queryset, slug=value)
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    ?search= через поисковый индекс товаров вместо icontains по search_fields.
+
+    ?search_mode= выбирает режим: fulltext, fuzzy (устойчив к опечаткам) или auto (по умолчанию).
+    """
+    search_mode_param = 'search_mode'
+
+    def get_search_mode(self, request):
+        mode = request.query_params.get(self.search_mode_param, 'auto')
+        return mode if mode in SEARCH_MODES else 'auto'
+
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        return ProductSearchIndex.search(queryset, query, mode=self.get_search_mode(request))
+
+
+class RelevanceOrderingFilter(filters.OrderingFilter):
+    """Без явного ?ordering= результаты поиска сортируются по релевантности"""
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params and 'search_rank' in queryset.query.annotations:
+            return ['-search_rank'] + list(self.get_default_ordering(view) or [])
+        return super().get_ordering(request, queryset, view)
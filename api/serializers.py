@@ -1,12 +1,241 @@
 """
 REST API serializers для MyBiz проекта.
 """
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, Round
 from rest_framework import serializers
 from mybiz_core.models import Category, Product
 from content.models import Promotion, SiteSettings
 
 
-class CategorySerializer(serializers.ModelSerializer):
+def parse_field_list(value):
+    """'id, name,category.name' -> {'id', 'name', 'category.name'}"""
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Выборочные поля сериализатора по параметрам запроса ?fields= и ?expand=.
+
+    fields - список выводимых полей через запятую; поля вложенных
+    сериализаторов указываются через точку (category.name), имя вложенного
+    поля без точки выводит его целиком. Неизвестные имена игнорируются.
+    Без ?fields= выводятся все поля.
+
+    Поля из expandable_fields (Meta или аргумент конструктора) дорогие и
+    выводятся только по ?expand=, с тем же синтаксисом имён.
+
+    Meta.field_sources - поля модели, из которых считаются вычисляемые поля:
+    по ним query_fields() составляет аргументы .only() и select_related().
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._expandable_fields = kwargs.pop('expandable_fields', None)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def expandable_fields(self):
+        if self._expandable_fields is not None:
+            return self._expandable_fields
+        return getattr(self.Meta, 'expandable_fields', ())
+
+    def get_field_path(self):
+        """Путь сериализатора от корня: '' или 'category.'"""
+        names = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return ''.join(f'{name}.' for name in reversed(names))
+
+    def get_requested(self):
+        request = self.context.get('request')
+        if request is None:
+            return None, set()
+        params = request.query_params
+        requested = parse_field_list(params.get('fields')) if 'fields' in params else None
+        return requested, parse_field_list(params.get('expand'))
+
+    @staticmethod
+    def is_selected(path, requested):
+        """Выбрано ли поле path: явно, одним из вложенных полей или предком целиком"""
+        for name in requested:
+            if name == path or name.startswith(f'{path}.') or path.startswith(f'{name}.'):
+                return True
+        return False
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expanded = self.get_requested()
+        path = self.get_field_path()
+        for name in list(fields):
+            full_name = path + name
+            if name in self.expandable_fields and full_name not in expanded:
+                del fields[name]
+            elif requested is not None and not self.is_selected(full_name, requested | expanded):
+                del fields[name]
+        return fields
+
+    def query_fields(self, prefix=''):
+        """
+        Поля модели для выводимых полей.
+
+        Returns:
+            tuple: (поля для .only(), связи для select_related())
+        """
+        sources = getattr(self.Meta, 'field_sources', {})
+        only, related = {prefix + self.Meta.model._meta.pk.name}, set()
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, SparseFieldsMixin):
+                relation = prefix + field.source
+                related.add(relation)
+                child_only, child_related = field.query_fields(f'{relation}__')
+                only.update(child_only)
+                related.update(child_related)
+                continue
+            for source in sources.get(name, () if field.source == '*' else (field.source,)):
+                source = prefix + source.replace('.', '__')
+                only.add(source)
+                if '__' in source[len(prefix):]:
+                    related.add(source.rsplit('__', 1)[0])
+        return only, related
+
+
+def price_cents(field):
+    """Цена в копейках целым числом: процент скидки считается без погрешностей float"""
+    return Cast(Round(F(field) * 100), IntegerField())
+
+
+HAS_DISCOUNT = Q(discount_price__isnull=False) & ~Q(discount_price=0)
+
+# Product.display_price и Product.get_discount_percentage() в SQL
+DISPLAY_PRICE = Case(
+    When(HAS_DISCOUNT, then=F('discount_price')),
+    default=F('price'),
+    output_field=DecimalField(max_digits=10, decimal_places=2),
+)
+# Целочисленное деление отбрасывает дробную часть, как int() в модели
+DISCOUNT_PERCENTAGE = Case(
+    When(
+        HAS_DISCOUNT & Q(price__gt=0),
+        then=(price_cents('price') - price_cents('discount_price')) * 100 / price_cents('price'),
+    ),
+    default=Value(0),
+    output_field=IntegerField(),
+)
+
+VALUES_PREFIX = 'values_'
+# Поля, to_representation() которых возвращает значение из БД без изменений
+PLAIN_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+class ValuesListMixin:
+    """
+    Быстрый режим списка: кортежи values_list вместо экземпляров модели.
+
+    values_queryset() выбирает только выводимые поля (с учётом ?fields=),
+    вычисляемые поля считаются в SQL по Meta.values_annotations или читаются
+    из колонок связанных моделей по Meta.values_columns;
+    to_values_representation() собирает из строк словари, совпадающие с
+    to_representation() для экземпляров. Поля, которых нет среди колонок
+    модели, аннотаций и values_columns, режим не поддерживает:
+    get_values_plan() тогда возвращает None.
+    """
+
+    def get_values_plan(self, prefix=''):
+        """[(имя поля, колонка, преобразование или вложенный план)] или None"""
+        annotations = getattr(self.Meta, 'values_annotations', {})
+        columns = getattr(self.Meta, 'values_columns', {})
+        pk_name = self.Meta.model._meta.pk.name
+        plan = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, ValuesListMixin):
+                nested = field.get_values_plan(f'{prefix}{field.source}__')
+                if nested is None:
+                    return None
+                plan.append((name, f'{prefix}{field.source}__{pk_name}', nested))
+            elif name in annotations and not prefix:
+                plan.append((name, VALUES_PREFIX + name, None))
+            elif name in columns:
+                plan.append((name, prefix + columns[name], None))
+            else:
+                try:
+                    model_field = self.Meta.model._meta.get_field(field.source)
+                except FieldDoesNotExist:
+                    return None
+                if not model_field.concrete or model_field.is_relation:
+                    return None
+                plan.append((name, prefix + model_field.name, self.get_values_converter(field, model_field)))
+        return plan
+
+    @staticmethod
+    def get_values_converter(field, model_field):
+        if isinstance(field, serializers.FileField):
+            # FieldFile из имени файла: url строится тем же хранилищем, что у экземпляра
+            return lambda value: field.to_representation(model_field.attr_class(None, model_field, value))
+        if isinstance(field, PLAIN_FIELDS):
+            return None
+        return field.to_representation
+
+    def values_queryset(self, queryset, extra=()):
+        """
+        QuerySet именованных кортежей для to_values_representation() этого же сериализатора.
+
+        extra - дополнительные колонки строк (поля сортировки для курсора).
+        """
+        plan = self.get_values_plan()
+        annotations = getattr(self.Meta, 'values_annotations', {})
+        columns = ['pk', *extra]
+        for name, column, convert in self._iter_plan(plan):
+            if column not in columns:
+                columns.append(column)
+        queryset = queryset.annotate(**{
+            VALUES_PREFIX + name: expression for name, expression in annotations.items()
+            if VALUES_PREFIX + name in columns
+        })
+        self._values_columns = columns
+        return queryset.values_list(*columns, named=True)
+
+    @classmethod
+    def _iter_plan(cls, plan):
+        for name, column, convert in plan:
+            yield name, column, convert
+            if isinstance(convert, list):
+                yield from cls._iter_plan(convert)
+
+    def _indexed_plan(self, plan):
+        index = {column: position for position, column in enumerate(self._values_columns)}
+        return [
+            (name, index[column], self._indexed_plan(convert) if isinstance(convert, list) else convert)
+            for name, column, convert in plan
+        ]
+
+    def to_values_representation(self, rows):
+        """Список словарей из строк values_queryset()"""
+        plan = self._indexed_plan(self.get_values_plan())
+
+        def build(row, plan):
+            data = {}
+            for name, position, convert in plan:
+                value = row[position]
+                if isinstance(convert, list):
+                    data[name] = None if value is None else build(row, convert)
+                elif value is None or convert is None:
+                    data[name] = value
+                else:
+                    data[name] = convert(value)
+            return data
+
+        return [build(row, plan) for row in rows]
+
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериалайзер для категорий"""
     products_count = serializers.ReadOnlyField()
     
@@ -18,18 +247,23 @@ class CategorySerializer(serializers.ModelSerializer):
             'is_active', 'products_count', 'created_at', 'updated_at'
         ]
         read_only_fields = ['slug', 'created_at', 'updated_at']
+        field_sources = {'products_count': ('path', 'stats__subtree_active')}
 
 
-class CategoryListSerializer(serializers.ModelSerializer):
+class CategoryListSerializer(SparseFieldsMixin, ValuesListMixin, serializers.ModelSerializer):
     """Упрощенный сериалайзер для списка категорий"""
     products_count = serializers.ReadOnlyField()
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'image', 'products_count']
+        field_sources = {'products_count': ('path', 'stats__subtree_active')}
+        # Строка CategoryStats создаётся вместе с категорией - запасной COUNT из
+        # Category.products_count в режиме values_list не нужен
+        values_columns = {'products_count': 'stats__subtree_active'}
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериалайзер для товаров"""
     category = CategoryListSerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
@@ -50,12 +284,16 @@ class ProductSerializer(serializers.ModelSerializer):
             'stock', 'is_active', 'is_featured', 'created_at', 'updated_at'
         ]
         read_only_fields = ['slug', 'created_at', 'updated_at']
+        field_sources = {
+            'display_price': ('price', 'discount_price'),
+            'discount_percentage': ('price', 'discount_price'),
+        }
     
     def get_discount_percentage(self, obj):
         return obj.get_discount_percentage()
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, ValuesListMixin, serializers.ModelSerializer):
     """Упрощенный сериалайзер для списка товаров"""
     category = CategoryListSerializer(read_only=True)
     display_price = serializers.ReadOnlyField()
@@ -68,6 +306,14 @@ class ProductListSerializer(serializers.ModelSerializer):
             'display_price', 'discount_percentage', 'sku', 'image',
             'rating', 'is_new', 'in_stock', 'is_featured'
         ]
+        field_sources = {
+            'display_price': ('price', 'discount_price'),
+            'discount_percentage': ('price', 'discount_price'),
+        }
+        values_annotations = {
+            'display_price': DISPLAY_PRICE,
+            'discount_percentage': DISCOUNT_PERCENTAGE,
+        }
     
     def get_discount_percentage(self, obj):
         return obj.get_discount_percentage()
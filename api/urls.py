@@ -10,7 +10,8 @@ from .views import (
     PromotionViewSet,
     site_settings,
     newsletter_subscribe,
-    health_check
+    health_check,
+    cache_metrics
 )
 
 app_name = 'api'
@@ -25,4 +26,5 @@ urlpatterns = [
     path('site-settings/', site_settings, name='api-site-settings'),
     path('newsletter/subscribe/', newsletter_subscribe, name='api-newsletter-subscribe'),
     path('health/', health_check, name='api-health-check'),
+    path('cache-metrics/', cache_metrics, name='api-cache-metrics'),
 ]
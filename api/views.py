@@ -1,19 +1,29 @@
 """
 REST API views для MyBiz проекта.
 """
+from functools import wraps
+
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 from mybiz_core.models import Category, Product
 from content.models import Promotion, SiteSettings, NewsletterSubscriber
+from services.conditional import namespace_etag, not_modified_response, set_validators
+from services.facet_services import FacetService
+from services.instrumented_cache import get_metrics
+from services.pagination import KEYSET_FIELDS, KeysetPaginator, InvalidCursor, estimate_count
+from services.product_services import PromotionService
+from .filters import ProductFilter, ProductSearchFilter, RelevanceOrderingFilter
 from .serializers import (
-    CategorySerializer, CategoryListSerializer,
+    ValuesListMixin, CategorySerializer, CategoryListSerializer,
     ProductSerializer, ProductListSerializer,
     PromotionSerializer, SiteSettingsSerializer
 )
@@ -25,8 +35,104 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Category.objects.filter(is_active=True).prefetch_related('children')
+class CatalogPagination(StandardResultsSetPagination):
+    """
+    Пагинация каталога: по номеру страницы или по курсору.
+
+    Параметр ?cursor= (пустой - первая страница) включает keyset-пагинацию
+    без OFFSET и COUNT; ?estimate_total=true добавляет в ответ
+    приблизительное число товаров estimated_count.
+    """
+    cursor_query_param = 'cursor'
+    keyset_page = None
+    estimated_count = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        paginator = KeysetPaginator(queryset, page_size=self.get_page_size(request))
+        try:
+            self.keyset_page = paginator.get_page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Некорректный курсор.')
+
+        if request.query_params.get('estimate_total', '').lower() == 'true':
+            self.estimated_count = estimate_count(queryset)
+        return self.keyset_page.object_list
+
+    def get_paginated_response(self, data):
+        if self.keyset_page is None:
+            return super().get_paginated_response(data)
+
+        next_url = None
+        if self.keyset_page.has_next:
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, self.keyset_page.next_cursor
+            )
+        payload = {'next': next_url, 'previous': None, 'results': data}
+        if self.estimated_count is not None:
+            payload['estimated_count'] = self.estimated_count
+        return Response(payload)
+
+
+def conditional_action(action):
+    """
+    ETag для действия ViewSet по view.get_etag(request): при совпадении с
+    If-None-Match - 304 без запросов к БД и сериализации.
+    """
+    @wraps(action)
+    def wrapper(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        response = not_modified_response(request, etag)
+        if response is None:
+            response = set_validators(action(self, request, *args, **kwargs), etag, vary=['Accept'])
+        return response
+    return wrapper
+
+
+class ConditionalViewSetMixin:
+    """ETag списков и объектов по версиям пространств кэша etag_namespaces"""
+
+    etag_namespaces = ('catalog',)
+
+    def get_etag(self, request):
+        return namespace_etag(request, self.etag_namespaces)
+
+    @conditional_action
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_action
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class SparseFieldsViewSetMixin:
+    """
+    Запрос к БД по полям, которые выведет сериализатор (?fields=, ?expand=).
+
+    Поля и связи берутся из SparseFieldsMixin.query_fields(): лишние колонки
+    (описание, SEO-поля) не читаются, ненужные JOIN (статистика категории
+    для products_count) не делаются. Поля сортировки читаются всегда -
+    по ним строится курсор keyset-пагинации.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        only, related = self.get_serializer().query_fields()
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        only.update(name for name in self.ordering_fields if name in model_fields)
+        queryset = queryset.select_related(None)
+        if related:
+            # select_related() без аргументов присоединил бы все внешние ключи
+            queryset = queryset.select_related(*related)
+        return queryset.only(*only)
+
+
+class CategoryViewSet(SparseFieldsViewSetMixin, ConditionalViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.filter(is_active=True).select_related('stats')
     permission_classes = [AllowAny]
     pagination_class = StandardResultsSetPagination
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -39,23 +145,17 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
         return CategorySerializer
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.objects.filter(is_active=True).select_related('category')
+class ProductViewSet(SparseFieldsViewSetMixin, ConditionalViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'category__stats')
     permission_classes = [AllowAny]
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = {
-        'category': ['exact'],
-        'category__slug': ['exact'],
-        'price': ['gte', 'lte'],
-        'in_stock': ['exact'],
-        'is_new': ['exact'],
-        'is_featured': ['exact'],
-        'brand': ['exact'],
-    }
+    pagination_class = CatalogPagination
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, RelevanceOrderingFilter]
+    filterset_class = ProductFilter
     search_fields = ['name', 'short_description', 'description', 'sku', 'brand']
     ordering_fields = ['price', 'created_at', 'rating', 'name']
     ordering = ['-created_at']
+    # Список через values_list без экземпляров Product (ValuesListMixin), если сериализатор его поддерживает
+    values_list_mode = True
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -72,30 +172,90 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(discount_price__isnull=False)
         return queryset
 
+    @conditional_action
+    def list(self, request, *args, **kwargs):
+        """Список товаров с блоком facets для текущего набора фильтров"""
+        queryset = self.filter_queryset(self.get_queryset())
+        facets = FacetService.get_facets(queryset, self.get_facet_filters(), 'api')
+
+        values_serializer = self.get_values_serializer()
+        if values_serializer is not None:
+            # Курсор строится по полю сортировки строки
+            extra = [
+                name for name in KEYSET_FIELDS
+                if name in queryset.query.annotations or name in self.ordering_fields
+            ]
+            queryset = values_serializer.values_queryset(queryset, extra)
+
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        if values_serializer is not None:
+            data = values_serializer.to_values_representation(rows)
+        else:
+            data = self.get_serializer(rows, many=True).data
+
+        if page is not None:
+            response = self.get_paginated_response(data)
+            response.data['facets'] = facets
+            return response
+        return Response({'results': data, 'facets': facets})
 
-class PromotionViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_facet_filters(self):
+        """Фильтры, фактически применённые к списку (ключ кэша фасетов)"""
+        params = self.request.query_params
+        filters = {}
+        filterset = ProductFilter(params, request=self.request)
+        if filterset.is_valid():
+            filters = {
+                name: str(value) for name, value in filterset.form.cleaned_data.items()
+                if value is not None and value != ''
+            }
+        search = ProductSearchFilter()
+        query = ' '.join(search.get_search_terms(self.request))
+        if query:
+            filters['search'] = query
+            filters['search_mode'] = search.get_search_mode(self.request)
+        for flag in ('in_stock_only', 'has_discount'):
+            if params.get(flag, '').lower() == 'true':
+                filters[flag] = 'true'
+        return filters
+
+    def get_values_serializer(self):
+        """Сериализатор списка в режиме values_list или None, если режим недоступен"""
+        if not self.values_list_mode:
+            return None
+        serializer = self.get_serializer()
+        if not isinstance(serializer, ValuesListMixin) or serializer.get_values_plan() is None:
+            return None
+        return serializer
+
+
+class PromotionViewSet(ConditionalViewSetMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [AllowAny]
     pagination_class = StandardResultsSetPagination
     serializer_class = PromotionSerializer
+    etag_namespaces = ('promotions',)
+
+    def get_etag(self, request):
+        # Набор активных акций меняется и со сменой даты
+        return namespace_etag(request, self.etag_namespaces, timezone.localdate().isoformat())
 
     def get_queryset(self):
-        from django.utils import timezone
-        today = timezone.now().date()
-        queryset = Promotion.objects.filter(
-            is_active=True,
-            start_date__lte=today
-        ).filter(
-            Q(end_date__gte=today) | Q(end_date__isnull=True)
-        ).order_by('-created_at')
-        return queryset
+        # Тот же закэшированный набор, что и на витрине; из БД - только поля по pk
+        pks = [promotion.pk for promotion in PromotionService.get_active_promotions()]
+        return Promotion.objects.filter(pk__in=pks).order_by('-created_at')
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def site_settings(request):
+    etag = namespace_etag(request, ('settings',))
+    response = not_modified_response(request, etag)
+    if response is not None:
+        return response
     settings = SiteSettings.load()
     serializer = SiteSettingsSerializer(settings)
-    return Response(serializer.data)
+    return set_validators(Response(serializer.data), etag, vary=['Accept'])
 
 
 @api_view(['POST'])
@@ -142,3 +302,10 @@ def health_check(request):
         health_status['status'] = 'unhealthy'
     status_code = status.HTTP_200_OK if health_status['status'] == 'healthy' else status.HTTP_503_SERVICE_UNAVAILABLE
     return Response(health_status, status=status_code)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_metrics(request):
+    """Метрики кэша по группам ключей (services.instrumented_cache), для персонала"""
+    return Response({'groups': get_metrics()})
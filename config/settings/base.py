@@ -69,6 +69,8 @@ INSTALLED_APPS = [
 # ==============================================================================
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'mybiz_core.middleware.RequestMemoMiddleware',
+    'mybiz_core.middleware.CacheVersionSyncMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -179,6 +181,18 @@ CACHES = {
     }
 }
 
+# Полностраничный кэш витрины для анонимных посетителей (services.page_cache)
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_TIMEOUT = 600
+PAGE_CACHE_ALIAS = 'default'
+
+# Фрагменты шапки и подвала ({% versioned_cache %}), сек
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Предельный срок кэша активных акций; обычно он истекает на ближайшей
+# дате начала или окончания акции (PromotionService.seconds_until_change)
+PROMOTIONS_CACHE_MAX_TIMEOUT = 6 * 3600
+
 # ==============================================================================
 # СЕССИИ
 # ==============================================================================
@@ -15,6 +15,18 @@ CACHES = {
     }
 }
 
+# Страницы всегда рендерятся заново
+PAGE_CACHE_ENABLED = False
+
+# Статистика обращений к кэшу контекст-процессоров в заголовке X-Context-Cache
+MIDDLEWARE = MIDDLEWARE + ['mybiz_core.middleware.ContextCacheStatsMiddleware']
+
+# Шина инвалидации локальных кэшей без Redis: журнал в файле, общий для процессов машины
+INVALIDATION_BUS = {
+    'BACKEND': 'services.invalidation.FileBus',
+    'OPTIONS': {'PATH': str(LOG_DIR / 'cache-invalidation.log')},
+}
+
 SESSION_COOKIE_SECURE = False
 CSRF_COOKIE_SECURE = False
 SECURE_SSL_REDIRECT = False
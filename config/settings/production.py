@@ -112,7 +112,40 @@ CACHES = {
         },
         'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'mybiz'),
         'TIMEOUT': 300,
-    }
+    },
+    # Версионированные данные витрины (настройки, категории, акции, страницы):
+    # LRU в памяти воркера перед Redis, об изменениях сообщает шина инвалидации
+    'two_tier': {
+        'BACKEND': 'services.two_tier_cache.TwoTierCache',
+        'LOCATION': 'storefront',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'REMOTE_ALIAS': 'default',
+            'MAX_ENTRIES': int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 2000)),
+            'LOCAL_TIMEOUT': 60,
+            # Версии обновляются через шину; TTL ограничивает устаревание,
+            # если сообщение потерялось между переподключениями
+            'VERSION_TIMEOUT': 30,
+        },
+    },
+    # Метрики попаданий, объёма и задержки по группам ключей поверх two_tier
+    # (manage.py cache_metrics, /api/cache-metrics/)
+    'storefront': {
+        'BACKEND': 'services.instrumented_cache.InstrumentedCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {'TARGET_ALIAS': 'two_tier'},
+    },
+}
+VERSIONED_CACHE_ALIAS = 'storefront'
+CACHE_METRICS_ALIAS = 'default'
+
+# Рассылка инвалидаций локальных кэшей воркерам через Redis pub/sub
+INVALIDATION_BUS = {
+    'BACKEND': 'services.invalidation.RedisBus',
+    'OPTIONS': {
+        'CACHE_ALIAS': 'default',
+        'CHANNEL': f"{os.environ.get('CACHE_KEY_PREFIX', 'mybiz')}:invalidation",
+    },
 }
 
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
@@ -242,6 +275,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.gzip.GZipMiddleware',
+    'mybiz_core.middleware.RequestMemoMiddleware',
+    'mybiz_core.middleware.CacheVersionSyncMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -5,6 +5,7 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from .models import SiteSettings, Promotion, StockNotification, NewsletterSubscriber
 from .forms import SiteSettingsForm
+from services import page_cache
 
 
 @admin.register(SiteSettings)
@@ -149,13 +150,18 @@ class PromotionAdmin(admin.ModelAdmin):
     )
     readonly_fields = ['created_at', 'updated_at']
 
+    def _bulk_update(self, queryset, **values):
+        """queryset.update() со сбросом страниц с акциями в полностраничном кэше (сигналы не вызываются)"""
+        queryset.update(**values)
+        page_cache.purge('promotions')
+
     def activate_promotions(self, request, queryset):
-        queryset.update(is_active=True)
+        self._bulk_update(queryset, is_active=True)
         self.message_user(request, f'{queryset.count()} акций активированы', level='success')
     activate_promotions.short_description = '✅ Активировать'
 
     def deactivate_promotions(self, request, queryset):
-        queryset.update(is_active=False)
+        self._bulk_update(queryset, is_active=False)
         self.message_user(request, f'{queryset.count()} акций деактивированы', level='warning')
     deactivate_promotions.short_description = '❌ Деактивировать'
 
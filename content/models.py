@@ -7,9 +7,9 @@ from django_ckeditor_5.fields import CKEditor5Field
 from mybiz_core.validators import validate_image_extension, validate_image_size, validate_image_dimensions
 import re
 import logging
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.core.cache import cache
+from services.cache import CacheEntry, VersionedQuerySet, bump_for_model, settings_cache
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +50,9 @@ class Promotion(models.Model):
         validators=[validate_image_extension, validate_image_size, validate_image_dimensions]
     )
 
+    objects = VersionedQuerySet.as_manager()
+    cache_namespaces = ('promotions',)
+
     class Meta:
         verbose_name = "промо-акция"
         verbose_name_plural = "Промо-акции"
@@ -179,6 +182,10 @@ class SiteSettings(models.Model):
 
     updated_at = models.DateTimeField(auto_now=True, editable=False, verbose_name="Дата обновления")
 
+    objects = VersionedQuerySet.as_manager()
+    # Настройки влияют на вывод акций и страниц в шапке - их кэш тоже сбрасывается
+    cache_namespaces = ('settings', 'promotions', 'pages')
+
     class Meta:
         verbose_name = "настройка сайта"
         verbose_name_plural = "Настройки сайта"
@@ -236,10 +243,8 @@ class SiteSettings(models.Model):
                     raise ValidationError(f'Поле {field_name}: неверный формат HEX цвета')
 
     @classmethod
-    def load(cls):
-        cache_key = 'site_settings'
-        obj = cache.get(cache_key)
-        if obj is None:
+    def cache_entry(cls):
+        def load():
             obj = cls.objects.first()
             if not obj:
                 obj = cls.objects.create(
@@ -251,8 +256,13 @@ class SiteSettings(models.Model):
                     working_hours='Пн-Пт: 9:00-18:00, Сб: 10:00-16:00',
                     color_scheme='wood',
                 )
-            cache.set(cache_key, obj, 600)
-        return obj
+            return obj
+
+        return CacheEntry(settings_cache, 'site_settings', load, 600)
+
+    @classmethod
+    def load(cls):
+        return cls.cache_entry().get()
 
     def get_visible_social_links(self):
         social_links = []
@@ -324,25 +334,15 @@ class SiteSettings(models.Model):
         return schemes.get(scheme_name, schemes['wood'])
 
     def clear_cache(self):
-        cache.delete('site_settings')
-        cache.delete('active_promotions')
-        cache.delete('header_pages')
-        cache.delete('visible_social_links')
+        bump_for_model(SiteSettings)
 
 
+# Кэш сбрасывается увеличением версий cache_namespaces модели (services.cache)
 @receiver(post_save, sender=SiteSettings)
 def clear_site_settings_cache(sender, instance, **kwargs):
-    cache_keys = ['site_settings', 'active_promotions', 'header_pages', 'visible_social_links']
-    for key in cache_keys:
-        cache.delete(key)
     logger.info(f"Кэш настроек сайта очищен: {instance}")
 
 
-@receiver([post_save, post_delete], sender=Promotion)
-def clear_promotions_cache(sender, **kwargs):
-    cache.delete('active_promotions')
-
-
 class NewsletterSubscriber(models.Model):
     email = models.EmailField(unique=True, verbose_name="Email")
     created_at = models.DateTimeField(auto_now_add=True, editable=False, verbose_name="Дата подписки")
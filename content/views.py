@@ -6,10 +6,12 @@ from django.conf import settings
 from django.core.cache import cache
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
+from django.utils.decorators import method_decorator
 from django.views.generic import ListView
 from django.utils.http import url_has_allowed_host_and_scheme
 from .models import NewsletterSubscriber, SiteSettings, StockNotification, Promotion
 from mybiz_core.models import Product
+from services.page_cache import cache_page_for_anonymous
 from services.product_services import PromotionService
 import logging
 
@@ -127,6 +129,7 @@ def stock_notify(request, product_id):
     return redirect(get_safe_redirect_url(request))
 
 
+@method_decorator(cache_page_for_anonymous(tags=('promotions',)), name='dispatch')
 class PromotionListView(ListView):
     model = Promotion
     template_name = 'promotions/promotion_list.html'
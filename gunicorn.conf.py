@@ -1,5 +1,8 @@
 # Gunicorn configuration file
 import multiprocessing
+import os
+import subprocess
+import sys
 
 # Server socket
 bind = "0.0.0.0:8000"
@@ -35,3 +38,14 @@ def on_starting(server):
 
 def on_reload(server):
     print("Reloading MyBiz server")
+
+def when_ready(server):
+    # Прогрев кэша после деплоя - отдельным процессом, воркеры сразу принимают запросы
+    if os.getenv('WARM_CACHE_ON_START', '').lower() in ('1', 'true', 'yes'):
+        manage = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'manage.py')
+        subprocess.Popen([sys.executable, manage, 'warm_cache'])
+
+def post_worker_init(worker):
+    # Подписка воркера на шину инвалидации локальных кэшей до первого запроса
+    from services.invalidation import get_bus
+    get_bus().ensure_started()
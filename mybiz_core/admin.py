@@ -4,8 +4,8 @@ from django.db.models import Count, Q, F
 from django.utils.html import format_html
 from django import forms
 from django_ckeditor_5.widgets import CKEditor5Widget
-from django.core.cache import cache
-from .models import Category, Product
+from .models import Category, CategoryStats, Product
+from services import page_cache
 
 # --- Скрываем встроенные модели User и Group ---
 from django.contrib.auth.models import User, Group
@@ -45,7 +45,7 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'parent', 'created_at']
     search_fields = ['name', 'description', 'slug']
     search_help_text = 'Поиск по названию, описанию или slug категории'
-    list_select_related = ['parent']
+    list_select_related = ['parent', 'stats']
     prepopulated_fields = {'slug': ('name',)}
     ordering = ['name']
     list_per_page = 25
@@ -73,15 +73,10 @@ class CategoryAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
     def products_count(self, obj):
-        """Количество товаров в категории"""
-        cache_key = f'category_{obj.pk}_products_count'
-        count = cache.get(cache_key)
-        if count is None:
-            count = obj.products_count
-            cache.set(cache_key, count, 300)
-        return count
+        """Количество товаров в категории (с подкатегориями, из CategoryStats)"""
+        return obj.products_count
     products_count.short_description = 'Товаров'
-    products_count.admin_order_field = 'products_count'
+    products_count.admin_order_field = 'stats__subtree_active'
 
 
 @admin.register(Product)
@@ -211,9 +206,22 @@ class ProductAdmin(admin.ModelAdmin):
     stock_status.short_description = 'Статус'
 
     # Массовые действия
+    def _bulk_update(self, queryset, **values):
+        """
+        queryset.update() с пересчётом счётчиков затронутых категорий и
+        сбросом их страниц в полностраничном кэше (сигналы не вызываются)
+        """
+        rows = list(queryset.values_list('pk', 'category_id'))
+        category_ids = {category_id for _, category_id in rows}
+        queryset.update(**values)
+        CategoryStats.recalculate(category_ids)
+        page_cache.purge_products(
+            [pk for pk, _ in rows], category_ids, counts_changed='is_active' in values
+        )
+
     def make_featured(self, request, queryset):
         """Отметить как популярные"""
-        queryset.update(is_featured=True)
+        self._bulk_update(queryset, is_featured=True)
         self.message_user(
             request,
             f'{queryset.count()} товаров отмечены как популярные',
@@ -223,7 +231,7 @@ class ProductAdmin(admin.ModelAdmin):
 
     def make_not_featured(self, request, queryset):
         """Убрать из популярных"""
-        queryset.update(is_featured=False)
+        self._bulk_update(queryset, is_featured=False)
         self.message_user(
             request,
             f'{queryset.count()} товаров убраны из популярных',
@@ -233,7 +241,7 @@ class ProductAdmin(admin.ModelAdmin):
 
     def activate_products(self, request, queryset):
         """Активировать товары"""
-        queryset.update(is_active=True)
+        self._bulk_update(queryset, is_active=True)
         self.message_user(
             request,
             f'{queryset.count()} товаров активированы',
@@ -243,7 +251,7 @@ class ProductAdmin(admin.ModelAdmin):
 
     def deactivate_products(self, request, queryset):
         """Деактивировать товары"""
-        queryset.update(is_active=False)
+        self._bulk_update(queryset, is_active=False)
         self.message_user(
             request,
             f'{queryset.count()} товаров деактивированы',
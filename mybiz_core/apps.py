@@ -5,3 +5,7 @@ class MybizCoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mybiz_core'
     verbose_name = 'Товары и категории'
+
+    def ready(self):
+        # Сигналы полностраничного кэша витрины
+        from services import page_cache  # noqa: F401
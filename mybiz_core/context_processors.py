@@ -2,25 +2,34 @@
 """
 Контекст-процессоры для mybiz_core приложения
 """
-from django.core.cache import cache
 from .models import Category, Product
 from pages.models import Page
+from services.cache import VersionedCache
+from services.context_cache import context_value, lazy_context_value
+from services.product_services import CategoryService
+
+# Статистика админки выводится из каталога и страниц
+admin_stats_cache = VersionedCache('catalog', 'pages')
 
 
 def categories(request):
     """
     Добавляет все активные категории в контекст
     Доступно на всём сайте
-    """
-    cache_key = 'all_active_categories'
-    categories_list = cache.get(cache_key)
-
-    if categories_list is None:
-        categories_list = list(Category.objects.filter(is_active=True).order_by('name'))
-        cache.set(cache_key, categories_list, 300)
 
+    Счётчики товаров (cat.products_count) уже посчитаны одним запросом,
+    category_tree - корневые категории с вложенными tree_children.
+    Значения ленивые: категории загружаются, только если шаблон их выводит.
+    """
+    if request.path.startswith('/admin/'):
+        load = CategoryService.get_categories_with_counts
+    else:
+        load = lambda: context_value(request, 'categories_with_counts')
     return {
-        'categories': categories_list,
+        'categories': lazy_context_value(request, 'categories', load),
+        'category_tree': lazy_context_value(
+            request, 'category_tree', lambda: CategoryService.get_category_tree(load())
+        ),
     }
 
 
@@ -32,10 +41,8 @@ def admin_dashboard_stats(request):
     if not request.path.startswith('/admin/'):
         return {}
 
-    stats = cache.get('admin_dashboard_stats')
-
-    if not stats:
-        stats = {
+    def load():
+        return {
             'total_products': Product.objects.count(),
             'active_products': Product.objects.filter(is_active=True).count(),
             'inactive_products': Product.objects.filter(is_active=False).count(),
@@ -44,10 +51,8 @@ def admin_dashboard_stats(request):
             'total_pages': Page.objects.filter(is_active=True).count(),  # ← добавлено
         }
 
-        # Кэширование на 5 минут
-        cache.set('admin_dashboard_stats', stats, 300)
-
-    return stats
+    # Кэширование на 5 минут
+    return admin_stats_cache.get_or_set('admin_dashboard_stats', load, 300)
 
 
 def admin_user_info(request):
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from services import instrumented_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает метрики кэша по группам ключей: попадания, промахи, объём и задержку'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить метрики после вывода')
+
+    def handle(self, *args, **options):
+        metrics = instrumented_cache.get_metrics()
+        self.stdout.write('📊 Метрики кэша по группам ключей')
+        if not metrics:
+            self.stdout.write('  Нет данных: включите InstrumentedCache (VERSIONED_CACHE_ALIAS)')
+        for group, stats in metrics.items():
+            hit_ratio = '—' if stats['hit_ratio'] is None else f"{stats['hit_ratio']:.1%}"
+            self.stdout.write(
+                f"  {group}: попаданий {stats['hits']}, промахов {stats['misses']} ({hit_ratio}), "
+                f"записей {stats['sets']}, удалений {stats['deletes']}, "
+                f"в среднем {stats['avg_bytes']} байт, {stats['avg_ms']:.2f} мс (макс. {stats['max_ms']:.2f} мс)"
+            )
+        if options['reset']:
+            instrumented_cache.reset_metrics()
+            self.stdout.write(self.style.SUCCESS('✅ Метрики обнулены'))
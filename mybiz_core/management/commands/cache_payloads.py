@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from services import cache_records
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает размер и время распаковки значений кэша: компактные записи и экземпляры моделей'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'📦 Значения кэша (формат записей r{cache_records.SCHEMA_VERSION})')
+        for name, row in cache_records.payload_report().items():
+            records_size, records_time = row['records']
+            models_size, models_time = row['models']
+            saved = 1 - records_size / models_size if models_size else 0.0
+            self.stdout.write(
+                f"  {name} ({row['count']} шт.): {records_size} байт, {records_time:.0f} мкс "
+                f"вместо {models_size} байт, {models_time:.0f} мкс"
+            )
+            self.stdout.write(self.style.SUCCESS(f'    экономия памяти: {saved:.0%}'))
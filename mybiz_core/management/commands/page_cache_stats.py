@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from services import page_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает статистику полностраничного кэша: попадания, промахи и сбросы по тегам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = page_cache.get_stats()
+        self.stdout.write('📄 Полностраничный кэш')
+        self.stdout.write(f"  Попаданий:      {stats['hits']}")
+        self.stdout.write(f"  Промахов:       {stats['misses']}")
+        self.stdout.write(f"  Устаревших:     {stats['stale']}")
+        self.stdout.write(f"  Без кэша:       {stats['bypass']}")
+        self.stdout.write(f"  Сохранено:      {stats['stores']}")
+        self.stdout.write(self.style.SUCCESS(f"  Доля попаданий: {stats['hit_ratio']:.1%}"))
+        self.stdout.write('🧹 Сбросы по тегам')
+        for kind, count in stats['purges'].items():
+            self.stdout.write(f'  {kind}: {count}')
+        if options['reset']:
+            page_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('✅ Счётчики обнулены'))
@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+from services.search_services import ProductSearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает полнотекстовый индекс товаров'
+
+    def handle(self, *args, **options):
+        self.stdout.write('🔎 Перестраиваем поисковый индекс товаров...')
+        started = time.monotonic()
+        count = ProductSearchIndex.rebuild()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'✅ Проиндексировано товаров: {count} за {elapsed:.2f} с'))
@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+from mybiz_core.models import CategoryStats
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересчитывает счётчики товаров категорий (CategoryStats)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('📊 Пересчитываем счётчики товаров по категориям...')
+        started = time.monotonic()
+        count = CategoryStats.rebuild()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'✅ Обновлено категорий: {count} за {elapsed:.2f} с'))
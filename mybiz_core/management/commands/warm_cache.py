@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from services import warmup
+
+
+class Command(BaseCommand):
+    help = 'Прогревает кэш после деплоя: данные витрины, миниатюры и популярные страницы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stage', action='append', choices=[name for name, _ in warmup.STAGES], dest='stages',
+            help='Выполнить только указанный этап (можно несколько раз)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=warmup.WORKERS, help='Размер пула потоков',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('🔥 Прогреваем кэш...')
+        results = warmup.warm(options['stages'], options['workers'], on_stage=self.report)
+        total = sum(result.seconds for result in results)
+        failed = sum(result.failed for result in results)
+        if failed:
+            self.stdout.write(self.style.WARNING(f'⚠️ Готово за {total:.2f} с, ошибок: {failed}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ Готово за {total:.2f} с'))
+
+    def report(self, result):
+        line = f'  {result.name}: {result.done} задач за {result.seconds:.2f} с'
+        if result.failed:
+            line += f', ошибок {result.failed}'
+        self.stdout.write(line)
@@ -0,0 +1,100 @@
+# mybiz_core/middleware.py
+"""
+Middleware проекта MyBiz
+"""
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import caches
+
+from services import invalidation
+from services.cache import get_cache_alias
+from services.context_cache import record_usage
+from services.request_memo import request_scope
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMemoMiddleware:
+    """
+    Открывает область мемоизации запроса (services.request_memo).
+
+    Настройки сайта, акции, категории и версии кэша читаются из кэша не более
+    одного раза за запрос, откуда бы их ни запрашивали. Поддерживает
+    синхронный и асинхронный режим.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with request_scope():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_scope():
+            return await self.get_response(request)
+
+
+class CacheVersionSyncMiddleware:
+    """
+    Поддерживает локальные кэши процесса в актуальном состоянии.
+
+    Запускает подписку процесса на шину инвалидации. Пока подписка на другие
+    процессы не активна, сверяет версии двухуровневого кэша
+    (services.two_tier_cache.TwoTierCache) одним get_many к Redis за запрос;
+    когда активна - изменения приходят через шину и Redis не опрашивается.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        bus = invalidation.get_bus()
+        bus.ensure_started()
+        cache = caches[get_cache_alias()]
+        if hasattr(cache, 'sync_versions') and not bus.is_listening:
+            cache.sync_versions()
+        return self.get_response(request)
+
+
+class ContextCacheStatsMiddleware:
+    """
+    Отладочная статистика контекст-процессоров (services.context_cache).
+
+    Заголовок X-Context-Cache - число ключей общей выборки кэша, промахов,
+    обращений к кэшу и сэкономленных обращений. Заголовок X-Context-Usage -
+    какие ленивые переменные глобального контекста шаблон использовал, а какие
+    нет; то же копится в отчёте get_usage_report() по view. Для разработки.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        stats = getattr(request, 'context_cache_stats', None)
+        if stats:
+            saved = stats['sequential_round_trips'] - stats['round_trips']
+            response['X-Context-Cache'] = (
+                f"keys={stats['keys']}; misses={stats['misses']}; "
+                f"round-trips={stats['round_trips']}; saved={saved}"
+            )
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        used, unused = record_usage(request, view_name)
+        if used or unused:
+            response['X-Context-Usage'] = (
+                f"used={','.join(sorted(used))}; unused={','.join(sorted(unused))}"
+            )
+            if unused:
+                logger.debug(f"{view_name}: не использованы переменные контекста {', '.join(sorted(unused))}")
+        return response
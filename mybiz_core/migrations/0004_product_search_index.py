@@ -0,0 +1,62 @@
+# Полнотекстовый индекс товаров: tsvector + GIN в PostgreSQL, FTS5 в SQLite
+
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    'ALTER TABLE mybiz_core_product ADD COLUMN search_vector tsvector',
+    'CREATE INDEX mybiz_core_product_search_gin ON mybiz_core_product USING gin (search_vector)',
+    """
+    UPDATE mybiz_core_product SET search_vector =
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(sku, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(short_description, '')), 'B') ||
+        setweight(to_tsvector('russian', regexp_replace(coalesce(description, ''), '<[^>]+>', ' ', 'g')), 'C')
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS mybiz_core_product_search_gin',
+    'ALTER TABLE mybiz_core_product DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE mybiz_core_product_fts USING fts5(
+        name, sku, short_description, description,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO mybiz_core_product_fts (rowid, name, sku, short_description, description)
+    SELECT id, name, sku, short_description, description FROM mybiz_core_product
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TABLE IF EXISTS mybiz_core_product_fts',
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mybiz_core', '0003_alter_category_options_alter_product_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,106 @@
+# Индекс теперь хранит основы слов (стемминг Snowball), поэтому его нужно перестроить.
+# Анализатор текста заморожен здесь, а не импортируется из services.search_services:
+# миграция должна индексировать так же, как в момент её создания.
+
+import re
+
+from django.db import migrations
+from django.utils.html import strip_tags
+from nltk.stem.snowball import SnowballStemmer
+
+
+PRODUCT_TABLE = 'mybiz_core_product'
+FTS_TABLE = 'mybiz_core_product_fts'
+
+# Индексируемые поля и их веса (A - самый значимый)
+INDEXED_FIELDS = (
+    ('name', 'A'),
+    ('sku', 'A'),
+    ('short_description', 'B'),
+    ('description', 'C'),
+)
+
+# Поля, которые индексируются без стемминга и удаления стоп-слов
+RAW_FIELDS = {'sku'}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+LATIN_RE = re.compile(r'^[a-z]+$')
+
+# Стоп-слова русского языка (список nltk.corpus.stopwords, корпус nltk не требуется)
+RUSSIAN_STOP_WORDS = frozenset("""
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по
+    только ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если
+    уже или ни быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей
+    может они тут где есть надо ней для мы тебя их чем была сам чтоб без будто чего раз
+    тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом
+    один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец
+    два об другой хоть после над больше тот через эти нас про всего них какая много
+    разве три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой
+    им более всегда конечно всю между
+""".split())
+
+ENGLISH_STOP_WORDS = frozenset("""
+    a an and are as at be by for from in is it of on or the to with
+""".split())
+
+
+class Analyzer:
+    """Токенизация, стоп-слова и стемминг Snowball (русский, для латиницы - английский)"""
+
+    def __init__(self):
+        self._russian = SnowballStemmer('russian')
+        self._english = SnowballStemmer('english')
+
+    def stem(self, token):
+        if LATIN_RE.match(token):
+            return self._english.stem(token)
+        return self._russian.stem(token)
+
+    def analyze_field(self, field, text):
+        tokens = TOKEN_RE.findall((text or '').lower())
+        if field in RAW_FIELDS:
+            return ' '.join(tokens)
+        return ' '.join(
+            self.stem(token) for token in tokens
+            if token not in RUSSIAN_STOP_WORDS and token not in ENGLISH_STOP_WORDS
+        )
+
+
+def rebuild_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    Product = apps.get_model('mybiz_core', 'Product')
+    analyzer = Analyzer()
+    fields = [field for field, _ in INDEXED_FIELDS]
+    rows = Product.objects.using(connection.alias).values_list('pk', *fields)
+    vector_sql = ' || '.join(
+        f"setweight(to_tsvector('simple', %s), '{weight}')" for _, weight in INDEXED_FIELDS
+    )
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        for pk, *values in rows.iterator(chunk_size=500):
+            document = dict(zip(fields, values))
+            document['description'] = strip_tags(document['description'] or '')
+            params = [analyzer.analyze_field(field, document[field]) for field in fields]
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'UPDATE {PRODUCT_TABLE} SET search_vector = {vector_sql} WHERE id = %s',
+                               params + [pk])
+            else:
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, name, sku, short_description, description) '
+                    f'VALUES (%s, %s, %s, %s, %s)',
+                    [pk] + params
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mybiz_core', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
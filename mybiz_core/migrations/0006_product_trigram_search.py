@@ -0,0 +1,45 @@
+# Generated by Django 5.2.13 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+# Триграммные индексы нужны только PostgreSQL; в SQLite используется индекс в памяти процесса
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX mybiz_core_product_name_trgm ON mybiz_core_product USING gin (name gin_trgm_ops)',
+    'CREATE INDEX mybiz_core_product_brand_trgm ON mybiz_core_product USING gin (brand gin_trgm_ops)',
+    'CREATE INDEX mybiz_core_product_sku_trgm ON mybiz_core_product USING gin (sku gin_trgm_ops)',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS mybiz_core_product_name_trgm',
+    'DROP INDEX IF EXISTS mybiz_core_product_brand_trgm',
+    'DROP INDEX IF EXISTS mybiz_core_product_sku_trgm',
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_FORWARD:
+            schema_editor.execute(statement)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mybiz_core', '0005_rebuild_search_index_with_stemming'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sku'], name='product_sku_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
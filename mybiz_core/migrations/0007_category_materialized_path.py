@@ -0,0 +1,43 @@
+# Generated by Django 5.2.13 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+def populate_category_paths(apps, schema_editor):
+    """Заполняет материализованные пути обходом дерева от корней"""
+    Category = apps.get_model('mybiz_core', 'Category')
+    children = {}
+    for pk, parent_id in Category.objects.values_list('pk', 'parent_id'):
+        children.setdefault(parent_id, []).append(pk)
+
+    stack = [(pk, '/', 0) for pk in children.get(None, [])]
+    while stack:
+        pk, parent_path, depth = stack.pop()
+        path = f'{parent_path}{pk}/'
+        Category.objects.filter(pk=pk).update(path=path, depth=depth)
+        stack.extend((child, path, depth + 1) for child in children.get(pk, []))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mybiz_core', '0006_product_trigram_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень вложенности'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Путь в дереве'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(populate_category_paths, migrations.RunPython.noop),
+    ]
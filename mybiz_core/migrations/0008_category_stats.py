@@ -0,0 +1,67 @@
+# Generated by Django 5.2.13 on 2026-10-18 13:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+COUNTERS = {
+    'active': Q(is_active=True),
+    'in_stock': Q(is_active=True, in_stock=True, stock__gt=0),
+    'discounted': Q(is_active=True, discount_price__isnull=False),
+    'featured': Q(is_active=True, is_featured=True),
+}
+
+
+def populate_category_stats(apps, schema_editor):
+    """Начальное заполнение счётчиков: прямые - GROUP BY, по поддереву - суммированием по путям"""
+    Category = apps.get_model('mybiz_core', 'Category')
+    Product = apps.get_model('mybiz_core', 'Product')
+    CategoryStats = apps.get_model('mybiz_core', 'CategoryStats')
+
+    rows = (
+        Product.objects.order_by().values('category_id')
+        .annotate(**{name: Count('pk', filter=condition) for name, condition in COUNTERS.items()})
+    )
+    direct = {row['category_id']: row for row in rows}
+    paths = dict(Category.objects.values_list('pk', 'path'))
+
+    stats = {pk: CategoryStats(category_id=pk) for pk in paths}
+    for pk, path in paths.items():
+        counts = direct.get(pk, {})
+        for name in COUNTERS:
+            value = counts.get(name, 0)
+            setattr(stats[pk], f'direct_{name}', value)
+            for ancestor in path.split('/'):
+                if ancestor and int(ancestor) in stats:
+                    item = stats[int(ancestor)]
+                    setattr(item, f'subtree_{name}', getattr(item, f'subtree_{name}') + value)
+    CategoryStats.objects.bulk_create(stats.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mybiz_core', '0007_category_materialized_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='mybiz_core.category', verbose_name='Категория')),
+                ('direct_active', models.IntegerField(default=0, verbose_name='Активных товаров')),
+                ('direct_in_stock', models.IntegerField(default=0, verbose_name='В наличии')),
+                ('direct_discounted', models.IntegerField(default=0, verbose_name='Со скидкой')),
+                ('direct_featured', models.IntegerField(default=0, verbose_name='Рекомендуемых')),
+                ('subtree_active', models.IntegerField(default=0, verbose_name='Активных товаров с подкатегориями')),
+                ('subtree_in_stock', models.IntegerField(default=0, verbose_name='В наличии с подкатегориями')),
+                ('subtree_discounted', models.IntegerField(default=0, verbose_name='Со скидкой с подкатегориями')),
+                ('subtree_featured', models.IntegerField(default=0, verbose_name='Рекомендуемых с подкатегориями')),
+            ],
+            options={
+                'verbose_name': 'статистика категории',
+                'verbose_name_plural': 'Статистика категорий',
+            },
+        ),
+        migrations.RunPython(populate_category_stats, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,16 @@
 # mybiz_core/models.py
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 from django.utils.text import slugify
 from django_ckeditor_5.fields import CKEditor5Field
 from .validators import validate_image_extension, validate_image_size, validate_image_dimensions
-from django.db.models.signals import post_save, post_delete
-from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from django.db.models import Q, Count
+from django.db.models import Q, Count, F, Value
+from django.db.models.functions import Concat, Substr
+from django.core.exceptions import ValidationError
+from services.cache import VersionedQuerySet, catalog_cache
+from services.search_services import ProductSearchIndex
 
 
 class Category(models.Model):
@@ -33,13 +36,22 @@ class Category(models.Model):
     meta_description = models.TextField(blank=True, verbose_name="Мета-описание")
     meta_keywords = models.TextField(blank=True, verbose_name="Мета-ключевые слова")
     is_active = models.BooleanField(default=True, verbose_name="Активна")
+    # Материализованный путь от корня: '/1/5/12/' - поддерево выбирается одним запросом по префиксу
+    path = models.CharField(max_length=255, blank=True, default='', editable=False, verbose_name="Путь в дереве")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Уровень вложенности")
     created_at = models.DateTimeField(auto_now_add=True, editable=False, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, editable=False, verbose_name="Дата обновления")
 
+    objects = VersionedQuerySet.as_manager()
+    cache_namespaces = ('catalog',)
+
     class Meta:
         verbose_name = "категория"
         verbose_name_plural = "Категории"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['path'], name='category_path_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.name
@@ -56,35 +68,115 @@ class Category(models.Model):
                 slug = f'{base_slug}-{counter}'
                 counter += 1
             self.slug = slug
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            # Путь в БД мог измениться при переносе предка - берём актуальный под блокировкой строки
+            old_path = None
+            if self.pk:
+                old_path = Category.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'path', flat=True
+                ).first()
+            parent_path = ''
+            if self.parent_id:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+                if self.pk and f'/{self.pk}/' in parent_path:
+                    raise ValueError('Категорию нельзя перенести внутрь её собственного поддерева')
+
+            super().save(*args, **kwargs)
+            if old_path == '' or (self.parent_id and not parent_path):
+                # Строки загружены без путей (loaddata): по пустому префиксу выбралось бы всё дерево
+                Category.rebuild_paths()
+                CategoryStats.rebuild()
+                self.path, self.depth = Category.objects.filter(pk=self.pk).values_list('path', 'depth').get()
+            else:
+                self._update_path(old_path or '', parent_path)
+
+    def _update_path(self, old_path, parent_path):
+        """Пересчитывает путь категории и, при переносе, пути всего её поддерева"""
+        new_path = f'{parent_path or "/"}{self.pk}/'
+        new_depth = new_path.count('/') - 2
+        if new_path == old_path:
+            self.path, self.depth = new_path, new_depth
+            return
+
+        Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        if old_path:
+            # Перенос поддерева: один UPDATE по индексу пути, заменяющий префикс
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1), output_field=models.CharField()),
+                depth=F('depth') + (new_depth - (old_path.count('/') - 2)),
+            )
+            CategoryStats.move_subtree(self.pk, old_path, new_path)
+        self.path, self.depth = new_path, new_depth
+
+    @classmethod
+    def rebuild_paths(cls):
+        """
+        Заполняет пути всех категорий обходом дерева от корней, возвращает их число.
+
+        Версию кэша каталога увеличивает вызывающий (save() - своим сигналом).
+        """
+        children = {}
+        for pk, parent_id in cls.objects.values_list('pk', 'parent_id'):
+            children.setdefault(parent_id, []).append(pk)
+
+        count = 0
+        with transaction.atomic():
+            stack = [(pk, '/', 0) for pk in children.get(None, [])]
+            while stack:
+                pk, parent_path, depth = stack.pop()
+                path = f'{parent_path}{pk}/'
+                # Базовый менеджер не увеличивает версию кэша на каждую строку
+                cls._base_manager.filter(pk=pk).update(path=path, depth=depth)
+                stack.extend((child, path, depth + 1) for child in children.get(pk, []))
+                count += 1
+        return count
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+            if f'/{self.pk}/' in parent_path:
+                raise ValidationError({'parent': 'Категорию нельзя вложить в саму себя или в её подкатегорию'})
 
     def get_absolute_url(self):
         return reverse('mybiz_core:product_list_by_category', kwargs={'category_slug': self.slug})
 
+    def get_descendants(self, include_self=False):
+        """QuerySet поддерева категории (один запрос по префиксу пути)"""
+        if not self.path:
+            # Путь не заполнен: пустой префикс выбрал бы все категории
+            return Category.objects.filter(pk=self.pk) if include_self else Category.objects.none()
+        descendants = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
     def get_descendants_ids(self):
-        """Возвращает список ID всех дочерних категорий (рекурсивно)"""
-        ids = []
-        for child in self.children.all():
-            ids.append(child.pk)
-            ids.extend(child.get_descendants_ids())
-        return ids   # ← больше нет return внутри цикла
+        """Возвращает список ID всех дочерних категорий (на любой глубине)"""
+        return list(self.get_descendants().values_list('pk', flat=True))
+
+    def get_ancestors(self):
+        """Предки категории от корня к непосредственному родителю"""
+        ancestor_ids = [int(part) for part in self.path.split('/') if part][:-1]
+        return Category.objects.filter(pk__in=ancestor_ids).order_by('depth')
+
+    def get_breadcrumbs(self):
+        """Цепочка категорий от корня до текущей включительно"""
+        return [*self.get_ancestors(), self]
 
     @property
     def products_count(self):
-        cache_key = f'category_{self.pk}_products_count'
-        count = cache.get(cache_key)
-        if count is None:
-            category_ids = [self.pk]
-            category_ids.extend(self.get_descendants_ids())
-            count = Product.objects.filter(
-                category_id__in=category_ids,
-                is_active=True
-            ).count()
-            cache.set(cache_key, count, 300)
-        return count
+        """Активные товары категории и всех подкатегорий (из таблицы CategoryStats)"""
+        try:
+            return self.stats.subtree_active
+        except CategoryStats.DoesNotExist:
+            if not self.path:
+                return Product.objects.filter(category=self, is_active=True).count()
+            return Product.objects.filter(category__path__startswith=self.path, is_active=True).count()
 
     def clear_cache(self):
-        cache.delete('categories')
+        catalog_cache.bump()
 
 
 class Product(models.Model):
@@ -126,6 +218,9 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False, verbose_name="Дата создания", db_index=True)
     updated_at = models.DateTimeField(auto_now=True, editable=False, verbose_name="Дата обновления")
 
+    objects = VersionedQuerySet.as_manager()
+    cache_namespaces = ('catalog',)
+
     class Meta:
         verbose_name = "товар"
         verbose_name_plural = "Товары"
@@ -134,6 +229,8 @@ class Product(models.Model):
             models.Index(fields=['category', 'is_active']),
             models.Index(fields=['price']),
             models.Index(fields=['created_at']),
+            # Поиск по префиксу артикула (LIKE 'ABC%'); opclasses учитываются только в PostgreSQL
+            models.Index(fields=['sku'], name='product_sku_prefix_idx', opclasses=['varchar_pattern_ops']),
         ]
 
     def __str__(self):
@@ -152,18 +249,238 @@ class Product(models.Model):
     def display_price(self):
         return self.discount_price if self.discount_price else self.price
 
+    def save(self, *args, **kwargs):
+        # Прежнее состояние строки читается под блокировкой в pre_save, дельты
+        # CategoryStats применяются в post_save - всё в одной транзакции с записью
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    save.alters_data = True
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+    delete.alters_data = True
+
+    def get_stats_state(self):
+        """(category_id, вклад в счётчики) - неактивный товар ни во что не входит"""
+        if not self.is_active:
+            return self.category_id, {}
+        return self.category_id, {
+            'active': 1,
+            'in_stock': int(bool(self.in_stock and self.stock > 0)),
+            'discounted': int(self.discount_price is not None),
+            'featured': int(bool(self.is_featured)),
+        }
+
+
+# Поля товара, от которых зависят счётчики CategoryStats
+STATS_PRODUCT_FIELDS = ('category_id', 'is_active', 'in_stock', 'stock', 'discount_price', 'is_featured')
+STATS_COUNTERS = ('active', 'in_stock', 'discounted', 'featured')
+
+
+def _stats_aggregates():
+    """Условные COUNT для счётчиков CategoryStats по queryset товаров"""
+    active = Q(is_active=True)
+    return {
+        'active': Count('pk', filter=active),
+        'in_stock': Count('pk', filter=active & Q(in_stock=True, stock__gt=0)),
+        'discounted': Count('pk', filter=active & Q(discount_price__isnull=False)),
+        'featured': Count('pk', filter=active & Q(is_featured=True)),
+    }
+
+
+class CategoryStats(models.Model):
+    """
+    Денормализованные счётчики товаров категории.
+
+    direct_* - товары, привязанные к самой категории, subtree_* - вместе со
+    всеми подкатегориями. Поддерживаются дельтами при сохранении и удалении
+    товаров и переносе категорий; полная сверка - команда reconcile_category_stats.
+    """
+    category = models.OneToOneField(
+        Category,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name="Категория"
+    )
+    direct_active = models.IntegerField(default=0, verbose_name="Активных товаров")
+    direct_in_stock = models.IntegerField(default=0, verbose_name="В наличии")
+    direct_discounted = models.IntegerField(default=0, verbose_name="Со скидкой")
+    direct_featured = models.IntegerField(default=0, verbose_name="Рекомендуемых")
+    subtree_active = models.IntegerField(default=0, verbose_name="Активных товаров с подкатегориями")
+    subtree_in_stock = models.IntegerField(default=0, verbose_name="В наличии с подкатегориями")
+    subtree_discounted = models.IntegerField(default=0, verbose_name="Со скидкой с подкатегориями")
+    subtree_featured = models.IntegerField(default=0, verbose_name="Рекомендуемых с подкатегориями")
+
+    objects = VersionedQuerySet.as_manager()
+    cache_namespaces = ('catalog',)
+
+    class Meta:
+        verbose_name = "статистика категории"
+        verbose_name_plural = "Статистика категорий"
+
+    def __str__(self):
+        return f'{self.category}: {self.subtree_active}'
+
+    @staticmethod
+    def _path_ids(path):
+        return [int(part) for part in path.split('/') if part]
+
+    @classmethod
+    def apply_delta(cls, category_id, delta):
+        """Прибавляет delta ({счётчик: изменение}) к категории и всем её предкам"""
+        delta = {counter: value for counter, value in delta.items() if value}
+        if not delta or category_id is None:
+            return
+        path = Category.objects.filter(pk=category_id).values_list('path', flat=True).first()
+        if not path:
+            return
+        cls.objects.filter(category_id=category_id).update(**{
+            f'direct_{counter}': F(f'direct_{counter}') + value for counter, value in delta.items()
+        })
+        cls.objects.filter(category_id__in=cls._path_ids(path)).update(**{
+            f'subtree_{counter}': F(f'subtree_{counter}') + value for counter, value in delta.items()
+        })
+
+    @classmethod
+    def apply_product_change(cls, old_state, new_state):
+        """Переносит вклад товара из old_state в new_state (см. Product.get_stats_state)"""
+        old_category, old_flags = old_state or (None, {})
+        new_category, new_flags = new_state or (None, {})
+        if old_category == new_category:
+            cls.apply_delta(new_category, {
+                counter: new_flags.get(counter, 0) - old_flags.get(counter, 0) for counter in STATS_COUNTERS
+            })
+            return
+        cls.apply_delta(old_category, {counter: -value for counter, value in old_flags.items()})
+        cls.apply_delta(new_category, new_flags)
+
+    @classmethod
+    def move_subtree(cls, category_id, old_path, new_path):
+        """Переносит subtree-счётчики перемещённой категории от старых предков к новым"""
+        stats = cls.objects.filter(category_id=category_id).first()
+        if stats is None:
+            return
+        old_ancestors = set(cls._path_ids(old_path)) - {category_id}
+        new_ancestors = set(cls._path_ids(new_path)) - {category_id}
+        for ancestors, sign in ((old_ancestors - new_ancestors, -1), (new_ancestors - old_ancestors, 1)):
+            if ancestors:
+                cls.objects.filter(category_id__in=ancestors).update(**{
+                    f'subtree_{counter}': F(f'subtree_{counter}') + sign * getattr(stats, f'subtree_{counter}')
+                    for counter in STATS_COUNTERS
+                })
+
+    @classmethod
+    def recalculate(cls, category_ids):
+        """
+        Пересчитывает счётчики категорий category_ids и их предков с нуля.
+
+        Нужен после массовых queryset.update() (например, действий в админке),
+        которые не вызывают сигналов и не дают старых значений для дельт.
+        """
+        paths = list(Category.objects.filter(pk__in=category_ids).values_list('pk', 'path'))
+        rows = (
+            Product.objects.filter(category_id__in=[pk for pk, _ in paths])
+            .order_by().values('category_id').annotate(**_stats_aggregates())
+        )
+        direct = {row['category_id']: row for row in rows}
+        for pk, _ in paths:
+            counts = direct.get(pk, {})
+            cls.objects.update_or_create(category_id=pk, defaults={
+                f'direct_{counter}': counts.get(counter, 0) for counter in STATS_COUNTERS
+            })
+
+        ancestor_ids = {ancestor for _, path in paths for ancestor in cls._path_ids(path)}
+        if not ancestor_ids:
+            return
+        # Одним запросом - direct-счётчики всех поддеревьев, затронутых через корни путей
+        roots = {cls._path_ids(path)[0] for _, path in paths if path}
+        direct_fields = [f'direct_{counter}' for counter in STATS_COUNTERS]
+        totals = {pk: dict.fromkeys(STATS_COUNTERS, 0) for pk in ancestor_ids}
+        subtrees = Q()
+        for root in roots:
+            subtrees |= Q(category__path__startswith=f'/{root}/')
+        rows = cls.objects.filter(subtrees).values_list('category__path', *direct_fields)
+        for path, *direct in rows:
+            for ancestor in set(cls._path_ids(path)) & ancestor_ids:
+                for counter, value in zip(STATS_COUNTERS, direct):
+                    totals[ancestor][counter] += value
+
+        existing = {stats.category_id: stats for stats in cls.objects.filter(category_id__in=ancestor_ids)}
+        missing = []
+        for pk, counts in totals.items():
+            stats = existing.get(pk) or cls(category_id=pk)
+            for counter, value in counts.items():
+                setattr(stats, f'subtree_{counter}', value)
+            if pk not in existing:
+                missing.append(stats)
+        subtree_fields = [f'subtree_{counter}' for counter in STATS_COUNTERS]
+        if existing:
+            cls.objects.bulk_update(existing.values(), subtree_fields)
+        if missing:
+            cls.objects.bulk_create(missing)
+
+    @classmethod
+    def rebuild(cls):
+        """Полная сверка: пересчитывает счётчики всех категорий, возвращает их число"""
+        with transaction.atomic():
+            category_ids = list(Category.objects.values_list('pk', flat=True))
+            cls.objects.exclude(category_id__in=category_ids).delete()
+            cls.recalculate(category_ids)
+        return len(category_ids)
+
+
+# Кэш каталога сбрасывается увеличением версии пространства 'catalog' (services.cache)
+@receiver(post_save, sender=Category)
+def create_category_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CategoryStats.objects.get_or_create(category_id=instance.pk)
+
+
+def _locked_stats_state(pk):
+    """Состояние товара в БД под блокировкой строки до конца транзакции (None - строки нет)"""
+    row = Product.objects.select_for_update().filter(pk=pk).values(*STATS_PRODUCT_FIELDS).first()
+    return None if row is None else Product(**row).get_stats_state()
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_stats_state(sender, instance, raw=False, **kwargs):
+    # Дельта считается от строки в БД, а не от загруженного экземпляра: два
+    # устаревших экземпляра, сохранённые друг за другом, не учтут изменение дважды
+    if raw:
+        return
+    instance._stats_state = _locked_stats_state(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def update_category_stats(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = instance.get_stats_state()
+    old_state = None if created else getattr(instance, '_stats_state', None)
+    CategoryStats.apply_product_change(old_state, new_state)
+    instance._stats_state = new_state
+
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_product_stats_state(sender, instance, **kwargs):
+    instance._stats_state = _locked_stats_state(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_category_stats(sender, instance, **kwargs):
+    old_state = getattr(instance, '_stats_state', None)
+    if old_state is not None:
+        CategoryStats.apply_product_change(old_state, None)
+
 
-# Сигналы для очистки кэша
-@receiver([post_save, post_delete], sender=Category)
-def clear_categories_cache(sender, instance, **kwargs):
-    cache.delete('categories')
-    if instance and instance.pk:
-        cache.delete(f'category_{instance.pk}_products_count')
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ProductSearchIndex.index_product(instance)
 
 
-@receiver([post_save, post_delete], sender=Product)
-def clear_products_cache(sender, instance, **kwargs):
-    cache.delete('featured_products')
-    cache.delete('new_products')
-    if instance and instance.category_id:
-        cache.delete(f'category_{instance.category_id}_products_count')
+@receiver(post_delete, sender=Product)
+def remove_product_from_search_index(sender, instance, **kwargs):
+    ProductSearchIndex.remove_product(instance.pk)
@@ -0,0 +1,80 @@
+# mybiz_core/templatetags/fragment_cache.py
+"""
+Кэширование фрагментов шаблона по версиям пространств имён кэша.
+
+    {% load fragment_cache %}
+    {% versioned_cache "header_megamenu" "catalog" %}
+        ... меню категорий ...
+    {% endversioned_cache %}
+
+Готовый HTML фрагмента хранится в версионированном кэше (services.cache) под
+ключом, зависящим только от имени фрагмента и версий перечисленных
+пространств. Поэтому фрагмент общий для всех страниц, а запись в модель
+пространства (категории, страницы, настройки сайта) делает его устаревшим
+без явной очистки. Внутри фрагмента нельзя выводить то, что зависит от
+запроса (текущий путь, пользователь, CSRF-токен).
+
+Время жизни задаётся настройкой FRAGMENT_CACHE_TIMEOUT (сек).
+"""
+import logging
+
+from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from services.cache import VersionedCache
+
+logger = logging.getLogger(__name__)
+register = template.Library()
+
+
+def get_timeout():
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600)
+
+
+def fragment_key(name):
+    return f'fragment:{name}'
+
+
+class VersionedCacheNode(template.Node):
+    def __init__(self, nodelist, name, namespaces):
+        self.nodelist = nodelist
+        self.name = name
+        self.cache = VersionedCache(*namespaces)
+
+    def render(self, context):
+        def compute():
+            return str(self.nodelist.render(context))
+
+        try:
+            content = self.cache.get_or_set(fragment_key(self.name), compute, get_timeout())
+        except Exception as e:
+            logger.error(f"Ошибка кэша фрагмента {self.name}: {e}")
+            content = compute()
+        return mark_safe(content)
+
+
+@register.tag
+def versioned_cache(parser, token):
+    """
+    {% versioned_cache "имя" "пространство" ... %} ... {% endversioned_cache %}
+
+    Имя и пространства имён - строковые литералы.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' требует имя фрагмента и хотя бы одно пространство имён кэша"
+        )
+    args = []
+    for bit in bits[1:]:
+        if len(bit) < 2 or bit[0] != bit[-1] or bit[0] not in ('"', "'"):
+            raise template.TemplateSyntaxError(f"'{bits[0]}': аргументы должны быть строками в кавычках")
+        args.append(bit[1:-1])
+
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    try:
+        return VersionedCacheNode(nodelist, args[0], args[1:])
+    except ValueError as e:
+        raise template.TemplateSyntaxError(str(e))
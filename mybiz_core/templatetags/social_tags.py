@@ -8,10 +8,14 @@ import re
 import logging
 from defusedxml import ElementTree as ET
 
+from services import invalidation
+
 logger = logging.getLogger(__name__)
 register = template.Library()
 
 _svg_cache = {}
+# Иконки соцсетей меняются вместе с настройками сайта - сбрасываем во всех воркерах
+invalidation.register('social_svg', lambda namespaces: _svg_cache.clear(), ('settings',))
 
 SAFE_SVG_TAGS = {'svg', 'g', 'path', 'circle', 'rect', 'line', 'polyline', 'polygon', 'text', 'tspan', 'use', 'defs', 'linearGradient', 'radialGradient', 'stop', 'clipPath', 'mask', 'pattern', 'image'}
 
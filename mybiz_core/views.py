@@ -2,10 +2,22 @@
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
 from django.db.models import Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
 from .models import Category, Product
-from services.product_services import ProductService
+from services import page_cache
+from services.conditional import conditional_page, product_validators
+from services.page_cache import cache_page_for_anonymous
+from services.product_services import CategoryService, ProductService
+from services.search_services import SEARCH_MODES
+from services.facet_services import FacetService
+from services.pagination import KeysetPaginator, InvalidCursor
 
+PRODUCTS_PER_PAGE = 12
 
+
+@cache_page_for_anonymous(tags=('products', 'promotions'))
 def home(request):
     """Главная страница"""
     featured_products = ProductService.get_featured_products()
@@ -18,10 +30,13 @@ def home(request):
     return render(request, 'home.html', context)
 
 
-def product_list(request, category_slug=None):
-    """Список товаров с фильтрацией по категории (из URL или GET-параметра)"""
-    categories = Category.objects.filter(is_active=True).prefetch_related('children')
+def _get_filtered_products(request, category_slug=None):
+    """
+    Применяет к каталогу фильтры и поиск из GET-параметров.
 
+    Returns:
+        (products, params): QuerySet без сортировки и разобранные параметры
+    """
     # Поддержка выбора категории через GET-параметр 'category'
     if not category_slug:
         category_slug = request.GET.get('category')
@@ -35,32 +50,102 @@ def product_list(request, category_slug=None):
     filters['in_stock'] = request.GET.get('in_stock') == 'true'
     filters['is_new'] = request.GET.get('is_new') == 'true'
     filters['has_discount'] = request.GET.get('has_discount') == 'true'
+    filters['brand'] = request.GET.get('brand')
+
+    # По умолчанию при пустой полнотекстовой выдаче включается поиск с учётом опечаток
+    search_mode = request.GET.get('search_mode', 'auto')
+    if search_mode not in SEARCH_MODES:
+        search_mode = 'auto'
+    products = ProductService.search_products(search_query or '', filters, mode=search_mode)
+
+    params = {
+        'category_slug': category_slug,
+        'search_query': search_query,
+        # Результаты поиска по умолчанию упорядочены по релевантности
+        'sort_by': request.GET.get('sort', 'relevance' if search_query else 'newest'),
+        # Режим поиска влияет на выдачу только при непустом запросе
+        'facet_filters': dict(filters, q=search_query, search_mode=search_mode if search_query else None),
+    }
+    return products, params
+
 
-    products = ProductService.search_products(search_query or '', filters)
+@cache_page_for_anonymous
+def product_list(request, category_slug=None):
+    """Список товаров с фильтрацией по категории (из URL или GET-параметра)"""
+    categories = CategoryService.get_categories_with_counts()
 
-    sort_by = request.GET.get('sort', 'newest')
-    products = ProductService.sort_products(products, sort_by)
+    products, params = _get_filtered_products(request, category_slug)
+    category_slug = params['category_slug']
+    facets = FacetService.get_facets(products, params['facet_filters'], 'html')
+    products = ProductService.sort_products(products, params['sort_by'])
 
-    paginator = Paginator(products, 12)
+    # Порядок с pk вторым ключом совпадает с порядком догрузки по курсору
+    keyset = KeysetPaginator(products, page_size=PRODUCTS_PER_PAGE)
+    # Число страниц - по настоящему COUNT: фасеты из кэша могут не совпадать с выборкой
+    paginator = Paginator(keyset.queryset, PRODUCTS_PER_PAGE)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # Бесконечная прокрутка продолжает первую страницу по курсору
+    next_cursor = None
+    more_url = None
+    if page_obj.number == 1 and page_obj.has_next() and page_obj.object_list:
+        next_cursor = keyset.encode_cursor(page_obj[-1])
+        query = request.GET.copy()
+        query.pop('page', None)
+        if category_slug:
+            query['category'] = category_slug
+        more_url = f"{reverse('mybiz_core:product_list_more')}?{query.urlencode()}"
+
     current_category = None
     if category_slug:
         current_category = get_object_or_404(Category, slug=category_slug, is_active=True)
+        # Список категории зависит только от товаров её поддерева
+        page_cache.add_tags(request, f'category:{current_category.pk}')
+    else:
+        page_cache.add_tags(request, 'products')
 
     context = {
         'categories': categories,
         'current_category': current_category,
+        'breadcrumbs': current_category.get_ancestors() if current_category else [],
         'products': page_obj,
         'page_obj': page_obj,
-        'search_query': search_query,
-        'sort_by': sort_by,
-        'total_products': products.count(),
+        'search_query': params['search_query'],
+        'sort_by': params['sort_by'],
+        'total_products': paginator.count,
+        'facets': facets,
+        'next_cursor': next_cursor,
+        'more_url': more_url,
     }
     return render(request, 'products/product_list.html', context)
 
 
+def product_list_more(request):
+    """
+    Догрузка товаров для бесконечной прокрутки.
+
+    Принимает те же параметры, что и product_list, плюс cursor;
+    возвращает JSON с HTML карточек и курсором следующей порции.
+    """
+    products, params = _get_filtered_products(request)
+    products = ProductService.sort_products(products, params['sort_by'])
+    paginator = KeysetPaginator(products, page_size=PRODUCTS_PER_PAGE)
+    try:
+        page = paginator.get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+    html = render_to_string('products/product_grid_items.html', {'products': page}, request=request)
+    return JsonResponse({
+        'html': html,
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    })
+
+
+@cache_page_for_anonymous
+@conditional_page(product_validators)
 def product_detail(request, pk, slug):
     """Детальная страница товара"""
     product = get_object_or_404(
@@ -71,6 +156,8 @@ def product_detail(request, pk, slug):
     )
 
     related_products = ProductService.get_related_products(product)
+    # Похожие товары - из той же категории
+    page_cache.add_tags(request, f'product:{product.pk}', f'category:{product.category_id}')
 
     context = {
         'product': product,
@@ -3,9 +3,8 @@ from django.db import models
 from django.utils.text import slugify
 from django_ckeditor_5.fields import CKEditor5Field
 from django.urls import reverse
-from django.db.models.signals import post_save, post_delete
-from django.core.cache import cache
-from django.dispatch import receiver
+from services.cache import CacheEntry, VersionedQuerySet, pages_cache
+from services.cache_records import PageRecord
 
 
 class Page(models.Model):
@@ -22,6 +21,9 @@ class Page(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, editable=False, verbose_name="Дата обновления")
 
+    objects = VersionedQuerySet.as_manager()
+    cache_namespaces = ('pages',)
+
     class Meta:
         verbose_name = "страница"
         verbose_name_plural = "Страницы"
@@ -51,39 +53,46 @@ class Page(models.Model):
         return reverse('pages:page_detail', kwargs={'page_slug': self.slug})
 
     @classmethod
-    def get_header_pages(cls):
-        """Возвращает страницы для шапки сайта с кэшированием"""
-        cache_key = 'header_pages'
-        pages = cache.get(cache_key)
-
-        if pages is None:
-            pages = list(cls.objects.filter(
+    def load_header_pages(cls):
+        return [
+            PageRecord.from_instance(page)
+            for page in cls.objects.filter(
                 show_in_header=True,
                 is_active=True
-            ).order_by('title'))
-            cache.set(cache_key, pages, 300)
+            ).only(*PageRecord.FIELDS).order_by('title')
+        ]
+
+    @classmethod
+    def header_pages_entry(cls):
+        return CacheEntry(pages_cache, 'header_pages', cls.load_header_pages, 300)
 
-        return pages
+    @classmethod
+    def get_header_pages(cls):
+        """Возвращает страницы для шапки сайта (PageRecord) с кэшированием"""
+        return cls.header_pages_entry().get()
 
     @classmethod
     def get_footer_pages(cls):
         """✅ ДОБАВЛЕНО: Возвращает страницы для подвала с кэшированием"""
-        cache_key = 'footer_pages'
-        pages = cache.get(cache_key)
-
-        if pages is None:
-            pages = list(cls.objects.filter(
+        return pages_cache.get_or_set(
+            'footer_pages',
+            lambda: list(cls.objects.filter(
                 show_in_footer=True,
                 is_active=True
-            ).order_by('title'))
-            cache.set(cache_key, pages, 300)
+            ).order_by('title')),
+            300,
+        )
 
-        return pages
+    @classmethod
+    def footer_pages_existence_entry(cls):
+        def load():
+            slugs = set(cls.objects.filter(slug__in=['privacy', 'offer'], is_active=True)
+                        .values_list('slug', flat=True))
+            return {'privacy': 'privacy' in slugs, 'offer': 'offer' in slugs}
 
+        return CacheEntry(pages_cache, 'footer_pages_existence', load, 300)
 
-# Сигнал для очистки кэша страниц
-@receiver([post_save, post_delete], sender=Page)
-def clear_pages_cache(sender, **kwargs):
-    """Очищает кэш страниц при изменении"""
-    cache.delete('header_pages')
-    cache.delete('footer_pages')
+    @classmethod
+    def get_footer_pages_existence(cls):
+        """Наличие активных страниц privacy и offer для ссылок в подвале"""
+        return cls.footer_pages_existence_entry().get()
@@ -1,11 +1,16 @@
 # pages/views.py
 from django.shortcuts import render, get_object_or_404
 from .models import Page
+from services import page_cache
+from services.conditional import conditional_page, page_validators
 
 
+@page_cache.cache_page_for_anonymous
+@conditional_page(page_validators)
 def page_detail(request, page_slug):
     """Детальная страница"""
     page = get_object_or_404(Page, slug=page_slug, is_active=True)
+    page_cache.add_tags(request, f'page:{page.pk}')
 
     context = {
         'page': page,
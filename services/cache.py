@@ -0,0 +1,331 @@
+"""
+Версионированный (поколенческий) кэш.
+
+Данные сайта разбиты на пространства имён (catalog, promotions, pages,
+settings). У каждого в кэше хранится номер версии, и все производные ключи
+включают его: 'catalog.1718000000123456:featured_products'. Любая запись в
+модели пространства увеличивает версию - всё, что было из него выведено,
+становится недоступным без перечисления ключей; старые записи доживают
+свой TTL и вытесняются.
+
+Модель относится к пространствам через атрибут cache_namespaces; запись
+через save()/delete() ловит общий сигнал, массовые операции -
+VersionedQuerySet (update, delete, bulk_create, bulk_update).
+
+Алиас кэша задаётся настройкой VERSIONED_CACHE_ALIAS (по умолчанию 'default').
+Увеличение версии публикуется в шину services.invalidation, чтобы другие
+процессы сбросили свои локальные кэши этих пространств. Версии и значения
+запоминаются на время запроса (services.request_memo) и забываются при bump().
+
+Внутри транзакции версия увеличивается только после её фиксации
+(services.transactions.after_commit): иначе параллельный запрос успел бы пересчитать
+значение по ещё не зафиксированным строкам и сохранить его под новой
+версией на весь TTL.
+Пересчёт значений защищён от одновременного выполнения воркерами
+(services.stampede): значения хранятся как CachedValue.
+
+В ключи входит версия формата записей (services.cache_records.SCHEMA_VERSION):
+после её увеличения значения старого формата не читаются.
+"""
+import logging
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from services import invalidation, request_memo, stampede
+from services.cache_records import SCHEMA_VERSION
+from services.transactions import after_commit
+
+logger = logging.getLogger(__name__)
+
+NAMESPACES = ('catalog', 'promotions', 'pages', 'settings')
+
+_MISSING = object()
+
+
+def version_key(namespace):
+    return f'cache_version:{namespace}'
+
+
+def get_cache_alias():
+    return getattr(settings, 'VERSIONED_CACHE_ALIAS', 'default')
+
+
+def _initial_version():
+    # Версия от времени: если ключ версии вытеснен из кэша, новая версия
+    # всё равно больше прежних и не "воскрешает" старые записи
+    return time.time_ns() // 1_000
+
+
+def get_versions(namespaces, alias=None, stats=None):
+    """
+    Текущие версии пространств имён одним get_many.
+
+    Версии, уже прочитанные в этом запросе, берутся из request_memo без обращения к кэшу.
+    stats (dict) - счётчик обращений к кэшу, увеличивается stats['round_trips'].
+    """
+    alias = alias or get_cache_alias()
+    cache = caches[alias]
+    versions = {}
+    keys = {}
+    for namespace in namespaces:
+        version = request_memo.lookup(('cache_version', alias, namespace))
+        if version is None:
+            keys[version_key(namespace)] = namespace
+        else:
+            versions[namespace] = version
+    if not keys:
+        return versions
+
+    found = cache.get_many(list(keys))
+    if stats is not None:
+        stats['round_trips'] += 1
+    missing = {}
+    for key, namespace in keys.items():
+        if key in found:
+            versions[namespace] = found[key]
+        else:
+            missing[key] = versions[namespace] = _initial_version()
+    for key, version in missing.items():
+        # add не перезапишет версию, если её уже успел создать другой процесс
+        if not cache.add(key, version, None):
+            versions[keys[key]] = cache.get(key, version)
+        if stats is not None:
+            stats['round_trips'] += 1
+    for namespace in keys.values():
+        request_memo.remember(('cache_version', alias, namespace), versions[namespace], (namespace,))
+    return versions
+
+
+def bump(*namespaces, alias=None):
+    """
+    Увеличивает версии пространств имён - весь выведенный из них кэш устаревает.
+
+    В транзакции - после её фиксации; запомненное в текущем запросе забывается сразу.
+    """
+    request_memo.forget(namespaces)
+    after_commit(lambda: _bump_versions(namespaces, alias))
+
+
+def _bump_versions(namespaces, alias=None):
+    cache = caches[alias or get_cache_alias()]
+    for namespace in namespaces:
+        key = version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+    # Значения, запомненные до фиксации, могли быть посчитаны по старым строкам
+    request_memo.forget(namespaces)
+    invalidation.publish(*namespaces)
+    logger.debug(f"Версии кэша увеличены: {', '.join(namespaces)}")
+
+
+def bump_for_model(model):
+    namespaces = getattr(model, 'cache_namespaces', ())
+    if namespaces:
+        bump(*namespaces)
+
+
+class VersionedCache:
+    """
+    Кэш, ключи которого зависят от версий пространств имён.
+
+    Пример:
+        catalog_cache.get_or_set('featured_products', load_featured, 300)
+    """
+
+    def __init__(self, *namespaces, alias=None):
+        unknown = set(namespaces) - set(NAMESPACES)
+        if unknown:
+            raise ValueError(f'Неизвестные пространства имён кэша: {", ".join(sorted(unknown))}')
+        self.namespaces = namespaces
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias or get_cache_alias()]
+
+    def make_key(self, name, versions=None):
+        versions = versions or get_versions(self.namespaces, self.alias)
+        prefix = ':'.join(f'{namespace}.{versions[namespace]}' for namespace in self.namespaces)
+        return f'{prefix}:r{SCHEMA_VERSION}:{name}'
+
+    def memo_key(self, name):
+        return ('cache', self.alias or get_cache_alias(), self.namespaces, name)
+
+    def stale_key(self, name):
+        """Ключ копии значения, которую можно отдать, пока новая версия пересчитывается"""
+        return f"stale:r{SCHEMA_VERSION}:{':'.join(self.namespaces)}:{name}"
+
+    def get(self, name, default=None):
+        record = stampede.as_cached_value(self.cache.get(self.make_key(name)))
+        return default if record is None else record.value
+
+    def set(self, name, value, timeout):
+        record = stampede.CachedValue(value, time.time() + timeout, 0.0)
+        stampede.store(self.cache, self.make_key(name), record, stale_key=self.stale_key(name))
+        request_memo.remember(self.memo_key(name), value, self.namespaces)
+
+    def get_or_set(self, name, compute, timeout):
+        """
+        Значение из кэша; при промахе вычисляет compute() и сохраняет результат.
+
+        В пределах запроса значение читается из кэша один раз; пересчёт
+        выполняет один воркер (services.stampede.get_or_compute).
+        """
+        def load():
+            return stampede.get_or_compute(
+                self.cache, self.make_key(name), compute, timeout, stale_key=self.stale_key(name)
+            )
+
+        return request_memo.memoize(self.memo_key(name), load, self.namespaces)
+
+    def bump(self):
+        bump(*self.namespaces, alias=self.alias)
+
+
+class CacheEntry(namedtuple('CacheEntry', 'cache name compute timeout')):
+    """
+    Запись версионированного кэша: где лежит, как вычисляется и сколько живёт.
+
+    timeout - секунды или функция, вычисляющая срок после compute()
+    (см. services.stampede.compute_record).
+    """
+
+    def get(self):
+        return self.cache.get_or_set(self.name, self.compute, self.timeout)
+
+
+def get_or_set_many(entries, compute=None):
+    """
+    Значения нескольких записей за минимум обращений к кэшу.
+
+    Версии всех пространств читаются одним get_many, значения - ещё одним,
+    вычисляются только промахи и устаревающие записи (под блокировкой, как в
+    services.stampede), и они записываются одним set_many на каждый TTL.
+    Записи должны относиться к одному алиасу кэша. Значения, уже прочитанные
+    в этом запросе, берутся из request_memo.
+
+    compute - имена записей, которые нужно вычислить при промахе (None - все);
+    промахи остальных в результат не попадают.
+
+    Returns:
+        tuple: (dict {имя записи: значение}, статистика обращений)
+    """
+    stats = {'keys': len(entries), 'memoized': 0, 'hits': 0, 'misses': 0, 'deferred': 0, 'round_trips': 0}
+    values = {}
+    pending = []
+    for entry in entries:
+        value = request_memo.lookup(entry.cache.memo_key(entry.name), _MISSING)
+        if value is _MISSING:
+            pending.append(entry)
+        else:
+            values[entry.name] = value
+            stats['memoized'] += 1
+    entries = pending
+    if not entries:
+        stats['sequential_round_trips'] = 0
+        return values, stats
+
+    alias = entries[0].cache.alias
+    cache = entries[0].cache.cache
+    namespaces = sorted({namespace for entry in entries for namespace in entry.cache.namespaces})
+    versions = get_versions(namespaces, alias, stats)
+    keys = {entry.name: entry.cache.make_key(entry.name, versions) for entry in entries}
+
+    found = cache.get_many(list(keys.values()))
+    stats['round_trips'] += 1
+
+    computed = defaultdict(dict)
+    locks = {}
+    try:
+        for entry in entries:
+            key = keys[entry.name]
+            record = stampede.as_cached_value(found.get(key))
+            if record is not None and stampede.is_fresh(record):
+                values[entry.name] = record.value
+                stats['hits'] += 1
+            elif compute is not None and entry.name not in compute:
+                stats['deferred'] += 1
+                continue
+            else:
+                stats['round_trips'] += 1
+                token = stampede.acquire_lock(cache, key)
+                if token:
+                    # Пересчитываем сами; остальные воркеры тем временем отдают старое значение
+                    locks[key] = token
+                    record = stampede.compute_record(entry.compute, entry.timeout)
+                    ttl = stampede.record_timeout(record)
+                    computed[ttl][key] = computed[ttl][entry.cache.stale_key(entry.name)] = record
+                    values[entry.name] = record.value
+                else:
+                    values[entry.name] = stampede.refresh(
+                        cache, key, entry.compute, entry.timeout, stale=record,
+                        stale_key=entry.cache.stale_key(entry.name),
+                    )
+                stats['misses'] += 1
+            request_memo.remember(entry.cache.memo_key(entry.name), values[entry.name], entry.cache.namespaces)
+        for ttl, data in computed.items():
+            cache.set_many(data, ttl)
+            stats['round_trips'] += 1
+    finally:
+        # Снимаем только свои блокировки (по токену), в том числе если compute() упал
+        for key, token in locks.items():
+            stampede.release_lock(cache, key, token)
+            stats['round_trips'] += 2
+
+    # По отдельности каждая запись - это get_many версий и get, а промах -
+    # ещё add блокировки, set_many, get и delete при её снятии
+    stats['sequential_round_trips'] = 2 * len(entries) + 4 * stats['misses']
+    return values, stats
+
+
+catalog_cache = VersionedCache('catalog')
+promotions_cache = VersionedCache('promotions')
+pages_cache = VersionedCache('pages')
+settings_cache = VersionedCache('settings')
+
+
+class VersionedQuerySet(models.QuerySet):
+    """
+    QuerySet, увеличивающий версию кэша модели при массовых изменениях.
+
+    queryset.update() и подобные не вызывают сигналов post_save/post_delete,
+    поэтому без этого выведенный кэш оставался бы устаревшим до истечения TTL.
+    """
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        bump_for_model(self.model)
+        return rows
+    update.alters_data = True
+
+    def delete(self):
+        result = super().delete()
+        bump_for_model(self.model)
+        return result
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, *args, **kwargs):
+        objs = super().bulk_create(*args, **kwargs)
+        bump_for_model(self.model)
+        return objs
+
+    def bulk_update(self, *args, **kwargs):
+        rows = super().bulk_update(*args, **kwargs)
+        bump_for_model(self.model)
+        return rows
+
+
+@receiver([post_save, post_delete])
+def bump_cache_version_on_write(sender, raw=False, **kwargs):
+    """Любая запись в модель с cache_namespaces увеличивает версии её пространств"""
+    if not raw:
+        bump_for_model(sender)
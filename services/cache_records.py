@@ -0,0 +1,266 @@
+"""
+Компактные записи для кэша вместо экземпляров моделей.
+
+Экземпляр модели в pickle тянет за собой все поля (HTML описания из
+CKEditor, SEO-поля), состояние _state и кэши связей, и каждый запрос
+распаковывает их заново. Записи здесь - классы со __slots__ только из тех
+полей, которые выводят шаблоны витрины. В pickle запись - это класс и
+кортеж значений (__reduce__), без имён полей.
+
+Записи ведут себя в шаблонах как модели (get_absolute_url, image.url,
+category.name, id) и равны экземпляру своей модели с тем же pk.
+
+Формат записей версионирован: SCHEMA_VERSION входит в ключи
+версионированного кэша (services.cache), поэтому после изменения полей
+записей его нужно увеличить - значения старого формата не будут прочитаны.
+
+payload_report() сравнивает размер и время распаковки записей с
+экземплярами моделей (команда cache_payloads).
+"""
+import pickle
+import time
+
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+# Увеличивать при любом изменении полей записей
+SCHEMA_VERSION = 1
+
+
+class ImageRef:
+    """Ссылка на файл изображения: имя в хранилище, url и bool, как у поля ImageField"""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    @classmethod
+    def from_field(cls, field_file):
+        return cls(field_file.name) if field_file else None
+
+    @property
+    def url(self):
+        return default_storage.url(self.name)
+
+    def __bool__(self):
+        return bool(self.name)
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return getattr(other, 'name', other) == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __reduce__(self):
+        return self.__class__, (self.name,)
+
+
+class Record:
+    """
+    Базовая запись: поля из __slots__ заполняются позиционно.
+
+    model - метка модели ('app_label.Model'), с экземплярами которой запись сравнивается.
+    """
+
+    __slots__ = ()
+    model = None
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @property
+    def id(self):
+        return self.pk
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        return self.__class__, self.values()
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return type(other) is type(self) and other.pk == self.pk
+        meta = getattr(other, '_meta', None)
+        return meta is not None and meta.label == self.model and other.pk == self.pk
+
+    def __hash__(self):
+        return hash((self.model, self.pk))
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.pk}: {self}>'
+
+
+class CategoryRef(Record):
+    """Категория товара в карточке (название и ссылка)"""
+
+    __slots__ = ('pk', 'name', 'slug')
+    model = 'mybiz_core.Category'
+
+    def __str__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse('mybiz_core:product_list_by_category', kwargs={'category_slug': self.slug})
+
+
+class CategoryRecord(Record):
+    """Категория меню: счётчик товаров поддерева и активные дочерние категории"""
+
+    __slots__ = ('pk', 'name', 'slug', 'image', 'parent_id', 'products_count', 'tree_children')
+    model = 'mybiz_core.Category'
+
+    # В кэш попадают только активные категории
+    is_active = True
+
+    FIELDS = ('name', 'slug', 'image', 'parent_id')
+
+    @classmethod
+    def from_instance(cls, category):
+        return cls(
+            category.pk, category.name, category.slug, ImageRef.from_field(category.image),
+            category.parent_id, category.products_count, [],
+        )
+
+    def __str__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse('mybiz_core:product_list_by_category', kwargs={'category_slug': self.slug})
+
+
+class ProductRecord(Record):
+    """Товар в карточке (templates/products/product_items.html)"""
+
+    __slots__ = (
+        'pk', 'name', 'slug', 'price', 'discount_price', 'image', 'is_new', 'in_stock', 'category',
+    )
+    model = 'mybiz_core.Product'
+
+    FIELDS = (
+        'name', 'slug', 'price', 'discount_price', 'image', 'is_new', 'in_stock',
+        'category__name', 'category__slug',
+    )
+
+    @classmethod
+    def from_instance(cls, product):
+        category = product.category
+        return cls(
+            product.pk, product.name, product.slug, product.price, product.discount_price,
+            ImageRef.from_field(product.image), product.is_new, product.in_stock,
+            CategoryRef(category.pk, category.name, category.slug),
+        )
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def category_id(self):
+        return self.category.pk
+
+    def get_absolute_url(self):
+        return reverse('mybiz_core:product_detail', kwargs={'pk': self.pk, 'slug': self.slug})
+
+    def get_discount_percentage(self):
+        if self.discount_price and self.price > 0:
+            return int((self.price - self.discount_price) / self.price * 100)
+        return 0
+
+    @property
+    def display_price(self):
+        return self.discount_price if self.discount_price else self.price
+
+
+class PromotionRecord(Record):
+    """Акция в блоке на главной"""
+
+    __slots__ = (
+        'pk', 'title', 'slug', 'short_description', 'button_text', 'button_url',
+        'image', 'start_date', 'end_date',
+    )
+    model = 'content.Promotion'
+
+    FIELDS = ('title', 'slug', 'short_description', 'button_text', 'button_url', 'image', 'start_date', 'end_date')
+
+    @classmethod
+    def from_instance(cls, promotion):
+        return cls(
+            promotion.pk, promotion.title, promotion.slug, promotion.short_description,
+            promotion.button_text, promotion.button_url, ImageRef.from_field(promotion.image),
+            promotion.start_date, promotion.end_date,
+        )
+
+    def __str__(self):
+        return self.title
+
+
+class PageRecord(Record):
+    """Информационная страница в шапке и подвале"""
+
+    __slots__ = ('pk', 'title', 'slug')
+    model = 'pages.Page'
+
+    FIELDS = ('title', 'slug')
+
+    @classmethod
+    def from_instance(cls, page):
+        return cls(page.pk, page.title, page.slug)
+
+    def __str__(self):
+        return self.title
+
+    def get_absolute_url(self):
+        return reverse('pages:page_detail', kwargs={'page_slug': self.slug})
+
+
+def payload_size(value):
+    """Размер значения в pickle (байт)"""
+    return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def load_time(value, repeat=100):
+    """Среднее время распаковки значения из pickle (мкс)"""
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        pickle.loads(data)
+    return (time.perf_counter() - started) / repeat * 1_000_000
+
+
+def payload_report():
+    """
+    Размер и время распаковки значений кэша: записи против экземпляров моделей.
+
+    Экземпляры - те же объекты, выбранные целиком, как их кэшировали раньше.
+
+    Returns:
+        dict: {имя значения: {'count': N, 'records': (байт, мкс), 'models': (байт, мкс)}}
+    """
+    from content.models import Promotion
+    from mybiz_core.models import Category, Product
+    from pages.models import Page
+    from services.product_services import CategoryService, ProductService, PromotionService
+
+    samples = {
+        'featured_products': (ProductService.load_featured_products, Product.objects.select_related('category')),
+        'active_promotions': (PromotionService.load_active_promotions, Promotion.objects.all()),
+        'header_pages': (Page.load_header_pages, Page.objects.all()),
+        'categories_with_counts': (
+            CategoryService.load_categories_with_counts, Category.objects.select_related('stats'),
+        ),
+    }
+    report = {}
+    for name, (load, queryset) in samples.items():
+        records = load()
+        instances = list(queryset.filter(pk__in=[record.pk for record in records]))
+        report[name] = {
+            'count': len(records),
+            'records': (payload_size(records), load_time(records)),
+            'models': (payload_size(instances), load_time(instances)),
+        }
+    return report
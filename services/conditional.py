@@ -0,0 +1,126 @@
+"""
+Условные GET-запросы (ETag / Last-Modified).
+
+Повторный запрос с If-None-Match / If-Modified-Since получает 304 без
+рендеринга шаблона или сериализации, если ресурс не менялся.
+
+- Страницы товара и информационные страницы: updated_at объекта (одним
+  лёгким запросом) плюс версии тегов полностраничного кэша, от которых
+  зависит общий макет (шапка, меню категорий, подвал). Last-Modified у них
+  не выдаётся: дата объекта не отражает изменений макета, категории и похожих
+  товаров, и запрос только с If-Modified-Since получал бы 304 с устаревшей страницей.
+- Списки API и настройки: версии пространств версионированного кэша
+  (services.cache) - запросов к БД нет вовсе.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from services import page_cache
+from services.cache import get_versions
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _viewer(request):
+    # Страница может отличаться для вошедшего пользователя
+    user = getattr(request, 'user', None)
+    return f'user{user.pk}' if user is not None and user.is_authenticated else 'anon'
+
+
+def layout_fingerprint(*tags):
+    """Версии тегов макета страницы (и дополнительных тегов) одной строкой"""
+    versions = page_cache.get_tag_versions(page_cache.BASE_TAGS + tags)
+    return ','.join(f'{tag}={version}' for tag, version in sorted(versions.items()))
+
+
+def product_validators(request, pk, slug):
+    """(ETag, None) страницы товара или (None, None), если товара нет"""
+    from mybiz_core.models import Product
+
+    row = (
+        Product.objects.filter(pk=pk, slug=slug, is_active=True)
+        .values_list('updated_at', 'category_id').first()
+    )
+    if row is None:
+        return None, None
+    updated_at, category_id = row
+    # Похожие товары на странице - из той же категории
+    fingerprint = layout_fingerprint(f'product:{pk}', f'category:{category_id}')
+    return make_etag('product', pk, updated_at.isoformat(), fingerprint, _viewer(request)), None
+
+
+def page_validators(request, page_slug):
+    """(ETag, None) информационной страницы или (None, None)"""
+    from pages.models import Page
+
+    row = Page.objects.filter(slug=page_slug, is_active=True).values_list('pk', 'updated_at').first()
+    if row is None:
+        return None, None
+    pk, updated_at = row
+    fingerprint = layout_fingerprint(f'page:{pk}')
+    return make_etag('page', pk, updated_at.isoformat(), fingerprint, _viewer(request)), None
+
+
+def namespace_etag(request, namespaces, *extra):
+    """
+    ETag ответа API по версиям пространств кэша.
+
+    В ETag входят полный путь с параметрами и заголовок Accept (JSON и
+    browsable API - разные представления).
+    """
+    versions = get_versions(namespaces)
+    return make_etag(
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+        *(f'{namespace}={versions[namespace]}' for namespace in sorted(namespaces)),
+        *extra,
+    )
+
+
+def not_modified_response(request, etag, last_modified=None):
+    """HttpResponseNotModified, если клиентская копия актуальна, иначе None"""
+    return get_conditional_response(
+        request,
+        etag=quote_etag(etag),
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def set_validators(response, etag, last_modified=None, vary=()):
+    if response.status_code != 200:
+        return response
+    response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
+
+
+def conditional_page(validators):
+    """
+    Декоратор view: 304 по validators(request, *args, **kwargs) -> (ETag, Last-Modified).
+
+    Если объект не найден (ETag None) или у посетителя есть flash-сообщения,
+    view выполняется как обычно.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+                return view_func(request, *args, **kwargs)
+            etag, last_modified = validators(request, *args, **kwargs)
+            if etag is None:
+                return view_func(request, *args, **kwargs)
+            response = not_modified_response(request, etag, last_modified)
+            if response is None:
+                response = set_validators(view_func(request, *args, **kwargs), etag, last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,148 @@
+"""
+Общая выборка кэша для контекст-процессоров.
+
+Каждый контекст-процессор витрины берёт своё значение из версионированного
+кэша. По отдельности это два обращения к кэшу на значение (версии и сами
+данные). При первом обращении шаблона к любому значению контекста записи
+всех процессоров читаются get_or_set_many - версии и значения двумя get_many;
+вычисляется только промах запрошенного значения, остальные промахи - при
+обращении к ним. Последующие значения берутся из запомненного на запросе
+результата.
+
+Процессоры возвращают ленивые значения (lazy_context_value): шаблон, который
+не выводит акции или категории, не вызывает ни кэша, ни запросов к БД.
+Какие значения были предложены и какие использованы, запоминается на запросе
+и собирается в отчёт get_usage_report() - по нему видно, что можно убрать
+из глобального контекста.
+
+Статистика обращений сохраняется в request.context_cache_stats.
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.utils.functional import SimpleLazyObject
+
+from services.cache import get_or_set_many
+
+logger = logging.getLogger(__name__)
+
+
+def get_context_entries():
+    """Записи кэша, нужные контекст-процессорам витрины"""
+    from content.models import SiteSettings
+    from pages.models import Page
+    from services.product_services import CategoryService, PromotionService
+
+    return [
+        SiteSettings.cache_entry(),
+        PromotionService.active_promotions_entry(),
+        Page.header_pages_entry(),
+        Page.footer_pages_existence_entry(),
+        CategoryService.categories_with_counts_entry(),
+    ]
+
+
+def get_context_values(request, name=None):
+    """
+    Значения записей get_context_entries(), выбранные один раз за запрос.
+
+    name - запись, которую нужно вычислить при промахе; промахи остальных
+    в результат не попадают.
+    """
+    values = getattr(request, '_context_cache_values', None)
+    if values is None:
+        try:
+            values, stats = get_or_set_many(get_context_entries(), compute={name} if name else None)
+        except Exception as e:
+            # Значения будут получены по отдельности, ошибка останется у своего процессора
+            logger.error(f"Ошибка общей выборки кэша контекста: {e}")
+            values, stats = {}, None
+        request._context_cache_values = values
+        request.context_cache_stats = stats
+        if stats:
+            logger.debug(
+                f"Кэш контекста: {stats['keys']} ключей, промахов {stats['misses']}, "
+                f"обращений {stats['round_trips']} вместо {stats['sequential_round_trips']}"
+            )
+    return values
+
+
+def context_value(request, name):
+    """Значение записи name для контекст-процессора"""
+    values = get_context_values(request, name)
+    if name in values:
+        return values[name]
+    for entry in get_context_entries():
+        if entry.name == name:
+            values[name] = entry.get()
+            return values[name]
+    raise KeyError(name)
+
+
+def lazy_context_value(request, context_name, load):
+    """
+    Ленивое значение контекста: load() вызывается при первом обращении шаблона.
+
+    context_name - имя переменной шаблона, для отчёта об использовании.
+    """
+    offered = request.__dict__.setdefault('_context_offered', set())
+    touched = request.__dict__.setdefault('_context_touched', set())
+    offered.add(context_name)
+
+    def setup():
+        touched.add(context_name)
+        return load()
+
+    return SimpleLazyObject(setup)
+
+
+# Отчёт об использовании контекста: view -> {переменная: число обращений}
+_usage = defaultdict(Counter)
+_requests = Counter()
+_usage_lock = threading.Lock()
+
+
+def record_usage(request, view_name):
+    """
+    Добавляет в отчёт, какие переменные контекста view использовал шаблон.
+
+    Returns:
+        tuple: (использованные, неиспользованные) переменные этого запроса
+    """
+    offered = getattr(request, '_context_offered', set())
+    touched = getattr(request, '_context_touched', set())
+    if not offered:
+        return set(), set()
+    with _usage_lock:
+        _requests[view_name] += 1
+        counter = _usage[view_name]
+        for name in offered:
+            counter[name] += name in touched
+    return touched & offered, offered - touched
+
+
+def get_usage_report():
+    """
+    Доля запросов, в которых шаблон обратился к каждой переменной контекста.
+
+    Returns:
+        dict: {view: {'requests': N, 'usage': {переменная: доля от 0 до 1}}}
+    """
+    with _usage_lock:
+        return {
+            view_name: {
+                'requests': _requests[view_name],
+                'usage': {
+                    name: count / _requests[view_name]
+                    for name, count in sorted(counter.items())
+                },
+            }
+            for view_name, counter in _usage.items()
+        }
+
+
+def reset_usage_report():
+    with _usage_lock:
+        _usage.clear()
+        _requests.clear()
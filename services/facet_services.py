@@ -0,0 +1,153 @@
+"""
+Фасетная навигация по каталогу.
+
+Все счётчики фасетов (категории, бренды, ценовые диапазоны, наличие,
+новинки, скидки) считаются одним сгруппированным запросом по текущему
+набору фильтров и кэшируются в версионированном кэше каталога по
+нормализованной сигнатуре фильтров, фактически применённых к queryset.
+Ключи HTML-каталога и API разделены префиксом точки входа: одинаковые
+имена параметров у них означают разные фильтры.
+"""
+import hashlib
+import json
+import logging
+
+from django.db.models import Count, Q
+
+from services.cache import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+# Ценовые диапазоны: (ключ, от, до) - границы в рублях, "до" не включается
+PRICE_BUCKETS = (
+    ('0-1000', None, 1000),
+    ('1000-5000', 1000, 5000),
+    ('5000-20000', 5000, 20000),
+    ('20000-50000', 20000, 50000),
+    ('50000+', 50000, None),
+)
+
+# Параметры запроса, которые не влияют на набор товаров
+IGNORED_PARAMS = {'page', 'page_size', 'sort', 'ordering', 'cursor', 'format'}
+
+
+def _price_bucket_q(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+class FacetService:
+    """Сервис подсчёта фасетов каталога"""
+
+    CACHE_TIMEOUT = 300
+
+    @staticmethod
+    def get_signature(params):
+        """
+        Нормализует параметры фильтрации в стабильную строку.
+
+        Пустые значения и параметры пагинации/сортировки отбрасываются,
+        ключи сортируются, поэтому ?a=1&b=2 и ?b=2&a=1&page=3 дают одну сигнатуру.
+        """
+        normalized = {}
+        for key in sorted(params):
+            if key in IGNORED_PARAMS:
+                continue
+            values = params.getlist(key) if hasattr(params, 'getlist') else [params[key]]
+            values = sorted(str(value).strip() for value in values if value not in (None, '', False))
+            if values:
+                normalized[key] = values
+        return json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+
+    @staticmethod
+    def get_facets(queryset, filters, endpoint):
+        """
+        Возвращает фасеты для queryset с кэшированием по сигнатуре filters.
+
+        Args:
+            queryset: уже отфильтрованный QuerySet товаров
+            filters: фильтры, фактически применённые к queryset (не сырые параметры
+                запроса: параметр, который точка входа не обрабатывает, не должен
+                попадать в ключ)
+            endpoint: точка входа ('html', 'api') - префикс ключа кэша
+        """
+        signature = FacetService.get_signature(filters)
+        digest = hashlib.md5(signature.encode('utf-8')).hexdigest()
+        return catalog_cache.get_or_set(
+            f'facets:{endpoint}:{digest}',
+            lambda: FacetService.compute_facets(queryset),
+            FacetService.CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def compute_facets(queryset):
+        """
+        Считает все фасеты одним запросом GROUP BY (категория, бренд).
+
+        Условные COUNT(... FILTER ...) дают счётчики наличия, новинок, скидок
+        и ценовых диапазонов внутри каждой группы; итог сворачивается в Python.
+        """
+        aggregates = {
+            'total': Count('pk'),
+            'in_stock': Count('pk', filter=Q(in_stock=True, stock__gt=0)),
+            'is_new': Count('pk', filter=Q(is_new=True)),
+            'has_discount': Count('pk', filter=Q(discount_price__isnull=False)),
+        }
+        for index, (_, low, high) in enumerate(PRICE_BUCKETS):
+            aggregates[f'price_{index}'] = Count('pk', filter=_price_bucket_q(low, high))
+
+        rows = (
+            queryset.order_by()
+            .values('category_id', 'category__name', 'category__slug', 'brand')
+            .annotate(**aggregates)
+        )
+
+        facets = {
+            'total': 0,
+            'in_stock': 0,
+            'is_new': 0,
+            'has_discount': 0,
+            'categories': [],
+            'brands': [],
+            'price': [],
+        }
+        categories = {}
+        brands = {}
+        price_counts = [0] * len(PRICE_BUCKETS)
+
+        for row in rows:
+            facets['total'] += row['total']
+            facets['in_stock'] += row['in_stock']
+            facets['is_new'] += row['is_new']
+            facets['has_discount'] += row['has_discount']
+            category = categories.setdefault(row['category_id'], {
+                'id': row['category_id'],
+                'name': row['category__name'],
+                'slug': row['category__slug'],
+                'count': 0,
+            })
+            category['count'] += row['total']
+            if row['brand']:
+                brands[row['brand']] = brands.get(row['brand'], 0) + row['total']
+            for index in range(len(PRICE_BUCKETS)):
+                price_counts[index] += row[f'price_{index}']
+
+        facets['categories'] = sorted(categories.values(), key=lambda item: (-item['count'], item['name']))
+        facets['brands'] = [
+            {'value': brand, 'count': count}
+            for brand, count in sorted(brands.items(), key=lambda item: (-item[1], item[0]))
+        ]
+        facets['price'] = [
+            {'key': key, 'min': low, 'max': high, 'count': price_counts[index]}
+            for index, (key, low, high) in enumerate(PRICE_BUCKETS)
+        ]
+        return facets
+
+    @staticmethod
+    def clear_cache():
+        """Сбрасывает все закэшированные фасеты (новая версия кэша каталога)"""
+        catalog_cache.bump()
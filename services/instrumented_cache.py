@@ -0,0 +1,293 @@
+"""
+Кэш с метриками: попадания, промахи, записи, удаления, объём и задержка по группам ключей.
+
+InstrumentedCache - бэкенд Django, который передаёт все операции кэшу
+TARGET_ALIAS и считает их по группе ключа (key_group): версии пространств,
+формат записей и числовые суффиксы отбрасываются, так что
+'catalog.1718000000123456:r1:featured_products_8' и 'stale:r1:catalog:featured_products_8'
+считаются в группах 'featured_products' и 'stale:featured_products'.
+
+Счётчики копятся в памяти процесса и раз в FLUSH_INTERVAL секунд
+сохраняются снимком в общий кэш CACHE_METRICS_ALIAS (ключ на процесс), поэтому
+get_metrics() собирает данные всех воркеров. Объём считается по размеру
+значения в pickle при записи (set, set_many, add); чтение не
+сериализуется повторно, чтобы не удваивать его стоимость.
+
+Пример настройки:
+    CACHES['storefront'] = {
+        'BACKEND': 'services.instrumented_cache.InstrumentedCache',
+        'OPTIONS': {'TARGET_ALIAS': 'two_tier'},
+    }
+    VERSIONED_CACHE_ALIAS = 'storefront'
+"""
+import logging
+import os
+import pickle
+import re
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from services.cache import NAMESPACES
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+FIELDS = ('hits', 'misses', 'sets', 'deletes', 'bytes', 'calls', 'seconds', 'max_seconds')
+FLUSH_INTERVAL = 10
+SNAPSHOT_TIMEOUT = 7 * 24 * 3600
+PROCESSES_KEY = 'cache_metrics:processes'
+
+# Служебные сегменты в начале ключа: версии пространств, формат записей, сами пространства (stale-ключи)
+_SERVICE_SEGMENT = re.compile(r'^(r\d+|(%s)(\.\d+)?)$' % '|'.join(NAMESPACES))
+_NUMERIC_SUFFIX = re.compile(r'_\d+$')
+_PREFIXES = ('lock', 'stale')
+
+
+def key_group(key):
+    """Группа ключа для метрик: имя значения без версий и числовых параметров"""
+    parts = key.split(':')
+    prefix = ''
+    if len(parts) > 1 and parts[0] in _PREFIXES:
+        prefix = f'{parts[0]}:'
+        parts = parts[1:]
+    while len(parts) > 1 and _SERVICE_SEGMENT.match(parts[0]):
+        parts = parts[1:]
+    return prefix + _NUMERIC_SUFFIX.sub('', parts[0])
+
+
+def snapshot_key(process):
+    return f'cache_metrics:process:{process}'
+
+
+def payload_size(value):
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+class Metrics:
+    """Счётчики процесса по группам ключей"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+        self._last_flush = time.monotonic()
+
+    @property
+    def process(self):
+        # pid читается каждый раз: модуль мог быть импортирован до fork воркеров
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def record(self, keys, seconds, **counts):
+        """
+        Учитывает одну операцию над keys.
+
+        counts - {поле: {группа: значение}}; время операции делится между ключами.
+        """
+        groups = [key_group(key) for key in keys]
+        if not groups:
+            return
+        share = seconds / len(groups)
+        with self._lock:
+            for group in groups:
+                stats = self._groups[group]
+                stats['calls'] += 1
+                stats['seconds'] += share
+                stats['max_seconds'] = max(stats['max_seconds'], share)
+            for field, by_group in counts.items():
+                for group, value in by_group.items():
+                    self._groups[group][field] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {group: dict(stats) for group, stats in self._groups.items()}
+
+    def reset(self):
+        with self._lock:
+            self._groups.clear()
+
+    def flush_due(self, interval=FLUSH_INTERVAL):
+        now = time.monotonic()
+        if now - self._last_flush < interval:
+            return False
+        self._last_flush = now
+        return True
+
+
+_metrics = Metrics()
+
+
+def get_metrics_alias():
+    return getattr(settings, 'CACHE_METRICS_ALIAS', 'default')
+
+
+def flush():
+    """Сохраняет снимок счётчиков процесса в общий кэш"""
+    cache = caches[get_metrics_alias()]
+    cache.set(snapshot_key(_metrics.process), _metrics.snapshot(), SNAPSHOT_TIMEOUT)
+    processes = cache.get(PROCESSES_KEY) or []
+    if _metrics.process not in processes:
+        # Гонка между воркерами не страшна: пропавший процесс допишется при следующем сбросе
+        cache.set(PROCESSES_KEY, [*processes, _metrics.process], SNAPSHOT_TIMEOUT)
+
+
+def merge(snapshots):
+    """Сумма снимков процессов; max_seconds - максимум"""
+    merged = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    for snapshot in snapshots:
+        for group, stats in snapshot.items():
+            total = merged[group]
+            for field in FIELDS:
+                if field == 'max_seconds':
+                    total[field] = max(total[field], stats.get(field, 0))
+                else:
+                    total[field] += stats.get(field, 0)
+    return merged
+
+
+def get_metrics():
+    """
+    Метрики всех процессов по группам ключей.
+
+    Returns:
+        dict: {группа: hits, misses, sets, deletes, bytes, calls, hit_ratio,
+               avg_bytes (на запись), avg_ms и max_ms (на ключ)}
+    """
+    flush()
+    cache = caches[get_metrics_alias()]
+    processes = cache.get(PROCESSES_KEY) or []
+    snapshots = cache.get_many([snapshot_key(process) for process in processes]).values()
+    report = {}
+    for group, stats in sorted(merge(snapshots).items()):
+        lookups = stats['hits'] + stats['misses']
+        report[group] = {
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'sets': stats['sets'],
+            'deletes': stats['deletes'],
+            'bytes': stats['bytes'],
+            'calls': stats['calls'],
+            'hit_ratio': stats['hits'] / lookups if lookups else None,
+            'avg_bytes': stats['bytes'] // stats['sets'] if stats['sets'] else 0,
+            'avg_ms': stats['seconds'] / stats['calls'] * 1000 if stats['calls'] else 0.0,
+            'max_ms': stats['max_seconds'] * 1000,
+        }
+    return report
+
+
+def reset_metrics():
+    """Обнуляет счётчики текущего процесса и снимки всех процессов"""
+    _metrics.reset()
+    cache = caches[get_metrics_alias()]
+    processes = cache.get(PROCESSES_KEY) or []
+    cache.delete_many([snapshot_key(process) for process in processes] + [PROCESSES_KEY])
+
+
+def _by_group(keys, value=1):
+    counts = defaultdict(int)
+    for key in keys:
+        counts[key_group(key)] += value(key) if callable(value) else value
+    return counts
+
+
+class InstrumentedCache(BaseCache):
+    """Кэш-бэкенд Django: операции кэша TARGET_ALIAS с метриками по группам ключей"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.target_alias = options.get('TARGET_ALIAS', 'default')
+        self.flush_interval = options.get('FLUSH_INTERVAL', FLUSH_INTERVAL)
+
+    @property
+    def target(self):
+        return caches[self.target_alias]
+
+    def __getattr__(self, name):
+        # Дополнительные методы целевого кэша (например, sync_versions двухуровневого)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.target, name)
+
+    def _record(self, keys, started, **counts):
+        _metrics.record(keys, time.perf_counter() - started, **counts)
+        if _metrics.flush_due(self.flush_interval):
+            try:
+                flush()
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить метрики кэша: {e}")
+
+    def get(self, key, default=None, version=None):
+        started = time.perf_counter()
+        value = self.target.get(key, _MISSING, version=version)
+        hit = value is not _MISSING
+        self._record([key], started, **{'hits' if hit else 'misses': {key_group(key): 1}})
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        started = time.perf_counter()
+        found = self.target.get_many(keys, version=version)
+        self._record(
+            keys, started,
+            hits=_by_group(found), misses=_by_group(key for key in keys if key not in found),
+        )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        started = time.perf_counter()
+        self.target.set(key, value, timeout, version=version)
+        group = key_group(key)
+        self._record([key], started, sets={group: 1}, bytes={group: payload_size(value)})
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        started = time.perf_counter()
+        failed = self.target.set_many(data, timeout, version=version)
+        self._record(
+            list(data), started,
+            sets=_by_group(data), bytes=_by_group(data, lambda key: payload_size(data[key])),
+        )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        started = time.perf_counter()
+        added = self.target.add(key, value, timeout, version=version)
+        group = key_group(key)
+        counts = {'sets': {group: 1}, 'bytes': {group: payload_size(value)}} if added else {}
+        self._record([key], started, **counts)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.target.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        started = time.perf_counter()
+        value = self.target.incr(key, delta, version=version)
+        self._record([key], started, sets={key_group(key): 1})
+        return value
+
+    def delete(self, key, version=None):
+        started = time.perf_counter()
+        deleted = self.target.delete(key, version=version)
+        self._record([key], started, deletes={key_group(key): 1})
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        started = time.perf_counter()
+        self.target.delete_many(keys, version=version)
+        self._record(keys, started, deletes=_by_group(keys))
+
+    def has_key(self, key, version=None):
+        return self.target.has_key(key, version=version)
+
+    def clear(self):
+        self.target.clear()
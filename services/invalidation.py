@@ -0,0 +1,324 @@
+"""
+Шина инвалидации локальных кэшей процессов.
+
+У каждого воркера gunicorn есть данные в памяти процесса: LRU двухуровневого
+кэша, SVG-иконки соцсетей, триграммный индекс поиска. Запись в модель
+увеличивает версию пространства имён (services.cache.bump), и шина рассылает
+имена пространств всем процессам; каждый процесс в фоновом потоке получает
+сообщение и вызывает зарегистрированные обработчики своих локальных кэшей.
+Запрос при этом к Redis не обращается.
+
+Бэкенды (настройка INVALIDATION_BUS):
+    LocalBus - только текущий процесс, по умолчанию и в тестах;
+    FileBus  - журнал в файле, общий для процессов одной машины (разработка);
+    RedisBus - Redis pub/sub (продакшн).
+
+Пример настройки:
+    INVALIDATION_BUS = {
+        'BACKEND': 'services.invalidation.RedisBus',
+        'OPTIONS': {'CACHE_ALIAS': 'default', 'CHANNEL': 'mybiz:invalidation'},
+    }
+
+Регистрация локального кэша:
+    invalidation.register('social_svg', lambda namespaces: _svg_cache.clear(), ('settings',))
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from services.transactions import after_commit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'services.invalidation.LocalBus'
+
+# Обработчики локальных кэшей процесса: имя -> (callback, пространства имён или None)
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def register(name, callback, namespaces=None):
+    """
+    Регистрирует локальный кэш процесса.
+
+    callback(namespaces) вызывается с множеством изменившихся пространств;
+    если namespaces задан, только при пересечении с ним. Повторная регистрация
+    с тем же именем заменяет обработчик.
+    """
+    with _handlers_lock:
+        _handlers[name] = (callback, frozenset(namespaces) if namespaces else None)
+
+
+def unregister(name):
+    with _handlers_lock:
+        _handlers.pop(name, None)
+
+
+def dispatch(namespaces):
+    """Вызывает обработчики локальных кэшей текущего процесса"""
+    namespaces = frozenset(namespaces)
+    with _handlers_lock:
+        handlers = list(_handlers.items())
+    for name, (callback, interested) in handlers:
+        if interested is not None and not interested & namespaces:
+            continue
+        try:
+            callback(namespaces)
+        except Exception as e:
+            logger.error(f"Ошибка инвалидации локального кэша {name}: {e}")
+
+
+def _all_namespaces():
+    from services.cache import NAMESPACES
+    return frozenset(NAMESPACES)
+
+
+class BaseBus:
+    """Базовый бэкенд шины: сообщения доставляются только текущему процессу"""
+
+    # Доставляет ли шина сообщения другим процессам
+    cross_process = False
+
+    def __init__(self, options=None):
+        self.options = options or {}
+
+    @property
+    def is_listening(self):
+        """Подписка другим процессам активна и сообщения из них принимаются"""
+        return False
+
+    def ensure_started(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, namespaces):
+        dispatch(namespaces)
+
+
+class LocalBus(BaseBus):
+    """Шина в пределах одного процесса (тесты, runserver)"""
+
+
+class ListenerBus(BaseBus):
+    """
+    Шина с фоновым потоком-подписчиком.
+
+    Поток запускается лениво в каждом процессе (после fork воркера gunicorn -
+    заново). Свои сообщения процесс обрабатывает сразу при публикации, а из
+    подписки пропускает. После переподключения сообщения могли быть потеряны,
+    поэтому локальные кэши сбрасываются целиком.
+    """
+
+    cross_process = True
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._subscribed = threading.Event()
+
+    @property
+    def origin(self):
+        # pid различает воркеры, унаследовавшие шину от мастера при fork
+        return f'{os.getpid()}:{id(self)}'
+
+    @property
+    def is_listening(self):
+        return self._pid == os.getpid() and self._subscribed.is_set()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._subscribed = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, name=f'{type(self).__name__}-listener', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        self._pid = None
+
+    def _run(self):
+        connected_before = False
+        while not self._stop.is_set():
+            try:
+                self.listen(on_subscribed=self._on_subscribed(connected_before))
+            except Exception as e:
+                logger.error(f"Шина инвалидации отключена: {e}")
+            connected_before = connected_before or self._subscribed.is_set()
+            self._subscribed.clear()
+            self._stop.wait(self.RECONNECT_DELAY)
+
+    def _on_subscribed(self, reconnect):
+        def callback():
+            self._subscribed.set()
+            if reconnect:
+                dispatch(_all_namespaces())
+        return callback
+
+    def encode(self, namespaces):
+        return json.dumps({'namespaces': sorted(namespaces), 'origin': self.origin})
+
+    def handle(self, data):
+        """Обрабатывает сообщение из подписки"""
+        try:
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            message = json.loads(data)
+            namespaces = message['namespaces']
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Некорректное сообщение шины инвалидации: {e}")
+            return
+        if message.get('origin') != self.origin:
+            dispatch(namespaces)
+
+    def publish(self, namespaces):
+        dispatch(namespaces)
+        self.send(self.encode(namespaces))
+
+    def send(self, data):
+        raise NotImplementedError
+
+    def listen(self, on_subscribed):
+        """Принимает сообщения до self._stop; после подписки вызывает on_subscribed()"""
+        raise NotImplementedError
+
+
+class FileBus(ListenerBus):
+    """
+    Шина на файле-журнале: публикация дописывает строку, подписчики читают
+    новые строки с интервалом POLL_INTERVAL. Для разработки без Redis.
+    """
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.path = self.options.get('PATH') or os.path.join(tempfile.gettempdir(), 'mybiz-invalidation.log')
+        self.poll_interval = self.options.get('POLL_INTERVAL', 0.5)
+
+    def send(self, data):
+        # Одна запись в режиме O_APPEND не перемешивается с записями других процессов
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (data + '\n').encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def listen(self, on_subscribed):
+        open(self.path, 'a').close()
+        with open(self.path, 'r', encoding='utf-8') as log:
+            log.seek(0, os.SEEK_END)
+            on_subscribed()
+            buffer = ''
+            while not self._stop.is_set():
+                if os.path.getsize(self.path) < log.tell():
+                    # Журнал очищен - читаем заново с начала
+                    log.seek(0)
+                    buffer = ''
+                chunk = log.readline()
+                if not chunk:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                buffer += chunk
+                if buffer.endswith('\n'):
+                    self.handle(buffer)
+                    buffer = ''
+
+
+class RedisBus(ListenerBus):
+    """Шина на Redis pub/sub; соединение берётся у кэша CACHE_ALIAS (django-redis)"""
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.cache_alias = self.options.get('CACHE_ALIAS', 'default')
+        self.channel = self.options.get('CHANNEL', 'mybiz:invalidation')
+
+    def _client(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.cache_alias)
+
+    def send(self, data):
+        self._client().publish(self.channel, data)
+
+    def listen(self, on_subscribed):
+        pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self.channel)
+            # Подписка подтверждается первым сообщением от сервера
+            pubsub.get_message(timeout=5)
+            on_subscribed()
+            while not self._stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get('type') == 'message':
+                    self.handle(message['data'])
+        finally:
+            pubsub.close()
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    """Шина процесса по настройке INVALIDATION_BUS"""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                config = getattr(settings, 'INVALIDATION_BUS', {})
+                backend = import_string(config.get('BACKEND', DEFAULT_BACKEND))
+                _bus = backend(config.get('OPTIONS', {}))
+    return _bus
+
+
+def reset_bus():
+    global _bus
+    with _bus_lock:
+        if _bus is not None:
+            _bus.stop()
+        _bus = None
+
+
+@receiver(setting_changed)
+def reset_bus_on_setting_change(setting, **kwargs):
+    if setting == 'INVALIDATION_BUS':
+        reset_bus()
+
+
+def publish(*namespaces):
+    """
+    Сообщает всем процессам об изменении пространств имён.
+
+    Внутри транзакции сообщение уходит после её фиксации: иначе другие
+    процессы перечитали бы локальные кэши из ещё не зафиксированных строк.
+    Ошибка доставки не прерывает запись в модель: локальные кэши других
+    процессов в худшем случае доживут свой TTL.
+    """
+    if namespaces:
+        after_commit(lambda: _publish_now(namespaces))
+
+
+def _publish_now(namespaces):
+    try:
+        get_bus().publish(namespaces)
+    except Exception as e:
+        logger.error(f"Ошибка публикации инвалидации {', '.join(namespaces)}: {e}")
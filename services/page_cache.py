@@ -0,0 +1,356 @@
+"""
+Полностраничный кэш витрины для анонимных посетителей.
+
+Ответ на анонимный GET кэшируется по пути и нормализованной строке запроса
+(параметры отсортированы, пустые и рекламные метки utm_*, fbclid и т.п.
+отброшены). Страницы с flash-сообщениями не читаются из кэша и не кэшируются:
+сообщения одноразовые и у каждого посетителя свои.
+
+Запись помечается тегами сущностей, из которых выведена страница:
+    settings, layout:categories, layout:pages - у каждой страницы (шапка, меню, подвал);
+    product:<id>, category:<id>, page:<id>     - конкретные объекты;
+    products, promotions                       - списки товаров и акций.
+У каждого тега в кэше своя версия; запись хранит версии своих тегов и при
+чтении сверяется с текущими одним get_many. purge() увеличивает версии тегов -
+устаревают только зависящие от них страницы. Внутри транзакции - после её
+фиксации: запрос между сбросом и фиксацией иначе сохранил бы старую
+страницу на весь PAGE_CACHE_TIMEOUT.
+
+CSRF-токен в формах при сохранении заменяется заглушкой и при выдаче
+подставляется токен текущего посетителя. Заголовки ETag и Last-Modified
+сохраняются вместе со страницей: запрос с совпадающим If-None-Match получает
+304 прямо из кэша.
+
+Настройки: PAGE_CACHE_ENABLED, PAGE_CACHE_TIMEOUT (сек), PAGE_CACHE_ALIAS.
+"""
+import hashlib
+import logging
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from services.transactions import after_commit
+
+logger = logging.getLogger(__name__)
+
+BASE_TAGS = ('settings', 'layout:categories', 'layout:pages')
+TRACKING_PARAMS = ('fbclid', 'gclid', 'yclid', '_openstat')
+TRACKING_PREFIXES = ('utm_',)
+
+CSRF_PLACEHOLDER = '__page_cache_csrf_token__'
+_CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+STATS = ('hits', 'misses', 'stale', 'bypass', 'stores')
+PURGE_KINDS = ('settings', 'layout', 'product', 'category', 'products', 'promotions', 'page')
+
+
+def is_enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', True)
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+def tag_key(tag):
+    return f'page_tag:{tag}'
+
+
+def stats_key(name):
+    return f'page_cache:stats:{name}'
+
+
+def normalize_query(query):
+    """Стабильная строка запроса без пустых и рекламных параметров"""
+    pairs = []
+    for key in sorted(query):
+        if key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES):
+            continue
+        for value in sorted(query.getlist(key)):
+            if value != '':
+                pairs.append(f'{key}={value}')
+    return '&'.join(pairs)
+
+
+def make_key(request):
+    raw = f'{request.path}?{normalize_query(request.GET)}'
+    return 'page:' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def add_tags(request, *tags):
+    """Помечает кэшируемую страницу тегами сущностей (вызывается из view)"""
+    page_tags = getattr(request, '_page_cache_tags', None)
+    if page_tags is not None:
+        page_tags.update(tags)
+
+
+def count(name, delta=1):
+    cache = get_cache()
+    try:
+        cache.incr(stats_key(name), delta)
+    except ValueError:
+        if not cache.add(stats_key(name), delta, None):
+            cache.incr(stats_key(name), delta)
+
+
+def get_tag_versions(tags):
+    """Текущие версии тегов; отсутствующие создаются"""
+    cache = get_cache()
+    keys = {tag_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, tag in keys.items():
+        if key in found:
+            versions[tag] = found[key]
+        else:
+            # Версия от времени: вытесненный ключ тега не "воскрешает" старые страницы
+            version = time.time_ns() // 1_000
+            versions[tag] = version if cache.add(key, version, None) else cache.get(key, version)
+    return versions
+
+
+def category_tags(category_ids):
+    """Теги категорий и всех их предков (страницы предков включают товары подкатегорий)"""
+    from mybiz_core.models import Category
+
+    ids = set()
+    paths = Category.objects.filter(pk__in=[pk for pk in category_ids if pk]).values_list('path', flat=True)
+    for path in paths:
+        ids.update(int(pk) for pk in path.strip('/').split('/') if pk)
+    return {f'category:{pk}' for pk in ids}
+
+
+def purge_products(product_ids, category_ids, counts_changed=True):
+    """
+    Делает устаревшими страницы товаров, их категорий и списков товаров.
+
+    counts_changed - менялись ли счётчики товаров в меню категорий (у всех страниц).
+    """
+    tags = {f'product:{pk}' for pk in product_ids} | category_tags(category_ids) | {'products'}
+    if counts_changed:
+        tags.add('layout:categories')
+    purge(*tags)
+
+
+def purge(*tags):
+    """Делает устаревшими все страницы, помеченные любым из тегов (в транзакции - после фиксации)"""
+    tags = set(tags)
+    if tags:
+        after_commit(lambda: _purge_now(tags))
+
+
+def _purge_now(tags):
+    cache = get_cache()
+    for tag in tags:
+        try:
+            cache.incr(tag_key(tag))
+        except ValueError:
+            cache.set(tag_key(tag), time.time_ns() // 1_000, None)
+        count(f"purges:{tag.split(':')[0]}")
+    logger.debug(f"Страницы с тегами {', '.join(sorted(tags))} устарели")
+
+
+def get_stats():
+    """
+    Счётчики полностраничного кэша (общие для всех воркеров).
+
+    Returns:
+        dict: hits, misses, stale, bypass, stores, hit_ratio и purges по видам тегов
+    """
+    cache = get_cache()
+    names = list(STATS)
+    found = cache.get_many([stats_key(name) for name in names])
+    stats = {name: found.get(stats_key(name), 0) for name in names}
+    lookups = stats['hits'] + stats['misses'] + stats['stale']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+
+    found = cache.get_many([stats_key(f'purges:{kind}') for kind in PURGE_KINDS])
+    stats['purges'] = {kind: found.get(stats_key(f'purges:{kind}'), 0) for kind in PURGE_KINDS}
+    return stats
+
+
+def reset_stats():
+    get_cache().delete_many(
+        [stats_key(name) for name in STATS] + [stats_key(f'purges:{kind}') for kind in PURGE_KINDS]
+    )
+
+
+def _is_cacheable_request(request):
+    if request.method != 'GET':
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return False
+    # len() загружает сообщения, но не помечает их прочитанными
+    return not len(get_messages(request))
+
+
+def _is_storable_response(response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    cache_control = response.get('Cache-Control', '')
+    return 'private' not in cache_control and 'no-store' not in cache_control
+
+
+def _build_response(request, entry):
+    headers = entry.get('headers', {})
+    if headers:
+        not_modified = get_conditional_response(
+            request,
+            etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+        )
+        if not_modified is not None:
+            not_modified['X-Page-Cache'] = 'HIT'
+            return not_modified
+
+    content = entry['content']
+    if CSRF_PLACEHOLDER.encode() in content:
+        content = content.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+    response = HttpResponse(content, content_type=entry['content_type'])
+    for header, value in headers.items():
+        response[header] = value
+    response['X-Page-Cache'] = 'HIT'
+    return response
+
+
+def _store(request, key, response):
+    tags = request._page_cache_tags
+    content = _CSRF_INPUT.sub(rb'\g<1>' + CSRF_PLACEHOLDER.encode() + rb'\g<2>', response.content)
+    entry = {
+        'content': content,
+        'content_type': response['Content-Type'],
+        'headers': {header: response[header] for header in VALIDATOR_HEADERS if response.has_header(header)},
+        'tags': get_tag_versions(tags),
+    }
+    timeout = get_timeout()
+    if 'promotions' in tags:
+        # Набор акций меняется по датам без записи в модель - тег не сбросится
+        from services.product_services import PromotionService
+        timeout = min(timeout, PromotionService.seconds_until_change())
+    get_cache().set(key, entry, timeout)
+    count('stores')
+
+
+def cache_page_for_anonymous(view=None, tags=()):
+    """
+    Декоратор view: полностраничный кэш для анонимных GET-запросов.
+
+    tags - теги, общие для всех ответов view; теги конкретных объектов
+    view добавляет через add_tags(request, ...).
+
+    Пример:
+        @cache_page_for_anonymous(tags=('promotions',))
+        def promotions(request): ...
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not is_enabled():
+                return view_func(request, *args, **kwargs)
+            if not _is_cacheable_request(request):
+                count('bypass')
+                return view_func(request, *args, **kwargs)
+
+            key = make_key(request)
+            cache = get_cache()
+            entry = cache.get(key)
+            if entry is not None:
+                if get_tag_versions(entry['tags']) == entry['tags']:
+                    count('hits')
+                    return _build_response(request, entry)
+                count('stale')
+            else:
+                count('misses')
+
+            request._page_cache_tags = set(BASE_TAGS) | set(tags)
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            if _is_storable_response(response):
+                _store(request, key, response)
+            response['X-Page-Cache'] = 'MISS'
+            return response
+        return wrapper
+
+    if view is not None:
+        return decorator(view)
+    return decorator
+
+
+# Сигналы моделей: устаревают только страницы с затронутыми тегами.
+# Подключаются в MybizCoreConfig.ready().
+
+def _menu_state(state):
+    # В меню выводится число активных товаров категории
+    if state is None:
+        return None
+    category_id, flags = state
+    return category_id, bool(flags.get('active'))
+
+
+@receiver(pre_save, sender='mybiz_core.Product')
+def remember_product_page_state(sender, instance, raw=False, **kwargs):
+    # Состояние до сохранения уже прочитано remember_product_stats_state
+    instance._page_cache_state = getattr(instance, '_stats_state', None)
+
+
+@receiver(post_save, sender='mybiz_core.Product')
+def purge_product_pages(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_state = None if created else getattr(instance, '_page_cache_state', None)
+    new_state = instance.get_stats_state()
+    category_ids = {instance.category_id}
+    if old_state is not None:
+        category_ids.add(old_state[0])
+    purge_products(
+        [instance.pk], category_ids,
+        counts_changed=old_state is None or _menu_state(old_state) != _menu_state(new_state),
+    )
+
+
+@receiver(post_delete, sender='mybiz_core.Product')
+def purge_deleted_product_pages(sender, instance, **kwargs):
+    purge_products([instance.pk], {instance.category_id})
+
+
+@receiver([post_save, post_delete], sender='mybiz_core.Category')
+def purge_category_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ids = {int(pk) for pk in (instance.path or '').strip('/').split('/') if pk} | {instance.pk}
+    purge(*{f'category:{pk}' for pk in ids}, 'layout:categories', 'products')
+
+
+@receiver([post_save, post_delete], sender='content.Promotion')
+def purge_promotion_pages(sender, raw=False, **kwargs):
+    if not raw:
+        purge('promotions')
+
+
+@receiver([post_save, post_delete], sender='pages.Page')
+def purge_page_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        purge(f'page:{instance.pk}', 'layout:pages')
+
+
+@receiver([post_save, post_delete], sender='content.SiteSettings')
+def purge_all_pages_on_settings_change(sender, raw=False, **kwargs):
+    if not raw:
+        purge('settings')
@@ -0,0 +1,152 @@
+"""
+Курсорная (keyset) пагинация каталога.
+
+Вместо OFFSET следующая страница выбирается условием по значению поля
+сортировки последнего показанного товара и его pk, поэтому стоимость
+глубокой страницы не растёт с её номером, а COUNT не нужен.
+"""
+import base64
+import binascii
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+# Поля, по которым возможна курсорная пагинация (сортировки ProductService.sort_products)
+KEYSET_FIELDS = ('created_at', 'price', 'rating', 'name', 'search_rank')
+DEFAULT_ORDERING = '-created_at'
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или относится к другой сортировке"""
+
+
+class KeysetPage:
+    """Страница курсорной пагинации"""
+
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Keyset-пагинатор товаров.
+
+    Сортировка берётся из queryset (первое поле order_by); если по ней
+    курсорная пагинация невозможна, используется '-created_at'.
+    pk добавляется вторым ключом, чтобы порядок был строгим при равных значениях.
+    """
+
+    def __init__(self, queryset, ordering=None, page_size=12):
+        if ordering is None:
+            order_by = queryset.query.order_by or queryset.model._meta.ordering
+            ordering = order_by[0] if order_by else DEFAULT_ORDERING
+        if not isinstance(ordering, str) or ordering.lstrip('-') not in KEYSET_FIELDS:
+            ordering = DEFAULT_ORDERING
+        if ordering.lstrip('-') == 'search_rank' and 'search_rank' not in queryset.query.annotations:
+            ordering = DEFAULT_ORDERING
+
+        self.ordering = ordering
+        self.field = ordering.lstrip('-')
+        self.descending = ordering.startswith('-')
+        self.page_size = page_size
+        self.queryset = queryset.order_by(ordering, '-pk' if self.descending else 'pk')
+
+    def encode_cursor(self, obj):
+        """Курсор, указывающий на позицию сразу после obj"""
+        value = getattr(obj, self.field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        payload = json.dumps({'o': self.ordering, 'v': value, 'pk': obj.pk}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (значение поля сортировки, pk) из курсора"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            ordering, value, pk = payload['o'], payload['v'], int(payload['pk'])
+        except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError) as e:
+            raise InvalidCursor(f'Некорректный курсор: {e}') from e
+
+        if ordering != self.ordering:
+            raise InvalidCursor('Курсор относится к другой сортировке')
+
+        try:
+            field = self.queryset.model._meta.get_field(self.field)
+        except FieldDoesNotExist:
+            # Аннотация (search_rank) - число с плавающей точкой
+            try:
+                return float(value), pk
+            except (TypeError, ValueError) as e:
+                raise InvalidCursor(f'Некорректный курсор: {e}') from e
+        try:
+            return field.to_python(value), pk
+        except ValidationError as e:
+            raise InvalidCursor(f'Некорректный курсор: {e}') from e
+
+    def get_page(self, cursor=None):
+        """
+        Возвращает страницу после позиции cursor (первую, если cursor пуст).
+
+        Выбирается page_size + 1 товар: лишний только показывает, что есть следующая страница.
+        """
+        queryset = self.queryset
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            lookup = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value})
+                | Q(**{self.field: value, f'pk__{lookup}': pk})
+            )
+
+        items = list(queryset[:self.page_size + 1])
+        next_cursor = None
+        if len(items) > self.page_size:
+            items = items[:self.page_size]
+            next_cursor = self.encode_cursor(items[-1])
+        return KeysetPage(items, next_cursor)
+
+
+def estimate_count(queryset):
+    """
+    Приблизительное число строк queryset без полного COUNT.
+
+    На PostgreSQL берётся оценка планировщика из EXPLAIN, на остальных СУБД
+    (SQLite в разработке) выполняется обычный COUNT.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    try:
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    except Exception as e:
+        logger.error(f"Ошибка оценки количества товаров: {e}")
+        return queryset.count()
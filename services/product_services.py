@@ -2,16 +2,20 @@
 Сервисный слой для бизнес-логики проекта MyBiz.
 Здесь размещается вся бизнес-логика, отделенная от views.
 """
+from django.conf import settings
 from django.db import transaction
-from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db.models import Q
-from datetime import timedelta
+from django.db.models import Min, Q
+from datetime import datetime, timedelta
 import logging
+import math
 
 from mybiz_core.models import Category, Product
 from content.models import SiteSettings, Promotion, NewsletterSubscriber, StockNotification
+from services.cache import CacheEntry, bump_for_model, catalog_cache, promotions_cache
+from services.cache_records import CategoryRecord, ProductRecord, PromotionRecord
+from services.search_services import ProductSearchIndex
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -23,19 +27,64 @@ class CategoryService:
     @staticmethod
     def get_active_categories():
         """Получает все активные категории с оптимизацией"""
-        cache_key = 'active_categories'
-        categories = cache.get(cache_key)
-        
-        if categories is None:
-            categories = list(
+        return catalog_cache.get_or_set(
+            'active_categories',
+            lambda: list(
                 Category.objects.filter(is_active=True)
                 .prefetch_related('children')
                 .order_by('name')
-            )
-            cache.set(cache_key, categories, 300)
-        
+            ),
+            300,
+        )
+
+    @staticmethod
+    def load_categories_with_counts():
+        """Активные категории со счётчиками как CategoryRecord, связанные в дерево"""
+        categories = [
+            CategoryRecord.from_instance(category)
+            for category in Category.objects.filter(is_active=True)
+            .select_related('stats')
+            .only(*CategoryRecord.FIELDS, 'path', 'stats__subtree_active')
+            .order_by('name')
+        ]
+        by_id = {category.pk: category for category in categories}
+        for category in categories:
+            parent = by_id.get(category.parent_id)
+            if parent is not None:
+                parent.tree_children.append(category)
         return categories
 
+    @staticmethod
+    def categories_with_counts_entry():
+        """Запись кэша для get_categories_with_counts"""
+        return CacheEntry(catalog_cache, 'categories_with_counts', CategoryService.load_categories_with_counts, 300)
+
+    @staticmethod
+    def get_categories_with_counts():
+        """
+        Активные категории с количеством активных товаров, включая подкатегории.
+
+        Счётчики читаются из таблицы CategoryStats тем же запросом, что и
+        категории (JOIN по первичному ключу). У каждой категории заполняются
+        products_count и tree_children (активные дочерние категории), так что
+        по результату можно обходить дерево.
+
+        Returns:
+            list: CategoryRecord активных категорий в порядке названия
+        """
+        return CategoryService.categories_with_counts_entry().get()
+
+    @staticmethod
+    def get_category_tree(categories=None):
+        """
+        Корневые активные категории со счётчиками и вложенными tree_children.
+
+        categories - уже полученный результат get_categories_with_counts().
+        """
+        if categories is None:
+            categories = CategoryService.get_categories_with_counts()
+        return [category for category in categories if category.parent_id is None]
+
     @staticmethod
     def get_category_with_products(category_slug):
         """Получает категорию с товарами"""
@@ -52,72 +101,65 @@ class CategoryService:
     @staticmethod
     def clear_cache():
         """Очищает кэш категорий"""
-        cache.delete('active_categories')
+        catalog_cache.bump()
 
 
 class ProductService:
     """Сервис для работы с товарами"""
 
+    @staticmethod
+    def load_featured_products(limit=8):
+        return [
+            ProductRecord.from_instance(product)
+            for product in Product.objects.filter(
+                is_active=True,
+                is_featured=True
+            ).select_related('category').only(*ProductRecord.FIELDS)[:limit]
+        ]
+
     @staticmethod
     def get_featured_products(limit=8):
-        """Получает рекомендуемые товары"""
-        cache_key = 'featured_products'
-        products = cache.get(cache_key)
-        
-        if products is None:
-            products = list(
-                Product.objects.filter(
-                    is_active=True,
-                    is_featured=True
-                ).select_related('category')[:limit]
-            )
-            cache.set(cache_key, products, 300)
-        
-        return products
+        """Получает рекомендуемые товары (ProductRecord)"""
+        return catalog_cache.get_or_set(
+            f'featured_products_{limit}',
+            lambda: ProductService.load_featured_products(limit),
+            300,
+        )
 
     @staticmethod
     def get_new_products(limit=8):
-        """Получает новые товары"""
-        cache_key = 'new_products'
-        products = cache.get(cache_key)
-        
-        if products is None:
+        """Получает новые товары (ProductRecord)"""
+        def load():
             week_ago = timezone.now() - timedelta(days=7)
-            products = list(
-                Product.objects.filter(
+            return [
+                ProductRecord.from_instance(product)
+                for product in Product.objects.filter(
                     is_active=True,
                     is_new=True,
                     created_at__gte=week_ago
-                ).select_related('category')[:limit]
-            )
-            cache.set(cache_key, products, 300)
-        
-        return products
+                ).select_related('category').only(*ProductRecord.FIELDS)[:limit]
+            ]
+
+        return catalog_cache.get_or_set(f'new_products_{limit}', load, 300)
 
     @staticmethod
-    def search_products(query, filters=None):
+    def search_products(query, filters=None, mode='fulltext'):
         """
         Поиск товаров с фильтрацией.
         
         Args:
             query: Поисковый запрос
             filters: dict с фильтрами (min_price, max_price, category_slug, in_stock, etc.)
+            mode: режим поиска - 'fulltext', 'fuzzy' (устойчив к опечаткам) или 'auto'
         
         Returns:
-            QuerySet товаров
+            QuerySet товаров (при непустом query - с аннотацией search_rank)
         """
-        from django.db.models import Q
-        
         products = Product.objects.filter(is_active=True).select_related('category')
         
-        # Поиск по названию и описанию
+        # Поиск по индексу (добавляет аннотацию search_rank)
         if query:
-            products = products.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query) |
-                Q(short_description__icontains=query) |
-                Q(sku__icontains=query)
-            )
+            products = ProductSearchIndex.search(products, query, mode=mode)
         
         # Применение фильтров
         if filters:
@@ -128,7 +170,7 @@ class ProductService:
                 products = products.filter(price__lte=filters['max_price'])
             
             if 'category_slug' in filters and filters['category_slug']:
-                products = products.filter(category__slug=filters['category_slug'])
+                products = ProductService.filter_by_category(products, slug=filters['category_slug'])
             
             if 'in_stock' in filters and filters['in_stock']:
                 products = products.filter(in_stock=True, stock__gt=0)
@@ -138,9 +180,27 @@ class ProductService:
             
             if 'is_new' in filters and filters['is_new']:
                 products = products.filter(is_new=True)
+            
+            if 'brand' in filters and filters['brand']:
+                products = products.filter(brand=filters['brand'])
         
         return products
 
+    @staticmethod
+    def filter_by_category(products, slug=None, pk=None):
+        """
+        Оставляет товары категории вместе со всеми её подкатегориями.
+
+        Путь категории выбирается одним запросом по уникальному полю, дальше
+        поддерево отбирается по префиксу пути (индекс category_path_prefix_idx),
+        поэтому глубина дерева на стоимость запроса не влияет.
+        """
+        lookup = {'slug': slug} if slug is not None else {'pk': pk}
+        path = Category.objects.filter(**lookup).values_list('path', flat=True).first()
+        if not path:
+            return products.none()
+        return products.filter(category__path__startswith=path)
+
     @staticmethod
     def sort_products(products, sort_by='newest'):
         """
@@ -162,6 +222,10 @@ class ProductService:
             'name_desc': '-name',
         }
         
+        # Сортировка по релевантности возможна только для результатов поиска
+        if sort_by == 'relevance' and 'search_rank' in products.query.annotations:
+            return products.order_by('-search_rank', '-created_at')
+        
         order_field = sort_mapping.get(sort_by, '-created_at')
         return products.order_by(order_field)
 
@@ -176,7 +240,7 @@ class ProductService:
     @staticmethod
     def clear_cache():
         """Очищает кэш товаров"""
-        cache.delete_many(['featured_products', 'new_products'])
+        catalog_cache.bump()
 
 
 class SiteSettingsService:
@@ -184,49 +248,93 @@ class SiteSettingsService:
 
     @staticmethod
     def load():
-        """Загружает настройки сайта с кэшированием"""
-        cache_key = 'site_settings'
-        settings = cache.get(cache_key)
-        
-        if settings is None:
-            settings = SiteSettings.load()
-            cache.set(cache_key, settings, 600)
-        
-        return settings
+        """Загружает настройки сайта с кэшированием (кэш - в SiteSettings.load)"""
+        return SiteSettings.load()
 
     @staticmethod
     def clear_cache():
         """Очищает кэш настроек"""
-        cache.delete('site_settings')
+        bump_for_model(SiteSettings)
 
 
 class PromotionService:
     """Сервис для работы с промо-акциями"""
 
+    @staticmethod
+    def load_active_promotions(today=None):
+        today = today or timezone.localdate()
+        return [
+            PromotionRecord.from_instance(promotion)
+            for promotion in Promotion.objects.filter(
+                is_active=True,
+                start_date__lte=today
+            ).filter(
+                Q(end_date__gte=today) | Q(end_date__isnull=True)
+            ).only(*PromotionRecord.FIELDS).order_by('-created_at')
+        ]
+
+    @staticmethod
+    def next_change_date(today=None):
+        """
+        Ближайшая дата после today, с которой меняется набор активных акций.
+
+        Это ближайшая будущая дата начала или день после ближайшей даты
+        окончания (акция активна по end_date включительно). None - изменений
+        по датам не запланировано.
+        """
+        today = today or timezone.localdate()
+        bounds = Promotion.objects.filter(is_active=True).aggregate(
+            next_start=Min('start_date', filter=Q(start_date__gt=today)),
+            last_day=Min('end_date', filter=Q(end_date__gte=today)),
+        )
+        dates = [bounds['next_start']]
+        if bounds['last_day'] is not None:
+            dates.append(bounds['last_day'] + timedelta(days=1))
+        dates = [date for date in dates if date is not None]
+        return min(dates) if dates else None
+
+    @staticmethod
+    def seconds_until_change(today=None):
+        """
+        Сколько секунд набор активных акций останется прежним.
+
+        Не больше PROMOTIONS_CACHE_MAX_TIMEOUT: при изменении акций в админке
+        кэш и так сбрасывается по версии, а предел защищает от ошибок в датах.
+        """
+        max_timeout = getattr(settings, 'PROMOTIONS_CACHE_MAX_TIMEOUT', 6 * 3600)
+        change_date = PromotionService.next_change_date(today)
+        if change_date is None:
+            return max_timeout
+        # Смена в полночь по локальному времени сайта (TIME_ZONE)
+        change_at = timezone.make_aware(datetime.combine(change_date, datetime.min.time()))
+        seconds = math.ceil((change_at - timezone.now()).total_seconds())
+        return min(max(seconds, 1), max_timeout)
+
+    @staticmethod
+    def active_promotions_entry():
+        """
+        Запись кэша для get_active_promotions.
+
+        Срок годности - до ближайшей даты начала или окончания акции, набор
+        и срок считаются на одну и ту же дату.
+        """
+        today = timezone.localdate()
+        return CacheEntry(
+            promotions_cache,
+            'active_promotions',
+            lambda: PromotionService.load_active_promotions(today),
+            lambda: PromotionService.seconds_until_change(today),
+        )
+
     @staticmethod
     def get_active_promotions():
-        """Получает активные промо-акции"""
-        cache_key = 'active_promotions'
-        promotions = cache.get(cache_key)
-        
-        if promotions is None:
-            today = timezone.now().date()
-            promotions = list(
-                Promotion.objects.filter(
-                    is_active=True,
-                    start_date__lte=today
-                ).filter(
-                    Q(end_date__gte=today) | Q(end_date__isnull=True)
-                ).order_by('-created_at')
-            )
-            cache.set(cache_key, promotions, 300)
-        
-        return promotions
+        """Получает активные промо-акции (PromotionRecord)"""
+        return PromotionService.active_promotions_entry().get()
 
     @staticmethod
     def clear_cache():
         """Очищает кэш промо-акций"""
-        cache.delete('active_promotions')
+        promotions_cache.bump()
 
 
 class NewsletterService:
@@ -0,0 +1,67 @@
+"""
+Мемоизация в пределах запроса.
+
+Одно и то же значение (настройки сайта, акции, категории, версии кэша)
+за запрос запрашивается из нескольких мест: контекст-процессоры, view,
+сериализаторы. RequestMemoMiddleware открывает область запроса, и внутри неё
+memoize() вычисляет значение только один раз. Область хранится в contextvars,
+поэтому работает и в асинхронных view, и в коде, вызванном через sync_to_async.
+
+Записи помечаются пространствами имён кэша: services.cache.bump() забывает
+их, и после записи в модель тот же запрос видит новые данные. Вне области
+(management-команды, фоновые потоки) memoize() просто вызывает compute().
+"""
+import contextvars
+from contextlib import contextmanager
+
+_memo = contextvars.ContextVar('request_memo', default=None)
+
+
+@contextmanager
+def request_scope():
+    """Область мемоизации; вложенная область получает свой пустой memo"""
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+def memoize(key, compute, namespaces=()):
+    """
+    Значение key в области запроса; при первом обращении - compute().
+
+    namespaces - пространства имён кэша, при изменении которых запись забывается.
+    """
+    memo = _memo.get()
+    if memo is None:
+        return compute()
+    if key in memo:
+        return memo[key][1]
+    value = compute()
+    memo[key] = (frozenset(namespaces), value)
+    return value
+
+
+def lookup(key, default=None):
+    """Запомненное значение key или default"""
+    memo = _memo.get()
+    if memo is None or key not in memo:
+        return default
+    return memo[key][1]
+
+
+def remember(key, value, namespaces=()):
+    memo = _memo.get()
+    if memo is not None:
+        memo[key] = (frozenset(namespaces), value)
+
+
+def forget(namespaces):
+    """Забывает записи, зависящие от указанных пространств имён"""
+    memo = _memo.get()
+    if not memo:
+        return
+    namespaces = set(namespaces)
+    for key in [key for key, (tags, _) in memo.items() if tags & namespaces]:
+        del memo[key]
@@ -0,0 +1,487 @@
+"""
+Полнотекстовый поиск по товарам.
+
+Текст товаров и запросов проходит через анализатор (RussianAnalyzer):
+токенизация, удаление стоп-слов и стемминг Snowball. В индекс попадают
+уже нормализованные основы слов, поэтому во время запроса стемминг
+по строкам таблицы не выполняется.
+
+Индекс хранится рядом с таблицей товаров и зависит от СУБД:
+- PostgreSQL: колонка ``search_vector`` (tsvector) с GIN-индексом, ранжирование ts_rank;
+- SQLite: теневая таблица FTS5 ``mybiz_core_product_fts``, ранжирование bm25.
+
+Кроме полнотекстового, есть нечёткий режим (mode='fuzzy') для запросов
+с опечатками ("Samsumg", "WH1000"): сходство по триграммам названия,
+бренда и артикула (pg_trgm в PostgreSQL, TrigramIndex в памяти процесса
+для SQLite) плюс поиск по префиксу артикула.
+
+Индекс поддерживается сигналами Product (см. mybiz_core/models.py),
+полная перестройка - командой ``manage.py rebuild_search_index``.
+"""
+import re
+import time
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import Q, FloatField, Value, Case, When
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+from nltk.stem.snowball import SnowballStemmer
+
+from services import invalidation
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_TABLE = 'mybiz_core_product'
+FTS_TABLE = 'mybiz_core_product_fts'
+
+# Индексируемые поля и их веса (A - самый значимый)
+INDEXED_FIELDS = (
+    ('name', 'A'),
+    ('sku', 'A'),
+    ('short_description', 'B'),
+    ('description', 'C'),
+)
+
+SEARCH_MODES = ('fulltext', 'fuzzy', 'auto')
+
+# Минимальное триграммное сходство для нечёткого поиска
+FUZZY_THRESHOLD = 0.3
+FUZZY_LIMIT = 200
+
+# Поля, которые индексируются без стемминга и удаления стоп-слов
+RAW_FIELDS = {'sku'}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+LATIN_RE = re.compile(r'^[a-z]+$')
+
+# Стоп-слова русского языка (список nltk.corpus.stopwords, корпус nltk не требуется)
+RUSSIAN_STOP_WORDS = frozenset("""
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по
+    только ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если
+    уже или ни быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей
+    может они тут где есть надо ней для мы тебя их чем была сам чтоб без будто чего раз
+    тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом
+    один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец
+    два об другой хоть после над больше тот через эти нас про всего них какая много
+    разве три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой
+    им более всегда конечно всю между
+""".split())
+
+ENGLISH_STOP_WORDS = frozenset("""
+    a an and are as at be by for from in is it of on or the to with
+""".split())
+
+
+def tokenize(text):
+    """Разбивает строку на слова в нижнем регистре"""
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class RussianAnalyzer:
+    """
+    Анализатор текста для поиска: токенизация, стоп-слова, стемминг.
+
+    Русские слова стеммируются русским Snowball, латиница - английским
+    (названия брендов вроде "samsung" при этом не меняются).
+    """
+
+    def __init__(self):
+        self._russian = SnowballStemmer('russian')
+        self._english = SnowballStemmer('english')
+        self.stem = lru_cache(maxsize=50000)(self._stem)
+
+    def _stem(self, token):
+        if LATIN_RE.match(token):
+            return self._english.stem(token)
+        return self._russian.stem(token)
+
+    def analyze(self, text):
+        """Возвращает список основ слов без стоп-слов"""
+        return [
+            self.stem(token)
+            for token in tokenize(text)
+            if token not in RUSSIAN_STOP_WORDS and token not in ENGLISH_STOP_WORDS
+        ]
+
+    def analyze_field(self, field, text):
+        """Нормализует значение поля для записи в индекс"""
+        if field in RAW_FIELDS:
+            return ' '.join(tokenize(text))
+        return ' '.join(self.analyze(text))
+
+
+analyzer = RussianAnalyzer()
+
+
+def get_document(product):
+    """
+    Возвращает индексируемые поля товара в виде dict.
+
+    HTML из описания удаляется, текст приводится к основам слов анализатором.
+    """
+    document = {
+        'name': product.name or '',
+        'sku': product.sku or '',
+        'short_description': product.short_description or '',
+        'description': strip_tags(product.description or ''),
+    }
+    return {field: analyzer.analyze_field(field, text) for field, text in document.items()}
+
+
+def get_query_terms(query):
+    """Нормализует поисковый запрос тем же анализатором, что и документы"""
+    terms = []
+    for term in analyzer.analyze(query):
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def trigrams(word):
+    """Триграммы слова в стиле pg_trgm: два пробела в начале, один в конце"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def get_fuzzy_words(query):
+    """Слова запроса для нечёткого поиска (без стемминга, без стоп-слов)"""
+    return [
+        token for token in tokenize(query)
+        if token not in RUSSIAN_STOP_WORDS and token not in ENGLISH_STOP_WORDS
+    ]
+
+
+def get_sku_prefix(query):
+    """Префикс артикула из запроса: артикулы хранятся в верхнем регистре"""
+    return query.strip().upper()
+
+
+def rank_by_scores(queryset, scores):
+    """Фильтрует queryset по dict {pk: score} и аннотирует search_rank"""
+    if not scores:
+        return queryset.none()
+    rank = Case(
+        *[When(pk=pk, then=Value(score)) for pk, score in scores.items()],
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+    return queryset.filter(pk__in=list(scores)).annotate(search_rank=rank)
+
+
+class TrigramIndex:
+    """
+    Триграммный индекс в памяти процесса по name, brand и sku активных товаров.
+
+    Используется там, где нет pg_trgm (SQLite). Строится лениво при первом
+    нечётком запросе, сбрасывается сигналами Product (во всех процессах -
+    через шину инвалидации) и не живёт дольше MAX_AGE.
+    """
+
+    MAX_AGE = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._word_trigrams = {}
+        self._postings = defaultdict(set)
+        self._word_products = defaultdict(set)
+
+    def invalidate(self):
+        self._built_at = None
+
+    def _document_words(self, name, brand, sku):
+        words = tokenize(name) + tokenize(brand)
+        # Артикул индексируется целиком без разделителей: "WH-1000XM5" -> "wh1000xm5"
+        words.append(''.join(tokenize(sku)))
+        return [word for word in words if word]
+
+    def _ensure_built(self):
+        from mybiz_core.models import Product
+
+        with self._lock:
+            if self._built_at is not None and time.monotonic() - self._built_at < self.MAX_AGE:
+                return
+            word_trigrams = {}
+            postings = defaultdict(set)
+            word_products = defaultdict(set)
+            rows = Product.objects.filter(is_active=True).values_list('pk', 'name', 'brand', 'sku')
+            for pk, name, brand, sku in rows.iterator(chunk_size=2000):
+                for word in self._document_words(name, brand, sku):
+                    word_products[word].add(pk)
+                    if word not in word_trigrams:
+                        word_trigrams[word] = trigrams(word)
+                        for trigram in word_trigrams[word]:
+                            postings[trigram].add(word)
+            self._word_trigrams = word_trigrams
+            self._postings = postings
+            self._word_products = word_products
+            self._built_at = time.monotonic()
+
+    def search(self, query, threshold=FUZZY_THRESHOLD, limit=FUZZY_LIMIT):
+        """
+        Возвращает dict {pk: сходство} для товаров, похожих на запрос.
+
+        Сходство товара - среднее по словам запроса от лучшего совпадения
+        слова запроса со словом товара (коэффициент Жаккара по триграммам).
+        """
+        words = get_fuzzy_words(query)
+        if not words:
+            return {}
+        self._ensure_built()
+        totals = defaultdict(float)
+        for query_word in words:
+            query_trigrams = trigrams(query_word)
+            candidates = set()
+            for trigram in query_trigrams:
+                candidates |= self._postings.get(trigram, set())
+            best = {}
+            for word in candidates:
+                word_trigrams = self._word_trigrams[word]
+                similarity = len(query_trigrams & word_trigrams) / len(query_trigrams | word_trigrams)
+                if similarity < threshold:
+                    continue
+                for pk in self._word_products[word]:
+                    if similarity > best.get(pk, 0):
+                        best[pk] = similarity
+            for pk, similarity in best.items():
+                totals[pk] += similarity
+        scores = {pk: total / len(words) for pk, total in totals.items() if total / len(words) >= threshold}
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return dict(top)
+
+
+trigram_index = TrigramIndex()
+invalidation.register('trigram_index', lambda namespaces: trigram_index.invalidate(), ('catalog',))
+
+
+class BaseSearchBackend:
+    """Базовый бэкенд поиска: без индекса, поиск подстрокой"""
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, pk):
+        pass
+
+    def rebuild(self, products):
+        return 0
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(name__icontains=term) |
+                Q(short_description__icontains=term) |
+                Q(sku__icontains=term)
+            )
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def fuzzy_search(self, queryset, query):
+        words = get_fuzzy_words(query)
+        if not words:
+            return queryset.none()
+        scores = trigram_index.search(query)
+        # Совпадение по префиксу артикула всегда наверху выдачи
+        prefix = get_sku_prefix(query)
+        for pk in queryset.filter(sku__startswith=prefix).values_list('pk', flat=True)[:FUZZY_LIMIT]:
+            scores[pk] = 1.0
+        return rank_by_scores(queryset, scores)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector + GIN-индекс"""
+
+    # Текст уже нормализован анализатором, поэтому словарь PostgreSQL не применяется
+    config = 'simple'
+
+    def _vector_sql(self):
+        parts = [
+            f"setweight(to_tsvector('{self.config}', %s), '{weight}')"
+            for _, weight in INDEXED_FIELDS
+        ]
+        return ' || '.join(parts)
+
+    def _document_params(self, product):
+        document = get_document(product)
+        return [document[field] for field, _ in INDEXED_FIELDS]
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {PRODUCT_TABLE} SET search_vector = {self._vector_sql()} WHERE id = %s',
+                self._document_params(product) + [product.pk]
+            )
+
+    def rebuild(self, products):
+        count = 0
+        for product in products.iterator(chunk_size=500):
+            self.index_product(product)
+            count += 1
+        return count
+
+    def _tsquery(self, query):
+        # Каждое слово ищется как префикс: "телев" найдёт "телевизор"
+        return ' & '.join(f'{term}:*' for term in get_query_terms(query))
+
+    def search(self, queryset, query):
+        tsquery = self._tsquery(query)
+        if not tsquery:
+            return queryset.none()
+        matched = RawSQL(
+            f"SELECT id FROM {PRODUCT_TABLE} "
+            f"WHERE search_vector @@ to_tsquery('{self.config}', %s)",
+            [tsquery]
+        )
+        # ts_rank возвращает real: приводим к float8, чтобы значение в курсоре
+        # пагинации совпадало с вычисляемым в SQL при сравнении
+        rank = RawSQL(
+            f"ts_rank({PRODUCT_TABLE}.search_vector, to_tsquery('{self.config}', %s))::float8",
+            [tsquery],
+            output_field=FloatField()
+        )
+        return queryset.filter(pk__in=matched).annotate(search_rank=rank)
+
+    def fuzzy_search(self, queryset, query):
+        text = ' '.join(get_fuzzy_words(query))
+        if not text:
+            return queryset.none()
+        sku_pattern = re.sub(r'([\\%_])', r'\\\1', get_sku_prefix(query)) + '%'
+        # Операторы <% используют GIN-индексы gin_trgm_ops (порог pg_trgm.word_similarity_threshold),
+        # LIKE 'ABC%' по артикулу - индекс product_sku_prefix_idx
+        matched = RawSQL(
+            f"SELECT id FROM {PRODUCT_TABLE} "
+            f"WHERE %s <%% name OR %s <%% brand OR %s <%% sku OR sku LIKE %s",
+            [text, text, text, sku_pattern]
+        )
+        # word_similarity возвращает real - как и ts_rank, приводим к float8
+        similarity = RawSQL(
+            f"GREATEST(word_similarity(%s, {PRODUCT_TABLE}.name), "
+            f"word_similarity(%s, {PRODUCT_TABLE}.brand), "
+            f"word_similarity(%s, {PRODUCT_TABLE}.sku), "
+            f"CASE WHEN {PRODUCT_TABLE}.sku LIKE %s THEN 1.0 ELSE 0.0 END)::float8",
+            [text, text, text, sku_pattern],
+            output_field=FloatField()
+        )
+        return queryset.filter(pk__in=matched).annotate(search_rank=similarity)
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """Теневая таблица FTS5"""
+
+    # Веса bm25 в порядке колонок FTS-таблицы
+    BM25_WEIGHTS = '10.0, 10.0, 4.0, 1.0'
+
+    def index_product(self, product):
+        trigram_index.invalidate()
+        document = get_document(product)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, sku, short_description, description) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [product.pk] + [document[field] for field, _ in INDEXED_FIELDS]
+            )
+
+    def remove_product(self, pk):
+        trigram_index.invalidate()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+    def rebuild(self, products):
+        trigram_index.invalidate()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        count = 0
+        for product in products.iterator(chunk_size=500):
+            self.index_product(product)
+            count += 1
+        return count
+
+    def _match_expression(self, query):
+        # Экранируем слова кавычками, чтобы пользовательский ввод не ломал синтаксис MATCH
+        return ' '.join(f'"{term}"*' for term in get_query_terms(query))
+
+    def search(self, queryset, query):
+        expression = self._match_expression(query)
+        if not expression:
+            return queryset.none()
+        matched = RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [expression]
+        )
+        rank = RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}, {self.BM25_WEIGHTS}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {PRODUCT_TABLE}.id)',
+            [expression],
+            output_field=FloatField()
+        )
+        return queryset.filter(pk__in=matched).annotate(search_rank=rank)
+
+
+_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend():
+    """Возвращает бэкенд поиска для текущей СУБД"""
+    return _BACKENDS.get(connection.vendor, BaseSearchBackend)()
+
+
+class ProductSearchIndex:
+    """Фасад поискового индекса товаров"""
+
+    @staticmethod
+    def index_product(product):
+        """Обновляет запись товара в индексе"""
+        try:
+            with transaction.atomic():
+                get_search_backend().index_product(product)
+        except Exception as e:
+            logger.error(f"Ошибка индексации товара {product.pk}: {e}")
+
+    @staticmethod
+    def remove_product(pk):
+        """Удаляет товар из индекса"""
+        try:
+            with transaction.atomic():
+                get_search_backend().remove_product(pk)
+        except Exception as e:
+            logger.error(f"Ошибка удаления товара {pk} из индекса: {e}")
+
+    @staticmethod
+    def rebuild():
+        """Полностью перестраивает индекс. Возвращает количество проиндексированных товаров"""
+        from mybiz_core.models import Product
+
+        return get_search_backend().rebuild(Product.objects.all())
+
+    @staticmethod
+    def search(queryset, query, mode='fulltext'):
+        """
+        Фильтрует queryset по поисковому запросу.
+
+        Args:
+            queryset: QuerySet товаров
+            query: поисковый запрос
+            mode: 'fulltext' - по индексу основ слов, 'fuzzy' - по триграммам
+                  (устойчив к опечаткам), 'auto' - нечёткий поиск, если
+                  полнотекстовый ничего не нашёл
+
+        Возвращает QuerySet с аннотацией ``search_rank`` (чем больше, тем релевантнее).
+        """
+        backend = get_search_backend()
+        if mode == 'fuzzy':
+            return backend.fuzzy_search(queryset, query)
+        results = backend.search(queryset, query)
+        if mode == 'auto' and not results.exists():
+            return backend.fuzzy_search(queryset, query)
+        return results
@@ -0,0 +1,163 @@
+"""
+Защита от "давки" при пересчёте кэша (cache stampede).
+
+Когда популярный ключ истекает или устаревает после записи в модель, все
+воркеры одновременно идут его пересчитывать. get_or_compute() это исключает:
+
+- значение хранится вместе с мягким сроком годности и временем вычисления
+  (CachedValue), а сама запись живёт ещё stale_timeout после этого срока;
+- пересчёт начинается заранее с вероятностью, растущей к сроку годности
+  (XFetch: now - delta * beta * ln(rand) >= expires_at), поэтому дорогие
+  ключи обновляются до истечения;
+- пересчитывает один воркер - тот, кто взял короткую блокировку cache.add;
+- остальные тем временем отдают старое значение (stale-while-revalidate),
+  а если его нет - ждут результат не дольше wait_timeout.
+"""
+import logging
+import math
+import random
+import time
+import uuid
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько запись хранится после мягкого срока годности (для stale-while-revalidate)
+STALE_TIMEOUT = 60
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 2.0
+WAIT_INTERVAL = 0.05
+# Чем больше beta, тем раньше начинается пересчёт
+BETA = 1.0
+
+
+class CachedValue(namedtuple('CachedValue', 'value expires_at delta')):
+    """Значение в кэше: мягкий срок годности (timestamp) и время вычисления в секундах"""
+
+
+def as_cached_value(raw):
+    """CachedValue из значения кэша или None (промах, запись другого формата)"""
+    return raw if isinstance(raw, CachedValue) else None
+
+
+def lock_key(key):
+    return f'lock:{key}'
+
+
+def hard_timeout(timeout, stale_timeout=STALE_TIMEOUT):
+    """TTL записи в кэше: мягкий срок плюс время, когда её можно отдавать устаревшей"""
+    return None if timeout is None else timeout + stale_timeout
+
+
+def record_timeout(record, stale_timeout=STALE_TIMEOUT):
+    """TTL записи в кэше по её мягкому сроку годности"""
+    if math.isinf(record.expires_at):
+        return None
+    return hard_timeout(max(1, math.ceil(record.expires_at - time.time())), stale_timeout)
+
+
+def is_fresh(record, beta=BETA, now=None):
+    """Не пора ли пересчитывать запись (вероятностная проверка XFetch)"""
+    now = time.time() if now is None else now
+    # 1 - random() лежит в (0, 1], логарифм определён
+    return now - record.delta * beta * math.log(1.0 - random.random()) < record.expires_at
+
+
+def compute_record(compute, timeout):
+    """
+    CachedValue с результатом compute().
+
+    timeout - мягкий срок в секундах или функция без аргументов, которая
+    вызывается после compute() (срок, зависящий от данных).
+    """
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    if callable(timeout):
+        timeout = timeout()
+    expires_at = math.inf if timeout is None else time.time() + timeout
+    return CachedValue(value, expires_at, delta)
+
+
+def acquire_lock(cache, key, lock_timeout=LOCK_TIMEOUT):
+    """Токен блокировки пересчёта key или None, если её держит другой воркер"""
+    token = uuid.uuid4().hex
+    return token if cache.add(lock_key(key), token, lock_timeout) else None
+
+
+def release_lock(cache, key, token):
+    # Не снимаем чужую блокировку, если наша уже истекла
+    if cache.get(lock_key(key)) == token:
+        cache.delete(lock_key(key))
+
+
+def wait_for_value(cache, key, wait_timeout=WAIT_TIMEOUT):
+    """Ждёт, пока другой воркер запишет key; CachedValue или None по таймауту"""
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        record = as_cached_value(cache.get(key))
+        if record is not None:
+            return record
+    return None
+
+
+def store(cache, key, record, stale_timeout=STALE_TIMEOUT, stale_key=None):
+    """Записывает key (и копию stale_key) одним set_many"""
+    data = {key: record}
+    if stale_key:
+        data[stale_key] = record
+    cache.set_many(data, record_timeout(record, stale_timeout))
+
+
+def refresh(cache, key, compute, timeout, stale=None, stale_key=None,
+            stale_timeout=STALE_TIMEOUT, lock_timeout=LOCK_TIMEOUT, wait_timeout=WAIT_TIMEOUT):
+    """
+    Пересчитывает key под блокировкой.
+
+    Если пересчитывает другой воркер - отдаёт stale (или копию из stale_key),
+    а без них ждёт его результат. Не дождавшись, считает сам.
+    """
+    token = acquire_lock(cache, key, lock_timeout)
+    if token is None:
+        if stale is None and stale_key:
+            stale = as_cached_value(cache.get(stale_key))
+        if stale is not None:
+            return stale.value
+        record = wait_for_value(cache, key, wait_timeout)
+        if record is not None:
+            return record.value
+        logger.warning(f"Не дождались пересчёта {key}, вычисляем без блокировки")
+        record = compute_record(compute, timeout)
+        store(cache, key, record, stale_timeout, stale_key)
+        return record.value
+
+    try:
+        record = compute_record(compute, timeout)
+        store(cache, key, record, stale_timeout, stale_key)
+        return record.value
+    finally:
+        release_lock(cache, key, token)
+
+
+def get_or_compute(cache, key, compute, timeout, stale_key=None, beta=BETA,
+                   stale_timeout=STALE_TIMEOUT, lock_timeout=LOCK_TIMEOUT, wait_timeout=WAIT_TIMEOUT):
+    """
+    Значение key из cache; при промахе или приближении срока - compute().
+
+    Args:
+        cache: кэш-бэкенд Django
+        key: ключ значения
+        compute: функция без аргументов, вычисляющая значение
+        timeout: мягкий срок годности в секундах (None - бессрочно) или
+            функция, вычисляющая его после compute()
+        stale_key: ключ копии, которую можно отдать, пока key пересчитывается
+            после смены ключа (например, новой версии кэша)
+    """
+    record = as_cached_value(cache.get(key))
+    if record is not None and is_fresh(record, beta):
+        return record.value
+    return refresh(
+        cache, key, compute, timeout, stale=record, stale_key=stale_key,
+        stale_timeout=stale_timeout, lock_timeout=lock_timeout, wait_timeout=wait_timeout,
+    )
@@ -0,0 +1,21 @@
+"""
+Действия после фиксации транзакции.
+
+Сброс кэшей и рассылка инвалидации должны происходить только после
+фиксации записи: иначе параллельный запрос успеет прочитать старые строки и
+сохранить их в кэш под новой версией.
+"""
+from django.db import transaction
+
+
+def after_commit(func, using=None):
+    """
+    Выполняет func после фиксации текущей транзакции, вне транзакции - сразу.
+
+    В отличие от transaction.on_commit(), вне транзакции не открывает
+    соединение с БД: вызывается и из кода, который работает только с кэшем.
+    """
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(func, using=using)
+    else:
+        func()
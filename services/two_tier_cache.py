@@ -0,0 +1,245 @@
+"""
+Двухуровневый кэш: LRU в памяти процесса перед общим кэшем (Redis).
+
+Локально хранятся только версионированные ключи (см. services.cache) и сами
+версии пространств имён. Ключ версионированной записи меняется вместе с
+версией, поэтому локальная копия не может устареть после записи в модель;
+об увеличении версии в другом процессе сообщает шина services.invalidation
+(локальные записи пространства удаляются сразу). Пока подписка на шину не
+активна, версии сверяются с Redis один раз за запрос (CacheVersionSyncMiddleware)
+одним get_many; вне запросов они живут локально не дольше VERSION_TIMEOUT.
+Остальные ключи (сессии, служебные значения) проходят сразу в Redis.
+
+Локальные значения не копируются: объекты из кэша общие для всех запросов
+процесса и не должны изменяться.
+
+Пример настройки:
+    CACHES['two_tier'] = {
+        'BACKEND': 'services.two_tier_cache.TwoTierCache',
+        'LOCATION': 'storefront',
+        'OPTIONS': {'REMOTE_ALIAS': 'default', 'MAX_ENTRIES': 2000},
+    }
+    VERSIONED_CACHE_ALIAS = 'two_tier'
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from services import invalidation
+from services.cache import NAMESPACES, version_key
+
+_MISSING = object()
+
+_NAMESPACE_SEGMENT = re.compile(r'^(%s)\.\d+$' % '|'.join(NAMESPACES))
+_VERSION_KEYS = {version_key(namespace): namespace for namespace in NAMESPACES}
+
+
+def key_namespaces(key):
+    """Пространства имён, версии которых входят в ключ ('catalog.1:pages.2:name')"""
+    namespaces = set()
+    for segment in key.split(':')[:-1]:
+        match = _NAMESPACE_SEGMENT.match(segment)
+        if not match:
+            break
+        namespaces.add(match.group(1))
+    return namespaces
+
+
+class LocalLRU:
+    """Потокобезопасный LRU-словарь ограниченного размера с TTL записей"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Последние виденные версии пространств имён (без TTL)
+        self.known_versions = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout, namespaces=frozenset()):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value, frozenset(namespaces))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def evict_namespaces(self, namespaces):
+        """Удаляет записи, выведенные из указанных пространств имён"""
+        namespaces = set(namespaces)
+        with self._lock:
+            stale = [key for key, (_, _, tags) in self._data.items() if tags & namespaces]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.known_versions.clear()
+
+    def invalidate(self, namespaces):
+        """Обработчик шины инвалидации: версии и записи пространств перечитываются из Redis"""
+        self.evict_namespaces(namespaces)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Локальные хранилища общие для всех потоков процесса (как у LocMemCache)
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+    """Кэш-бэкенд Django: локальный LRU + удалённый кэш REMOTE_ALIAS"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.remote_alias = options.get('REMOTE_ALIAS', 'default')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.version_timeout = options.get('VERSION_TIMEOUT', 5)
+        location = location or 'two-tier'
+        with _stores_lock:
+            if location not in _stores:
+                _stores[location] = LocalLRU(options.get('MAX_ENTRIES', 1000))
+                invalidation.register(f'two_tier:{location}', _stores[location].invalidate)
+            self.local = _stores[location]
+
+    @property
+    def remote(self):
+        return caches[self.remote_alias]
+
+    def _local_key(self, key, version):
+        return self.make_and_validate_key(key, version=version)
+
+    def _local_timeout(self, key, timeout):
+        if key in _VERSION_KEYS:
+            return self.version_timeout
+        timeout = self.get_backend_timeout(timeout)
+        return self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+
+    @staticmethod
+    def _is_local(key):
+        return key in _VERSION_KEYS or bool(key_namespaces(key))
+
+    def _remember(self, key, value, version, timeout=DEFAULT_TIMEOUT):
+        if key in _VERSION_KEYS:
+            self._set_version(key, value, version)
+        elif self._is_local(key):
+            self.local.set(
+                self._local_key(key, version), value,
+                self._local_timeout(key, timeout), key_namespaces(key)
+            )
+
+    def _set_version(self, key, value, version=None):
+        """Запоминает версию; если она изменилась - локальные записи пространства удаляются"""
+        local_key = self._local_key(key, version)
+        previous = self.local.known_versions.get(local_key)
+        if previous is not None and previous != value:
+            self.local.evict_namespaces([_VERSION_KEYS[key]])
+        self.local.known_versions[local_key] = value
+        # Версия помечена своим пространством и удаляется вместе с его записями
+        self.local.set(local_key, value, self.version_timeout, {_VERSION_KEYS[key]})
+
+    def sync_versions(self, version=None):
+        """Сверяет версии всех пространств имён с удалённым кэшем одним запросом"""
+        found = self.remote.get_many(list(_VERSION_KEYS), version=version)
+        for key in _VERSION_KEYS:
+            if key in found:
+                self._set_version(key, found[key], version)
+            else:
+                self.local.delete(self._local_key(key, version))
+        return found
+
+    def get(self, key, default=None, version=None):
+        if self._is_local(key):
+            value = self.local.get(self._local_key(key, version))
+            if value is not _MISSING:
+                return value
+        value = self.remote.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._remember(key, value, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        result = {}
+        remote_keys = []
+        for key in keys:
+            value = self.local.get(self._local_key(key, version)) if self._is_local(key) else _MISSING
+            if value is _MISSING:
+                remote_keys.append(key)
+            else:
+                result[key] = value
+        if remote_keys:
+            found = self.remote.get_many(remote_keys, version=version)
+            for key, value in found.items():
+                self._remember(key, value, version)
+            result.update(found)
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.remote.set(key, value, timeout, version=version)
+        self._remember(key, value, version, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.remote.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, value, version, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.remote.add(key, value, timeout, version=version)
+        if added:
+            self._remember(key, value, version, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.remote.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.remote.incr(key, delta, version=version)
+        if key in _VERSION_KEYS:
+            self._set_version(key, value, version)
+        else:
+            self.local.delete(self._local_key(key, version))
+        return value
+
+    def delete(self, key, version=None):
+        self.local.delete(self._local_key(key, version))
+        return self.remote.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(self._local_key(key, version))
+        self.remote.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self.local.get(self._local_key(key, version)) is not _MISSING:
+            return True
+        return self.remote.has_key(key, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.remote.clear()
@@ -0,0 +1,188 @@
+"""
+Прогрев кэша после деплоя или очистки Redis.
+
+Первые посетители после холодного старта платят за вычисление настроек,
+категорий со счётчиками, рекомендуемых и новых товаров, акций, страниц
+шапки и подвала, миниатюр и самих страниц каталога. warm() делает эту
+работу заранее, по этапам:
+
+    cache      - записи версионированного кэша (services.cache);
+    thumbnails - миниатюры рекомендуемых товаров и категорий меню;
+    pages      - главная, каталог и корневые категории через
+                 внутренний тестовый клиент: прогревает полностраничный кэш и
+                 фрагменты шапки и подвала.
+
+Этапы идут по порядку (страницам нужны уже посчитанные данные), задачи
+внутри этапа - параллельно в пуле потоков. Уже закэшированные значения не
+пересчитываются. Запускается командой warm_cache и, при
+WARM_CACHE_ON_START=1, хуком gunicorn when_ready.
+"""
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+WORKERS = 4
+# Размеры миниатюр из шаблонов (карточка товара, страница товара, мега-меню)
+PRODUCT_THUMBNAILS = ('400x400', '800x800')
+CATEGORY_THUMBNAILS = ('80x80',)
+
+
+class StageResult(namedtuple('StageResult', 'name seconds done failed')):
+    """Итог этапа прогрева: время в секундах, число выполненных и упавших задач"""
+
+
+def _run_task(task):
+    label, func = task
+    try:
+        func()
+        return True
+    except Exception as e:
+        logger.error(f"Прогрев кэша: ошибка в задаче {label}: {e}")
+        return False
+
+
+def _run_pooled_task(task):
+    try:
+        return _run_task(task)
+    finally:
+        # Каждый поток пула открывает своё соединение с БД
+        connections.close_all()
+
+
+def run_parallel(tasks, workers=WORKERS):
+    """
+    Выполняет задачи [(метка, функция), ...] в пуле потоков.
+
+    При workers <= 1 задачи выполняются в текущем потоке.
+
+    Returns:
+        tuple: (выполнено, упало)
+    """
+    if workers <= 1:
+        results = [_run_task(task) for task in tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warm_cache') as pool:
+            results = list(pool.map(_run_pooled_task, tasks))
+    return results.count(True), results.count(False)
+
+
+def cache_tasks():
+    """Записи версионированного кэша, нужные витрине"""
+    from services.context_cache import get_context_entries
+    from services.product_services import CategoryService, ProductService
+
+    tasks = [(f'cache:{entry.name}', entry.get) for entry in get_context_entries()]
+    tasks += [
+        ('cache:active_categories', CategoryService.get_active_categories),
+        ('cache:featured_products', ProductService.get_featured_products),
+        ('cache:new_products', ProductService.get_new_products),
+    ]
+    return tasks
+
+
+def _thumbnail_task(image, geometry):
+    from sorl.thumbnail import get_thumbnail
+
+    return lambda: get_thumbnail(image, geometry, crop='center')
+
+
+def thumbnail_tasks():
+    """Миниатюры рекомендуемых товаров и категорий мега-меню"""
+    from services.product_services import CategoryService, ProductService
+
+    tasks = []
+    for product in ProductService.get_featured_products():
+        if product.image:
+            tasks += [
+                (f'thumbnail:product:{product.pk}:{geometry}', _thumbnail_task(product.image, geometry))
+                for geometry in PRODUCT_THUMBNAILS
+            ]
+    for category in CategoryService.get_categories_with_counts():
+        if category.image:
+            tasks += [
+                (f'thumbnail:category:{category.pk}:{geometry}', _thumbnail_task(category.image, geometry))
+                for geometry in CATEGORY_THUMBNAILS
+            ]
+    return tasks
+
+
+def get_host():
+    """Хост для внутренних запросов: первый конкретный из ALLOWED_HOSTS"""
+    for host in settings.ALLOWED_HOSTS:
+        host = host.lstrip('.')
+        if host and host != '*':
+            return host
+    return 'localhost'
+
+
+def page_urls():
+    """Самые посещаемые страницы каталога"""
+    from services.product_services import CategoryService
+
+    urls = [
+        reverse('mybiz_core:home'),
+        reverse('mybiz_core:product_list'),
+    ]
+    urls += [category.get_absolute_url() for category in CategoryService.get_category_tree()]
+    return urls
+
+
+def _page_task(url):
+    def fetch():
+        from django.test import Client
+
+        # С SECURE_SSL_REDIRECT запрос по http получил бы 301 вместо страницы
+        secure = getattr(settings, 'SECURE_SSL_REDIRECT', False)
+        response = Client(HTTP_HOST=get_host(), raise_request_exception=False).get(url, secure=secure)
+        if response.status_code != 200:
+            raise RuntimeError(f'ответ {response.status_code}')
+
+    return fetch
+
+
+def page_tasks():
+    return [(f'page:{url}', _page_task(url)) for url in page_urls()]
+
+
+STAGES = (
+    ('cache', cache_tasks),
+    ('thumbnails', thumbnail_tasks),
+    ('pages', page_tasks),
+)
+
+
+def warm(stages=None, workers=WORKERS, on_stage=None):
+    """
+    Прогревает кэш по этапам.
+
+    Args:
+        stages: имена этапов из STAGES (None - все)
+        workers: размер пула потоков
+        on_stage: функция, вызываемая с StageResult после каждого этапа
+
+    Returns:
+        list: StageResult по каждому выполненному этапу
+    """
+    results = []
+    for name, get_tasks in STAGES:
+        if stages is not None and name not in stages:
+            continue
+        started = time.monotonic()
+        try:
+            done, failed = run_parallel(get_tasks(), workers)
+        except Exception as e:
+            logger.error(f"Прогрев кэша: не удалось подготовить этап {name}: {e}")
+            done, failed = 0, 1
+        result = StageResult(name, time.monotonic() - started, done, failed)
+        logger.info(f"Прогрев кэша: {name} - {done} задач за {result.seconds:.2f} с, ошибок {failed}")
+        results.append(result)
+        if on_stage is not None:
+            on_stage(result)
+    return results
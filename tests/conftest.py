@@ -11,6 +11,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.development')
 # Инициализация Django
 django.setup()
 
+# Тесты идут в одном процессе: инвалидация локальных кэшей доставляется сразу,
+# без фонового потока шины
+from django.conf import settings
+settings.INVALIDATION_BUS = {'BACKEND': 'services.invalidation.LocalBus'}
+
 
 # Фикстуры для всего проекта
 import pytest
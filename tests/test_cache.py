@@ -0,0 +1,904 @@
+"""
+Тесты кэш-слоя (версионированный и двухуровневый кэш, инвалидация).
+"""
+import asyncio
+import pickle
+import time
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+
+import pytest
+from PIL import Image as PILImage
+from asgiref.sync import sync_to_async
+from django.test import RequestFactory
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import override_settings
+from django.utils import timezone
+
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from content import context_processors
+from content.models import Promotion, SiteSettings
+from mybiz_core.middleware import RequestMemoMiddleware
+from mybiz_core.admin import ProductAdmin
+from mybiz_core.models import Category, Product
+from pages.models import Page
+from mybiz_core.templatetags import social_tags
+from services import cache as versioned
+from services import (
+    cache_records, context_cache, instrumented_cache, invalidation, page_cache, request_memo, warmup,
+)
+from services.cache import (
+    CacheEntry, VersionedCache, catalog_cache, get_or_set_many, pages_cache, promotions_cache,
+)
+from services.product_services import ProductService, PromotionService
+from services.instrumented_cache import key_group
+from services.invalidation import FileBus
+from services.stampede import CachedValue, get_or_compute, lock_key
+from services.two_tier_cache import LocalLRU, key_namespaces
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-cache',
+    }
+}
+
+
+@pytest.fixture
+def active_promotion(db, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    image = SimpleUploadedFile('test_promo.jpg', b'file_content', content_type='image/jpeg')
+    return Promotion.objects.create(
+        title='Акция', description='Описание', image=image, start_date=timezone.now().date()
+    )
+
+
+TWO_TIER_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-remote',
+    },
+    'two_tier': {
+        'BACKEND': 'services.two_tier_cache.TwoTierCache',
+        'LOCATION': 'tests-two-tier',
+        'OPTIONS': {'REMOTE_ALIAS': 'default', 'MAX_ENTRIES': 100},
+    },
+}
+
+
+@pytest.fixture
+def two_tier_cache():
+    """Двухуровневый кэш поверх locmem, используемый версионированным кэшем"""
+    with override_settings(CACHES=TWO_TIER_CACHES, VERSIONED_CACHE_ALIAS='two_tier'):
+        caches['two_tier'].clear()
+        yield caches['two_tier']
+        caches['two_tier'].clear()
+
+
+@pytest.fixture
+def locmem_cache():
+    """Настоящий кэш в памяти вместо DummyCache из настроек разработки"""
+    with override_settings(CACHES=LOCMEM_CACHES):
+        cache.clear()
+        yield
+        cache.clear()
+
+
+@pytest.mark.usefixtures('locmem_cache')
+class TestVersionedCache:
+    """Тесты версионированного кэша"""
+
+    def test_bump_invalidates_namespace(self):
+        catalog_cache.set('value', 1, 60)
+        pages_cache.set('value', 2, 60)
+        versioned.bump('catalog')
+        assert catalog_cache.get('value') is None
+        assert pages_cache.get('value') == 2
+
+    @pytest.mark.django_db
+    def test_bump_deferred_until_commit(self, category, django_capture_on_commit_callbacks):
+        """Запись в транзакции увеличивает версию только после фиксации"""
+        from django.db import transaction
+
+        catalog_cache.set('value', 1, 60)
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                category.name = 'Новое название'
+                category.save()
+                assert catalog_cache.get('value') == 1
+        assert catalog_cache.get('value') is None
+
+    def test_multi_namespace_key(self):
+        combined = VersionedCache('catalog', 'pages')
+        combined.set('value', 1, 60)
+        versioned.bump('pages')
+        assert combined.get('value') is None
+
+    def test_get_or_set_computes_once(self):
+        calls = []
+        for _ in range(3):
+            catalog_cache.get_or_set('value', lambda: calls.append(1) or len(calls), 60)
+        assert calls == [1]
+
+    def test_evicted_version_does_not_resurrect_old_entries(self):
+        catalog_cache.set('value', 'old', 60)
+        old_version = versioned.get_versions(['catalog'])['catalog']
+        cache.delete(versioned.version_key('catalog'))
+        time.sleep(0.001)
+        assert versioned.get_versions(['catalog'])['catalog'] > old_version
+        assert catalog_cache.get('value') is None
+
+    def test_unknown_namespace(self):
+        with pytest.raises(ValueError):
+            VersionedCache('unknown')
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('locmem_cache')
+class TestModelInvalidation:
+    """Запись в модели сбрасывает выведенный из них кэш"""
+
+    def test_save_invalidates_catalog(self, product, django_capture_on_commit_callbacks):
+        assert ProductService.get_featured_products() == []
+        product.is_featured = True
+        with django_capture_on_commit_callbacks(execute=True):
+            product.save()
+        assert ProductService.get_featured_products() == [product]
+
+    def test_queryset_update_invalidates_catalog(self, product, django_capture_on_commit_callbacks):
+        assert ProductService.get_featured_products() == []
+        with django_capture_on_commit_callbacks(execute=True):
+            Product.objects.filter(pk=product.pk).update(is_featured=True)
+        assert ProductService.get_featured_products() == [product]
+
+    def test_queryset_delete_invalidates_catalog(self, product, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            Product.objects.filter(pk=product.pk).update(is_featured=True)
+        assert ProductService.get_featured_products() == [product]
+        with django_capture_on_commit_callbacks(execute=True):
+            Product.objects.all().delete()
+        assert ProductService.get_featured_products() == []
+
+    def test_promotions_update(self, active_promotion, django_capture_on_commit_callbacks):
+        assert PromotionService.get_active_promotions() == [active_promotion]
+        with django_capture_on_commit_callbacks(execute=True):
+            Promotion.objects.update(is_active=False)
+        assert PromotionService.get_active_promotions() == []
+
+    def test_pages_update(self, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            page = Page.objects.create(title='О нас', slug='about', content='Текст', show_in_header=True)
+        assert Page.get_header_pages() == [page]
+        with django_capture_on_commit_callbacks(execute=True):
+            Page.objects.update(show_in_header=False)
+        assert Page.get_header_pages() == []
+
+    def test_site_settings_save_bumps_dependent_namespaces(self, site_settings, django_capture_on_commit_callbacks):
+        before = versioned.get_versions(versioned.NAMESPACES)
+        site_settings.site_name = 'Новое имя'
+        with django_capture_on_commit_callbacks(execute=True):
+            site_settings.save()
+        after = versioned.get_versions(versioned.NAMESPACES)
+        assert after['catalog'] == before['catalog']
+        assert all(after[name] > before[name] for name in ('settings', 'promotions', 'pages'))
+        assert SiteSettings.load().site_name == 'Новое имя'
+
+    def test_unrelated_namespace_kept(self, product, active_promotion):
+        PromotionService.get_active_promotions()
+        key = promotions_cache.make_key('active_promotions')
+        product.save()
+        assert cache.get(key).value == [active_promotion]
+
+
+class TestLocalLRU:
+    """Тесты локального LRU"""
+
+    def test_bounded(self):
+        lru = LocalLRU(max_entries=2)
+        lru.set('a', 1, 60)
+        lru.set('b', 2, 60)
+        lru.get('a')
+        lru.set('c', 3, 60)
+        assert lru.get('a') == 1
+        assert lru.get('c') == 3
+        assert len(lru) == 2
+
+    def test_ttl(self):
+        lru = LocalLRU(max_entries=10)
+        lru.set('a', 1, -1)
+        lru.get('a')
+        assert len(lru) == 0
+
+    def test_evict_namespaces(self):
+        lru = LocalLRU(max_entries=10)
+        lru.set('a', 1, 60, {'catalog'})
+        lru.set('b', 2, 60, {'pages'})
+        assert lru.evict_namespaces(['catalog']) == 1
+        assert lru.get('b') == 2
+
+    def test_key_namespaces(self):
+        assert key_namespaces('catalog.12:pages.3:name') == {'catalog', 'pages'}
+        assert key_namespaces('session:catalog.12') == set()
+
+
+class TestTwoTierCache:
+    """Тесты двухуровневого кэша"""
+
+    def test_versioned_keys_served_locally(self, two_tier_cache):
+        catalog_cache.set('value', 'local', 60)
+        caches['default'].clear()
+        assert two_tier_cache.get(catalog_cache.make_key('value')).value == 'local'
+
+    def test_other_keys_go_to_remote(self, two_tier_cache):
+        two_tier_cache.set('session_key', 'value', 60)
+        caches['default'].delete('session_key')
+        assert two_tier_cache.get('session_key') is None
+
+    def test_remote_version_change_evicts_local_entries(self, two_tier_cache):
+        calls = []
+        load = lambda: calls.append(1) or len(calls)
+        assert catalog_cache.get_or_set('value', load, 60) == 1
+        # Другой воркер увеличил версию напрямую в Redis
+        caches['default'].incr(versioned.version_key('catalog'))
+        two_tier_cache.sync_versions()
+        assert len(two_tier_cache.local) == 1  # осталась только версия каталога
+        assert catalog_cache.get_or_set('value', load, 60) == 2
+
+    def test_context_data_without_remote_round_trips(self, two_tier_cache, db, site_settings):
+        SiteSettings.load()
+        two_tier_cache.sync_versions()
+        remote = caches['default']
+        remote.get = remote.get_many = lambda *args, **kwargs: pytest.fail('запрос к удалённому кэшу')
+        try:
+            assert SiteSettings.load().pk == site_settings.pk
+        finally:
+            del remote.get, remote.get_many
+
+    @pytest.mark.django_db
+    def test_request_syncs_versions(self, two_tier_cache, client, site_settings):
+        caches['default'].set(versioned.version_key('pages'), 42, None)
+        client.get('/')
+        assert two_tier_cache.local.get(two_tier_cache.make_and_validate_key(versioned.version_key('pages'))) == 42
+
+    @pytest.mark.django_db
+    def test_local_write_visible_immediately(self, two_tier_cache, product, django_capture_on_commit_callbacks):
+        assert ProductService.get_featured_products() == []
+        with django_capture_on_commit_callbacks(execute=True):
+            Product.objects.filter(pk=product.pk).update(is_featured=True)
+        assert ProductService.get_featured_products() == [product]
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def received():
+    """Обработчик шины, запоминающий полученные пространства имён"""
+    calls = []
+    invalidation.register('tests', calls.append, ('catalog',))
+    yield calls
+    invalidation.unregister('tests')
+
+
+class TestInvalidationBus:
+    """Тесты шины инвалидации локальных кэшей"""
+
+    def test_bump_notifies_interested_handlers(self, received):
+        versioned.bump('pages')
+        assert received == []
+        versioned.bump('catalog', 'pages')
+        assert received == [{'catalog', 'pages'}]
+
+    @pytest.mark.django_db
+    def test_publish_deferred_until_commit(self, received, django_capture_on_commit_callbacks):
+        from django.db import transaction
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                invalidation.publish('catalog')
+                assert received == []
+        assert received == [{'catalog'}]
+
+    def test_svg_cache_cleared_on_settings_change(self, site_settings, django_capture_on_commit_callbacks):
+        social_tags._svg_cache['telegram'] = '<svg/>'
+        with django_capture_on_commit_callbacks(execute=True):
+            site_settings.save()
+        assert social_tags._svg_cache == {}
+
+    def test_two_tier_evicts_namespace_on_message(self, two_tier_cache):
+        calls = []
+        load = lambda: calls.append(1) or len(calls)
+        assert catalog_cache.get_or_set('value', load, 60) == 1
+        # Другой воркер увеличил версию и сообщил об этом через шину
+        caches['default'].incr(versioned.version_key('catalog'))
+        invalidation.dispatch({'catalog'})
+        assert len(two_tier_cache.local) == 0
+        assert catalog_cache.get_or_set('value', load, 60) == 2
+
+    def test_file_bus_delivers_to_other_process(self, tmp_path, received):
+        options = {'PATH': str(tmp_path / 'bus.log'), 'POLL_INTERVAL': 0.01}
+        publisher, subscriber = FileBus(options), FileBus(options)
+        subscriber.ensure_started()
+        try:
+            assert wait_for(lambda: subscriber.is_listening)
+            publisher.publish(('catalog',))
+            # Сразу в процессе публикации и ещё раз - из подписки "другого процесса"
+            assert wait_for(lambda: len(received) == 2)
+        finally:
+            subscriber.stop()
+
+    def test_file_bus_skips_own_messages(self, tmp_path, received):
+        bus = FileBus({'PATH': str(tmp_path / 'bus.log'), 'POLL_INTERVAL': 0.01})
+        bus.ensure_started()
+        try:
+            assert wait_for(lambda: bus.is_listening)
+            bus.publish(('catalog',))
+            time.sleep(0.1)
+            assert received == [{'catalog'}]
+        finally:
+            bus.stop()
+
+    @pytest.mark.django_db
+    def test_listening_worker_does_not_poll_versions(self, tmp_path, two_tier_cache, client, site_settings):
+        bus_settings = {'BACKEND': 'services.invalidation.FileBus',
+                        'OPTIONS': {'PATH': str(tmp_path / 'bus.log'), 'POLL_INTERVAL': 0.01}}
+        with override_settings(INVALIDATION_BUS=bus_settings):
+            client.get('/')
+            assert wait_for(lambda: invalidation.get_bus().is_listening)
+            caches['default'].set(versioned.version_key('pages'), 42, None)
+            client.get('/')
+            local_key = two_tier_cache.make_and_validate_key(versioned.version_key('pages'))
+            assert two_tier_cache.local.get(local_key) != 42
+
+
+class TestContextPrefetch:
+    """Тесты общей выборки кэша для контекст-процессоров"""
+
+    def entries(self, calls):
+        def compute(name):
+            return lambda: calls.append(name) or name.upper()
+        return [
+            CacheEntry(catalog_cache, 'a', compute('a'), 60),
+            CacheEntry(pages_cache, 'b', compute('b'), 60),
+            CacheEntry(promotions_cache, 'c', compute('c'), 300),
+        ]
+
+    def test_computes_only_misses(self, locmem_cache):
+        calls = []
+        pages_cache.set('b', 'cached', 60)
+        values, stats = get_or_set_many(self.entries(calls))
+        assert values == {'a': 'A', 'b': 'cached', 'c': 'C'}
+        assert calls == ['a', 'c']
+        assert (stats['hits'], stats['misses']) == (1, 2)
+
+    def test_only_requested_misses_computed(self, locmem_cache):
+        calls = []
+        values, stats = get_or_set_many(self.entries(calls), compute={'b'})
+        assert values == {'b': 'B'}
+        assert calls == ['b']
+        assert stats['deferred'] == 2
+
+    def test_two_round_trips_when_warm(self, locmem_cache):
+        calls = []
+        get_or_set_many(self.entries(calls))
+        values, stats = get_or_set_many(self.entries(calls))
+        assert values == {'a': 'A', 'b': 'B', 'c': 'C'}
+        assert len(calls) == 3
+        assert stats['round_trips'] == 2
+        assert stats['sequential_round_trips'] == 6
+
+    def test_locks_released_when_compute_fails(self, locmem_cache):
+        def fail():
+            raise ValueError('ошибка')
+
+        entries = [CacheEntry(catalog_cache, 'a', lambda: 'A', 60), CacheEntry(pages_cache, 'b', fail, 60)]
+        with pytest.raises(ValueError):
+            get_or_set_many(entries)
+        assert cache.get(lock_key(catalog_cache.make_key('a'))) is None
+        assert cache.get(lock_key(pages_cache.make_key('b'))) is None
+
+    def test_foreign_lock_kept(self, locmem_cache):
+        key = lock_key(catalog_cache.make_key('a'))
+
+        def compute():
+            # Наша блокировка истекла, и её взял другой воркер
+            cache.set(key, 'other', 60)
+            return 'A'
+
+        get_or_set_many([CacheEntry(catalog_cache, 'a', compute, 60)])
+        assert cache.get(key) == 'other'
+
+    @pytest.mark.django_db
+    def test_page_render_reports_saved_round_trips(self, locmem_cache, client, site_settings):
+        client.get('/')
+        response = client.get('/')
+        assert response['X-Context-Cache'] == 'keys=5; misses=0; round-trips=2; saved=8'
+
+
+class TestRequestMemo:
+    """Тесты мемоизации в пределах запроса"""
+
+    def counter(self):
+        calls = []
+        return calls, lambda: calls.append(1) or len(calls)
+
+    def test_no_memo_outside_request(self):
+        calls, compute = self.counter()
+        request_memo.memoize('key', compute)
+        assert request_memo.memoize('key', compute) == 2
+
+    def test_value_computed_once_per_scope(self):
+        calls, compute = self.counter()
+        with request_memo.request_scope():
+            request_memo.memoize('key', compute)
+            assert request_memo.memoize('key', compute) == 1
+        with request_memo.request_scope():
+            assert request_memo.memoize('key', compute) == 2
+
+    def test_site_settings_read_once(self, locmem_cache, site_settings, django_assert_num_queries):
+        with request_memo.request_scope():
+            SiteSettings.load()
+            cache.clear()
+            with django_assert_num_queries(0):
+                assert SiteSettings.load().pk == site_settings.pk
+
+    def test_write_forgets_memoized_values(self, locmem_cache, site_settings, django_capture_on_commit_callbacks):
+        with request_memo.request_scope():
+            assert SiteSettings.load().site_name == site_settings.site_name
+            site_settings.site_name = 'Новое название'
+            with django_capture_on_commit_callbacks(execute=True):
+                site_settings.save()
+            assert SiteSettings.load().site_name == 'Новое название'
+
+    def test_shared_with_sync_code_in_async_view(self):
+        calls, compute = self.counter()
+
+        async def view(request):
+            request_memo.memoize('key', compute)
+            return await sync_to_async(request_memo.memoize)('key', compute)
+
+        middleware = RequestMemoMiddleware(view)
+        assert asyncio.run(middleware(None)) == 1
+        assert calls == [1]
+
+
+@pytest.mark.usefixtures('locmem_cache')
+class TestStampedeProtection:
+    """Тесты защиты от одновременного пересчёта"""
+
+    def counter(self):
+        calls = []
+        return calls, lambda: calls.append(1) or len(calls)
+
+    def test_fresh_value_not_recomputed(self):
+        calls, compute = self.counter()
+        get_or_compute(cache, 'key', compute, 60)
+        assert get_or_compute(cache, 'key', compute, 60) == 1
+
+    def test_expired_value_recomputed(self):
+        calls, compute = self.counter()
+        cache.set('key', CachedValue('old', time.time() - 1, 0.0), 60)
+        assert get_or_compute(cache, 'key', compute, 60) == 1
+        assert cache.get(lock_key('key')) is None
+
+    def test_early_recomputation_near_expiry(self):
+        calls, compute = self.counter()
+        # До срока секунда, а вычисление занимает минуту - пересчёт почти наверняка
+        cache.set('key', CachedValue('old', time.time() + 1, 60.0), 60)
+        assert get_or_compute(cache, 'key', compute, 60) == 1
+
+    def test_stale_value_served_while_locked(self):
+        calls, compute = self.counter()
+        cache.set('key', CachedValue('old', time.time() - 1, 0.0), 60)
+        cache.add(lock_key('key'), 'other-worker', 10)
+        assert get_or_compute(cache, 'key', compute, 60) == 'old'
+        assert calls == []
+
+    def test_stale_copy_served_after_version_bump(self):
+        calls, compute = self.counter()
+        catalog_cache.get_or_set('value', compute, 60)
+        versioned.bump('catalog')
+        cache.add(lock_key(catalog_cache.make_key('value')), 'other-worker', 10)
+        assert catalog_cache.get_or_set('value', compute, 60) == 1
+        assert calls == [1]
+
+    def test_waits_for_other_worker_on_cold_miss(self, monkeypatch):
+        calls, compute = self.counter()
+        cache.add(lock_key('key'), 'other-worker', 10)
+        monkeypatch.setattr('services.stampede.WAIT_INTERVAL', 0.01)
+        # "Другой воркер" записывает значение, пока мы ждём
+        original_sleep = time.sleep
+        monkeypatch.setattr('services.stampede.time.sleep', lambda seconds: (
+            cache.set('key', CachedValue('computed', time.time() + 60, 0.0), 60), original_sleep(seconds)
+        ))
+        assert get_or_compute(cache, 'key', compute, 60) == 'computed'
+        assert calls == []
+
+
+class TestLazyContext:
+    """Тесты ленивых контекст-процессоров и отчёта об использовании"""
+
+    @pytest.fixture(autouse=True)
+    def clean_report(self):
+        context_cache.reset_usage_report()
+        yield
+        context_cache.reset_usage_report()
+
+    def test_no_queries_until_template_access(self, active_promotion, django_assert_num_queries):
+        request = RequestFactory().get('/')
+        with django_assert_num_queries(0):
+            promotions = context_processors.promotions(request)['promotions']
+        assert list(promotions) == [active_promotion]
+
+    @pytest.mark.django_db
+    def test_unused_values_reported(self, client, product, site_settings):
+        response = client.get(product.get_absolute_url())
+        used, unused = response['X-Context-Usage'].split('; ')
+        assert 'site_settings' in used
+        assert 'promotions' in unused
+
+    @pytest.mark.django_db
+    def test_usage_report_per_view(self, client, site_settings):
+        client.get('/')
+        client.get('/')
+        report = context_cache.get_usage_report()['mybiz_core:home']
+        assert report['requests'] == 2
+        assert report['usage']['promotions'] == 1.0
+
+
+@pytest.fixture
+def page_cache_enabled(locmem_cache):
+    with override_settings(PAGE_CACHE_ENABLED=True):
+        yield
+
+
+@pytest.mark.usefixtures('page_cache_enabled')
+class TestPageCache:
+    """Тесты полностраничного кэша"""
+
+    @pytest.fixture
+    def other_product(self, db):
+        other = Category.objects.create(name='Другая', slug='other', is_active=True)
+        return Product.objects.create(
+            name='Другой товар', slug='other-product', category=other, price=500, sku='OTHER-1'
+        )
+
+    def get(self, client, url):
+        response = client.get(url)
+        assert response.status_code == 200
+        return response['X-Page-Cache']
+
+    def test_anonymous_page_served_from_cache(self, client, product, site_settings, django_assert_num_queries):
+        url = product.get_absolute_url()
+        assert self.get(client, url) == 'MISS'
+        with django_assert_num_queries(0):
+            assert self.get(client, url) == 'HIT'
+
+    def test_query_string_normalized(self, client, product, site_settings):
+        self.get(client, '/products/?sort=price&q=')
+        assert self.get(client, '/products/?utm_source=mail&sort=price') == 'HIT'
+
+    def test_authenticated_user_bypasses_cache(self, client, user, product, site_settings):
+        client.force_login(user)
+        client.get(product.get_absolute_url())
+        assert 'X-Page-Cache' not in client.get(product.get_absolute_url())
+
+    def test_product_change_purges_its_pages(self, client, product, site_settings, django_capture_on_commit_callbacks):
+        self.get(client, product.get_absolute_url())
+        product.price = 2000
+        with django_capture_on_commit_callbacks(execute=True):
+            product.save()
+        assert self.get(client, product.get_absolute_url()) == 'MISS'
+
+    def test_purge_deferred_until_commit(self, client, product, site_settings, django_capture_on_commit_callbacks):
+        """Страница, запрошенная до фиксации записи, устаревает после неё"""
+        from django.db import transaction
+
+        url = product.get_absolute_url()
+        self.get(client, url)
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                product.price = 2000
+                product.save()
+                assert self.get(client, url) == 'HIT'
+        assert self.get(client, url) == 'MISS'
+
+    def test_unrelated_product_change_keeps_page(self, client, product, other_product, site_settings):
+        self.get(client, product.get_absolute_url())
+        other_product.price = 700
+        other_product.save()
+        assert self.get(client, product.get_absolute_url()) == 'HIT'
+
+    def test_admin_bulk_action_purges_pages(self, client, product, site_settings, django_capture_on_commit_callbacks):
+        self.get(client, product.get_absolute_url())
+        with django_capture_on_commit_callbacks(execute=True):
+            ProductAdmin(Product, admin.site)._bulk_update(Product.objects.filter(pk=product.pk), is_featured=True)
+        assert self.get(client, product.get_absolute_url()) == 'MISS'
+
+    def test_promotion_admin_action_purges_pages(self, client, rf, active_promotion, site_settings,
+                                                 django_capture_on_commit_callbacks):
+        from django.contrib.messages.storage.fallback import FallbackStorage
+        from content.admin import PromotionAdmin
+
+        assert self.get(client, '/') == 'MISS'
+        assert 'Акция' in client.get('/').content.decode()
+        request = rf.post('/admin/content/promotion/')
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        with django_capture_on_commit_callbacks(execute=True):
+            PromotionAdmin(Promotion, admin.site).deactivate_promotions(
+                request, Promotion.objects.filter(pk=active_promotion.pk)
+            )
+        response = client.get('/')
+        assert response['X-Page-Cache'] == 'MISS'
+        assert 'Акция' not in response.content.decode()
+
+    def test_csrf_token_not_shared_between_visitors(self):
+        @page_cache.cache_page_for_anonymous
+        def view(request):
+            return HttpResponse(f'<input name="csrfmiddlewaretoken" value="{get_token(request)}">')
+
+        def request():
+            request = RequestFactory().get('/form/')
+            request.user = AnonymousUser()
+            return request
+
+        first = view(request()).content
+        second = view(request())
+        assert second['X-Page-Cache'] == 'HIT'
+        assert page_cache.CSRF_PLACEHOLDER.encode() not in second.content
+        assert second.content != first
+
+    def test_stats(self, client, product, site_settings, django_capture_on_commit_callbacks):
+        page_cache.reset_stats()
+        self.get(client, product.get_absolute_url())
+        self.get(client, product.get_absolute_url())
+        with django_capture_on_commit_callbacks(execute=True):
+            product.save()
+        stats = page_cache.get_stats()
+        assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+        assert stats['purges']['product'] == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('locmem_cache')
+class TestFragmentCache:
+    """Тесты кэширования фрагментов шапки и подвала"""
+
+    def render(self, source, **context):
+        return Template('{% load fragment_cache %}' + source).render(Context(context))
+
+    def test_fragment_rendered_once(self):
+        calls = []
+        source = '{% versioned_cache "menu" "catalog" %}{{ load }}{% endversioned_cache %}'
+        assert self.render(source, load=lambda: calls.append(1) or 'меню') == 'меню'
+        assert self.render(source, load=lambda: calls.append(1) or 'другое') == 'меню'
+        assert len(calls) == 1
+
+    def test_version_bump_rerenders(self, django_capture_on_commit_callbacks):
+        source = '{% versioned_cache "menu" "catalog" %}{{ value }}{% endversioned_cache %}'
+        self.render(source, value='старое')
+        with django_capture_on_commit_callbacks(execute=True):
+            catalog_cache.bump()
+        assert self.render(source, value='новое') == 'новое'
+
+    def test_unknown_namespace(self):
+        with pytest.raises(TemplateSyntaxError):
+            self.render('{% versioned_cache "menu" "unknown" %}{% endversioned_cache %}')
+
+    def test_header_menu_shared_and_invalidated(self, client, category, site_settings,
+                                                django_capture_on_commit_callbacks):
+        client.get('/')
+        category.name = 'Новое имя'
+        with django_capture_on_commit_callbacks(execute=True):
+            category.save()
+        response = client.get('/products/')
+        assert 'Новое имя' in response.content.decode()
+
+    def test_settings_change_updates_footer(self, client, site_settings, django_capture_on_commit_callbacks):
+        client.get('/')
+        site_settings.contact_email = 'new@example.com'
+        with django_capture_on_commit_callbacks(execute=True):
+            site_settings.save()
+        assert 'new@example.com' in client.get('/').content.decode()
+
+
+@pytest.mark.django_db
+class TestWarmup:
+    """Тесты прогрева кэша"""
+
+    def test_cache_stage_fills_entries(self, locmem_cache, product, site_settings, django_assert_num_queries):
+        product.is_featured = True
+        product.save()
+        [result] = warmup.warm(stages=['cache'], workers=1)
+        assert (result.name, result.failed) == ('cache', 0)
+        with django_assert_num_queries(0):
+            assert ProductService.get_featured_products() == [product]
+
+    def test_pages_stage_fills_page_cache(self, page_cache_enabled, client, product, site_settings):
+        [result] = warmup.warm(stages=['pages'], workers=1)
+        assert result.failed == 0
+        assert result.done == 3  # главная, каталог и корневая категория
+        assert client.get('/')['X-Page-Cache'] == 'HIT'
+
+    def test_pages_stage_behind_ssl_redirect(self, page_cache_enabled, product, site_settings):
+        """С SECURE_SSL_REDIRECT страницы запрашиваются по https, а не получают 301"""
+        with override_settings(SECURE_SSL_REDIRECT=True):
+            [result] = warmup.warm(stages=['pages'], workers=1)
+        assert (result.done, result.failed) == (3, 0)
+
+    def test_failed_tasks_counted(self):
+        def fail():
+            raise RuntimeError('ошибка')
+
+        assert warmup.run_parallel([('ok', lambda: None), ('fail', fail)], workers=2) == (1, 1)
+
+    def test_command_reports_stages(self, locmem_cache, site_settings):
+        out = StringIO()
+        call_command('warm_cache', '--stage', 'cache', '--workers', '1', stdout=out)
+        assert 'cache:' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestCacheRecords:
+    """Тесты компактных записей кэша"""
+
+    @pytest.fixture
+    def featured_product(self, product, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        buffer = BytesIO()
+        PILImage.new('RGB', (10, 10), 'red').save(buffer, 'PNG')
+        product.image = SimpleUploadedFile('record.png', buffer.getvalue(), content_type='image/png')
+        product.description = '<p>Описание из редактора</p>' * 200
+        product.is_featured = True
+        product.save()
+        return product
+
+    def test_record_behaves_like_instance(self, featured_product):
+        [record] = ProductService.get_featured_products()
+        assert record == featured_product
+        assert record.get_absolute_url() == featured_product.get_absolute_url()
+        assert record.category.name == featured_product.category.name
+        assert record.image.url == featured_product.image.url
+
+    def test_payload_smaller_than_instance(self, featured_product):
+        [record] = ProductService.load_featured_products()
+        assert pickle.loads(pickle.dumps(record)).values() == record.values()
+        assert cache_records.payload_size(record) * 5 < cache_records.payload_size(featured_product)
+
+    def test_home_renders_records(self, client, featured_product, site_settings):
+        page = Page.objects.create(title='О компании', slug='about', show_in_header=True)
+        content = client.get('/').content.decode()
+        assert featured_product.get_absolute_url() in content
+        assert '/media/cache/' in content  # миниатюра из ImageRef
+        assert page.title in content
+
+    def test_schema_version_in_key(self):
+        assert f':r{cache_records.SCHEMA_VERSION}:' in catalog_cache.make_key('value')
+
+    def test_payload_report_command(self, featured_product):
+        out = StringIO()
+        call_command('cache_payloads', stdout=out)
+        assert 'featured_products (1 шт.)' in out.getvalue()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('locmem_cache')
+class TestPromotionTimeout:
+    """Тесты срока кэша акций до ближайшей смены дат"""
+
+    def create(self, title, start, end=None):
+        today = timezone.localdate()
+        return Promotion.objects.create(
+            title=title, description='Описание',
+            start_date=today + timedelta(days=start),
+            end_date=None if end is None else today + timedelta(days=end),
+        )
+
+    def test_next_change_is_nearest_boundary(self):
+        today = timezone.localdate()
+        self.create('Идёт до завтра', -1, 1)
+        self.create('Начнётся через 3 дня', 3)
+        assert PromotionService.next_change_date() == today + timedelta(days=2)
+
+    def test_hold_for_max_timeout_when_nothing_scheduled(self, settings):
+        settings.PROMOTIONS_CACHE_MAX_TIMEOUT = 7200
+        self.create('Бессрочная', -1)
+        assert PromotionService.seconds_until_change() == 7200
+
+    def test_cached_set_expires_at_midnight(self, settings):
+        settings.PROMOTIONS_CACHE_MAX_TIMEOUT = 2 * 24 * 3600
+        self.create('Заканчивается сегодня', -1, 0)
+        PromotionService.get_active_promotions()
+        record = cache.get(promotions_cache.make_key('active_promotions'))
+        midnight = datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time())
+        assert record.expires_at == pytest.approx(timezone.make_aware(midnight).timestamp(), abs=2)
+
+    def test_api_serves_cached_set(self, client):
+        active = self.create('Активная', -1)
+        self.create('Закончилась', -5, -1)
+        cached = PromotionService.get_active_promotions()
+        response = client.get('/api/promotions/')
+        assert [item['id'] for item in response.json()['results']] == [active.pk] == [p.pk for p in cached]
+
+
+INSTRUMENTED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-instrumented',
+    },
+    'storefront': {
+        'BACKEND': 'services.instrumented_cache.InstrumentedCache',
+        'OPTIONS': {'TARGET_ALIAS': 'default'},
+    },
+}
+
+
+@pytest.fixture
+def instrumented_cache_alias():
+    """Версионированный кэш через InstrumentedCache, метрики в locmem"""
+    with override_settings(CACHES=INSTRUMENTED_CACHES, VERSIONED_CACHE_ALIAS='storefront'):
+        caches['default'].clear()
+        instrumented_cache.reset_metrics()
+        yield
+        instrumented_cache.reset_metrics()
+        caches['default'].clear()
+
+
+class TestInstrumentedCache:
+    """Тесты метрик кэша по группам ключей"""
+
+    @pytest.mark.parametrize('key, group', [
+        ('catalog.1718000000123456:r1:featured_products_8', 'featured_products'),
+        ('promotions.1:r1:active_promotions', 'active_promotions'),
+        ('stale:r1:catalog:featured_products_8', 'stale:featured_products'),
+        ('lock:settings.5:r1:site_settings', 'lock:site_settings'),
+        ('cache_version:catalog', 'cache_version'),
+        ('page_tag:settings', 'page_tag'),
+    ])
+    def test_key_group(self, key, group):
+        assert key_group(key) == group
+
+    @pytest.mark.django_db
+    def test_hits_misses_and_bytes(self, instrumented_cache_alias, product):
+        product.is_featured = True
+        product.save()
+        ProductService.get_featured_products()
+        with request_memo.request_scope():
+            ProductService.get_featured_products()
+        stats = instrumented_cache.get_metrics()['featured_products']
+        assert (stats['hits'], stats['misses'], stats['sets']) == (1, 1, 1)
+        assert stats['avg_bytes'] > 0
+        assert stats['avg_ms'] >= 0
+
+    @pytest.mark.django_db
+    def test_endpoint_for_staff_only(self, instrumented_cache_alias, client, user):
+        SiteSettings.load()
+        assert client.get('/api/cache-metrics/').status_code in (401, 403)
+        user.is_staff = True
+        user.save()
+        client.force_login(user)
+        response = client.get('/api/cache-metrics/')
+        assert response.status_code == 200
+        assert 'site_settings' in response.json()['groups']
+
+    @pytest.mark.django_db
+    def test_command(self, instrumented_cache_alias):
+        SiteSettings.load()
+        out = StringIO()
+        call_command('cache_metrics', '--reset', stdout=out)
+        assert 'site_settings:' in out.getvalue()
+        assert instrumented_cache.get_metrics() == {}
@@ -2,9 +2,11 @@
 Тесты для моделей mybiz_core.
 """
 import pytest
-from django.db import IntegrityError
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.text import slugify
-from mybiz_core.models import Category, Product
+from mybiz_core.models import Category, CategoryStats, Product
 
 
 @pytest.mark.django_db
@@ -65,6 +67,237 @@ class TestCategoryModel:
         assert grandchild.pk in descendants_ids
 
 
+@pytest.mark.django_db
+class TestCategoryTree:
+    """Тесты материализованного пути категорий"""
+
+    @pytest.fixture
+    def tree(self, category):
+        """category -> child -> grandchild, плюс отдельный корень other"""
+        child = Category.objects.create(name='Дочерняя', slug='tree-child', parent=category)
+        grandchild = Category.objects.create(name='Внучатая', slug='tree-grandchild', parent=child)
+        other = Category.objects.create(name='Другой корень', slug='tree-other')
+        return category, child, grandchild, other
+
+    def test_paths_and_depth(self, tree):
+        """Путь строится от корня, глубина считается от нуля"""
+        root, child, grandchild, _ = tree
+        assert root.path == f'/{root.pk}/'
+        assert grandchild.path == f'/{root.pk}/{child.pk}/{grandchild.pk}/'
+        assert (root.depth, child.depth, grandchild.depth) == (0, 1, 2)
+
+    def test_lookups_take_one_query(self, tree):
+        """Потомки, предки и хлебные крошки - по одному запросу"""
+        root, child, grandchild, _ = tree
+        with CaptureQueriesContext(connection) as queries:
+            assert set(root.get_descendants_ids()) == {child.pk, grandchild.pk}
+        assert len(queries) == 1
+        with CaptureQueriesContext(connection) as queries:
+            assert grandchild.get_breadcrumbs() == [root, child, grandchild]
+        assert len(queries) == 1
+
+    def test_move_subtree(self, tree):
+        """Перенос поддерева обновляет пути и глубину всех потомков"""
+        root, child, grandchild, other = tree
+        child.parent = other
+        child.save()
+        grandchild.refresh_from_db()
+        assert grandchild.path == f'/{other.pk}/{child.pk}/{grandchild.pk}/'
+        assert grandchild.depth == 2
+        assert root.get_descendants_ids() == []
+
+        child.parent = None
+        child.save()
+        grandchild.refresh_from_db()
+        assert grandchild.path == f'/{child.pk}/{grandchild.pk}/'
+        assert grandchild.depth == 1
+
+    def test_failed_move_is_rolled_back(self, tree, monkeypatch):
+        """Ошибка на любом шаге переноса не оставляет поддерево с частично обновлёнными путями"""
+        from mybiz_core.models import CategoryStats
+
+        root, child, grandchild, other = tree
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('сбой')
+
+        monkeypatch.setattr(CategoryStats, 'move_subtree', fail)
+        child.parent = other
+        with pytest.raises(RuntimeError):
+            child.save()
+        grandchild.refresh_from_db()
+        assert grandchild.path == f'/{root.pk}/{child.pk}/{grandchild.pk}/'
+        assert Category.objects.get(pk=child.pk).parent_id == root.pk
+
+    def test_empty_paths_are_rebuilt(self, tree):
+        """Пустые пути (loaddata) пересчитываются, а не выбирают всё дерево по пустому префиксу"""
+        root, child, grandchild, other = tree
+        Category._base_manager.filter(pk__in=[root.pk, child.pk, grandchild.pk]).update(path='', depth=0)
+        child.refresh_from_db()
+        assert child.get_descendants_ids() == []
+
+        child.parent = other
+        child.save()
+        grandchild.refresh_from_db()
+        other.refresh_from_db()
+        root.refresh_from_db()
+        assert child.path == f'/{other.pk}/{child.pk}/'
+        assert grandchild.path == f'/{other.pk}/{child.pk}/{grandchild.pk}/'
+        assert root.path == f'/{root.pk}/'
+        assert other.path == f'/{other.pk}/'
+
+    def test_move_into_own_subtree_is_rejected(self, tree):
+        """Нельзя вложить категорию в собственного потомка"""
+        root, _, grandchild, _ = tree
+        root.parent = grandchild
+        with pytest.raises(ValidationError):
+            root.clean()
+        with pytest.raises(ValueError):
+            root.save()
+
+    def test_products_count_includes_subtree(self, tree, product):
+        """Счётчик товаров категории учитывает товары подкатегорий"""
+        root, _, grandchild, _ = tree
+        product.category = grandchild
+        product.save()
+        assert root.products_count == 1
+
+
+@pytest.mark.django_db
+class TestCategoryStats:
+    """Тесты счётчиков CategoryStats"""
+
+    @pytest.fixture
+    def tree(self, category):
+        child = Category.objects.create(name='Дочерняя', slug='stats-child', parent=category)
+        other = Category.objects.create(name='Другой корень', slug='stats-other')
+        return category, child, other
+
+    @staticmethod
+    def counts(category, scope='subtree'):
+        stats = CategoryStats.objects.get(category=category)
+        return tuple(getattr(stats, f'{scope}_{name}') for name in ('active', 'in_stock', 'discounted', 'featured'))
+
+    @staticmethod
+    def snapshot():
+        return list(CategoryStats.objects.order_by('pk').values())
+
+    def make_product(self, category, **kwargs):
+        defaults = dict(name='Товар', slug=f'stats-{Product.objects.count()}', price=100,
+                        sku=f'ST-{Product.objects.count()}', stock=5, category=category)
+        defaults.update(kwargs)
+        return Product.objects.create(**defaults)
+
+    def test_product_create_updates_ancestors(self, tree):
+        """Новый товар учитывается в своей категории и у всех предков"""
+        root, child, other = tree
+        self.make_product(child, discount_price=90, is_featured=True)
+        assert self.counts(child, 'direct') == (1, 1, 1, 1)
+        assert self.counts(root, 'direct') == (0, 0, 0, 0)
+        assert self.counts(root) == (1, 1, 1, 1)
+        assert self.counts(other) == (0, 0, 0, 0)
+        assert root.products_count == 1
+
+    def test_product_changes_apply_deltas(self, tree):
+        """Изменение флагов, перенос, деактивация и удаление товара"""
+        root, child, other = tree
+        product = self.make_product(child)
+        product.stock = 0
+        product.discount_price = 50
+        product.save()
+        assert self.counts(root) == (1, 0, 1, 0)
+
+        product = Product.objects.get(pk=product.pk)
+        product.category = other
+        product.save()
+        assert self.counts(root) == (0, 0, 0, 0)
+        assert self.counts(other) == (1, 0, 1, 0)
+
+        product.is_active = False
+        product.save()
+        assert self.counts(other) == (0, 0, 0, 0)
+
+        product.is_active = True
+        product.save()
+        product.delete()
+        assert self.counts(other) == (0, 0, 0, 0)
+
+    def test_partially_loaded_product(self, tree):
+        """Товар, загруженный через only(), берёт прежнее состояние из БД"""
+        root, child, _ = tree
+        product = self.make_product(child)
+        product = Product.objects.only('pk', 'name').get(pk=product.pk)
+        product.is_featured = True
+        product.save()
+        assert self.counts(root) == (1, 1, 0, 1)
+
+    def test_stale_instances_do_not_double_count(self, tree):
+        """Два экземпляра, загруженные до изменений, сохраняются друг за другом без двойного учёта"""
+        root, child, _ = tree
+        product = self.make_product(child)
+        first = Product.objects.get(pk=product.pk)
+        second = Product.objects.get(pk=product.pk)
+        first.is_active = False
+        first.save()
+        second.is_active = False
+        second.save()
+        assert self.counts(root) == (0, 0, 0, 0)
+        second.delete()
+        first.delete()
+        assert self.counts(root) == (0, 0, 0, 0)
+        before = self.snapshot()
+        CategoryStats.rebuild()
+        assert self.snapshot() == before
+
+    def test_move_category_moves_counts(self, tree):
+        """Перенос категории переносит её счётчики к новым предкам"""
+        root, child, other = tree
+        self.make_product(child)
+        child.parent = other
+        child.save()
+        assert self.counts(root) == (0, 0, 0, 0)
+        assert self.counts(other) == (1, 1, 0, 0)
+
+    def test_recalculate_after_bulk_update(self, tree):
+        """Пересчёт после queryset.update() совпадает с полной сверкой"""
+        root, child, _ = tree
+        self.make_product(child)
+        self.make_product(root)
+        Product.objects.update(is_featured=True)
+        CategoryStats.recalculate({child.pk, root.pk})
+        assert self.counts(root) == (2, 2, 0, 2)
+        before = self.snapshot()
+        CategoryStats.rebuild()
+        assert self.snapshot() == before
+
+    def test_recalculate_ancestors_in_one_query(self, tree):
+        """Число запросов пересчёта не растёт с глубиной дерева"""
+        root, child, _ = tree
+        leaf = Category.objects.create(name='Лист', slug='stats-leaf', parent=child)
+        self.make_product(leaf)
+        with CaptureQueriesContext(connection) as queries:
+            CategoryStats.recalculate({leaf.pk})
+        shallow = len(queries)
+        with CaptureQueriesContext(connection) as queries:
+            CategoryStats.recalculate({child.pk})
+        assert len(queries) == shallow
+        assert self.counts(root) == (1, 1, 0, 0)
+
+    def test_incremental_matches_rebuild(self, tree):
+        """Дельты дают тот же результат, что и полный пересчёт"""
+        root, child, other = tree
+        products = [self.make_product(cat, discount_price=price) for cat, price in
+                    ((root, None), (child, 10), (other, None), (child, None))]
+        products[1].category = other
+        products[1].save()
+        products[2].delete()
+        child.parent = other
+        child.save()
+        before = self.snapshot()
+        CategoryStats.rebuild()
+        assert self.snapshot() == before
+
+
 @pytest.mark.django_db
 class TestProductModel:
     """Тесты модели Product"""
@@ -0,0 +1,163 @@
+"""
+Тесты полнотекстового поиска товаров.
+"""
+import pytest
+from django.urls import reverse
+from mybiz_core.models import Product
+from services.product_services import ProductService
+
+
+@pytest.fixture
+def tv(db, category):
+    return Product.objects.create(
+        name='Телевизор Samsung 55',
+        slug='tv-samsung',
+        category=category,
+        price=50000,
+        sku='TV-55-SAM',
+        short_description='Smart TV с диагональю 55 дюймов',
+        description='<p>Отличный <strong>телевизор</strong> для дома</p>',
+        is_active=True
+    )
+
+
+@pytest.fixture
+def headphones(db, category):
+    return Product.objects.create(
+        name='Наушники Sony',
+        slug='sony-headphones',
+        category=category,
+        price=30000,
+        sku='WH-1000XM5',
+        description='<p>Подходят к любому телевизору</p>',
+        is_active=True
+    )
+
+
+@pytest.mark.django_db
+class TestProductSearch:
+    """Тесты ProductService.search_products"""
+
+    def test_search_by_name(self, tv, headphones):
+        results = list(ProductService.search_products('samsung'))
+        assert results == [tv]
+
+    def test_search_by_word_prefix(self, tv):
+        assert tv in ProductService.search_products('телев')
+
+    def test_search_by_sku(self, headphones):
+        assert headphones in ProductService.search_products('WH-1000XM5')
+
+    def test_search_ignores_html_markup(self, tv):
+        assert tv not in ProductService.search_products('strong')
+
+    def test_search_ranks_name_above_description(self, tv, headphones):
+        products = ProductService.sort_products(
+            ProductService.search_products('телевизор'), 'relevance'
+        )
+        assert list(products)[0] == tv
+
+    def test_index_follows_save_and_delete(self, tv):
+        tv.name = 'Проектор Epson'
+        tv.save()
+        assert tv in ProductService.search_products('epson')
+        assert tv not in ProductService.search_products('samsung')
+        tv.delete()
+        assert not ProductService.search_products('epson').exists()
+
+    def test_search_handles_match_syntax(self, tv):
+        assert not ProductService.search_products('"*) OR (').exists()
+
+
+@pytest.mark.django_db
+class TestProductSearchApi:
+    """Тесты ?search= в ProductViewSet"""
+
+    def test_api_search_uses_index(self, client, tv, headphones):
+        response = client.get(reverse('api:product-list'), {'search': 'sony'})
+        assert response.status_code == 200
+        assert [item['id'] for item in response.json()['results']] == [headphones.pk]
+
+
+@pytest.mark.django_db
+class TestRussianMorphology:
+    """Тесты анализатора со стеммингом и стоп-словами"""
+
+    def test_plural_query_matches_singular_name(self, tv):
+        assert tv in ProductService.search_products('телевизоры')
+
+    def test_stop_words_are_ignored(self, tv):
+        assert tv in ProductService.search_products('телевизор для дома')
+
+    def test_query_of_only_stop_words_finds_nothing(self, tv):
+        assert not ProductService.search_products('и для по').exists()
+
+    def test_api_search_is_morphology_aware(self, client, tv):
+        response = client.get(reverse('api:product-list'), {'search': 'Телевизоры'})
+        assert [item['id'] for item in response.json()['results']] == [tv.pk]
+
+    def test_migration_rebuilds_index_like_analyzer(self, tv):
+        """Замороженный анализатор миграции 0005 индексирует так же, как текущий"""
+        from importlib import import_module
+        from types import SimpleNamespace
+
+        from django.apps import apps
+        from django.db import connection
+
+        from services.search_services import FTS_TABLE, INDEXED_FIELDS, get_document
+
+        migration = import_module('mybiz_core.migrations.0005_rebuild_search_index_with_stemming')
+        migration.rebuild_search_index(apps, SimpleNamespace(connection=connection))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT name, sku, short_description, description FROM {FTS_TABLE} WHERE rowid = %s',
+                           [tv.pk])
+            row = cursor.fetchone()
+        document = get_document(tv)
+        assert list(row) == [document[field] for field, _ in INDEXED_FIELDS]
+        assert list(ProductService.search_products('телевизоры')) == [tv]
+
+
+@pytest.mark.django_db
+class TestFuzzySearch:
+    """Тесты нечёткого поиска по триграммам и префиксу артикула"""
+
+    def test_fuzzy_search_tolerates_typos(self, tv, headphones):
+        results = list(ProductService.search_products('Samsumg', mode='fuzzy'))
+        assert results == [tv]
+
+    def test_fuzzy_search_matches_sku_without_separators(self, tv, headphones):
+        assert headphones in ProductService.search_products('WH1000', mode='fuzzy')
+
+    def test_sku_prefix_is_ranked_first(self, tv, headphones):
+        products = ProductService.sort_products(
+            ProductService.search_products('wh-1000', mode='fuzzy'), 'relevance'
+        )
+        assert list(products)[0] == headphones
+
+    def test_fulltext_mode_does_not_tolerate_typos(self, tv):
+        assert not ProductService.search_products('Samsumg').exists()
+
+    def test_auto_mode_falls_back_to_fuzzy(self, tv):
+        assert tv in ProductService.search_products('Samsumg', mode='auto')
+
+    def test_trigram_index_follows_product_changes(self, tv):
+        assert tv in ProductService.search_products('Samsumg', mode='fuzzy')
+        tv.name = 'Телевизор LG'
+        tv.save()
+        assert tv not in ProductService.search_products('Samsumg', mode='fuzzy')
+
+    def test_api_search_mode_fuzzy(self, client, tv, headphones):
+        response = client.get(reverse('api:product-list'), {'search': 'Samsumg', 'search_mode': 'fuzzy'})
+        assert [item['id'] for item in response.json()['results']] == [tv.pk]
+
+
+@pytest.mark.django_db
+class TestPostgresRank:
+    """Ранг PostgreSQL приводится к float8: курсор пагинации сравнивается без потери точности"""
+
+    @pytest.mark.parametrize('method', ['search', 'fuzzy_search'])
+    def test_rank_cast_to_float8(self, method):
+        from services.search_services import PostgresSearchBackend
+
+        queryset = getattr(PostgresSearchBackend(), method)(Product.objects.all(), 'Телевизор')
+        assert str(queryset.query).count('::float8') == 1
@@ -0,0 +1,282 @@
+"""
+Тесты сервисного слоя каталога (фасеты, пагинация, категории).
+"""
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from mybiz_core.models import Category, Product
+from services.facet_services import FacetService
+from services.pagination import KeysetPaginator, InvalidCursor, estimate_count
+from services.product_services import CategoryService, ProductService
+
+
+@pytest.fixture
+def catalog(db, category):
+    """Небольшой каталог: 2 категории, 3 бренда, разные цены и флаги"""
+    other = Category.objects.create(name='Другая категория', slug='other-category', is_active=True)
+    products = [
+        ('Телевизор Samsung', category, 'Samsung', 45000, None, True, 5, False),
+        ('Смартфон Samsung', category, 'Samsung', 900, 800, True, 0, True),
+        ('Наушники Sony', other, 'Sony', 3000, None, False, 0, True),
+        ('Колонка без бренда', other, '', 60000, 55000, True, 2, False),
+    ]
+    created = []
+    for index, (name, cat, brand, price, discount, in_stock, stock, is_new) in enumerate(products):
+        created.append(Product.objects.create(
+            name=name, slug=f'catalog-{index}', category=cat, brand=brand, price=price,
+            discount_price=discount, in_stock=in_stock, stock=stock, is_new=is_new,
+            sku=f'CAT-{index}', is_active=True
+        ))
+    return created
+
+
+@pytest.mark.django_db
+class TestFacetService:
+    """Тесты FacetService"""
+
+    def test_facet_counts(self, catalog, category):
+        facets = FacetService.compute_facets(ProductService.search_products(''))
+        assert facets['total'] == 4
+        assert facets['in_stock'] == 2
+        assert facets['is_new'] == 2
+        assert facets['has_discount'] == 2
+        assert facets['brands'] == [{'value': 'Samsung', 'count': 2}, {'value': 'Sony', 'count': 1}]
+        assert {item['slug']: item['count'] for item in facets['categories']} == {
+            category.slug: 2, 'other-category': 2
+        }
+        assert [bucket['count'] for bucket in facets['price']] == [1, 1, 0, 1, 1]
+
+    def test_facets_follow_current_filters(self, catalog):
+        facets = FacetService.compute_facets(ProductService.search_products('', {'brand': 'Samsung'}))
+        assert facets['total'] == 2
+        assert facets['brands'] == [{'value': 'Samsung', 'count': 2}]
+
+    def test_facets_computed_in_single_query(self, catalog):
+        with CaptureQueriesContext(connection) as queries:
+            FacetService.compute_facets(ProductService.search_products('samsung'))
+        assert len(queries) == 1
+
+    def test_signature_is_normalized(self):
+        assert FacetService.get_signature({'b': '2', 'a': '1', 'page': '3', 'q': ''}) == \
+            FacetService.get_signature({'a': '1', 'b': '2'})
+
+    def test_product_list_context_has_facets(self, client, catalog):
+        response = client.get(reverse('mybiz_core:product_list'), {'brand': 'Sony'})
+        assert response.context['facets']['total'] == 1
+
+    def test_api_and_html_facets_do_not_share_keys(self, client, catalog):
+        """Параметр, который API не обрабатывает, не подменяет фасеты HTML-каталога"""
+        from django.core.cache import cache
+        from django.test import override_settings
+
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            cache.clear()
+            api = client.get(reverse('api:product-list'), {'min_price': '5000', 'search_mode': 'auto'})
+            assert api.json()['facets']['total'] == 4
+            response = client.get(reverse('mybiz_core:product_list'), {'min_price': '5000'})
+            assert response.status_code == 200
+            assert response.context['facets']['total'] == 2
+            cache.clear()
+
+    def test_api_list_has_facets(self, client, catalog):
+        response = client.get(reverse('api:product-list'), {'in_stock': 'true'})
+        facets = response.json()['facets']
+        assert facets['total'] == 3
+        assert facets['in_stock'] == 2
+
+
+@pytest.fixture
+def many_products(db, category):
+    """15 товаров с повторяющимися ценами - больше одной страницы каталога"""
+    return [
+        Product.objects.create(
+            name=f'Товар {index:02d}', slug=f'many-{index}', category=category,
+            price=1000 + (index % 3) * 100, sku=f'MANY-{index}', is_active=True
+        )
+        for index in range(15)
+    ]
+
+
+def _walk(paginator):
+    items, cursor = [], None
+    while True:
+        page = paginator.get_page(cursor)
+        items.extend(page)
+        if not page.has_next:
+            return items
+        cursor = page.next_cursor
+
+
+@pytest.mark.django_db
+class TestKeysetPagination:
+    """Тесты курсорной пагинации"""
+
+    @pytest.mark.parametrize('sort_by', ['newest', 'price_asc', 'price_desc', 'popular', 'name_asc'])
+    def test_walk_matches_full_ordering(self, many_products, sort_by):
+        products = ProductService.sort_products(ProductService.search_products(''), sort_by)
+        paginator = KeysetPaginator(products, page_size=4)
+        assert [p.pk for p in _walk(paginator)] == [p.pk for p in paginator.queryset]
+        assert len({p.pk for p in _walk(paginator)}) == 15
+
+    def test_unsupported_ordering_falls_back_to_newest(self, many_products):
+        paginator = KeysetPaginator(Product.objects.order_by('stock'))
+        assert paginator.ordering == '-created_at'
+
+    def test_invalid_cursor(self, many_products):
+        paginator = KeysetPaginator(Product.objects.order_by('price'), page_size=4)
+        cursor = paginator.get_page().next_cursor
+        with pytest.raises(InvalidCursor):
+            paginator.get_page('не-курсор')
+        with pytest.raises(InvalidCursor):
+            KeysetPaginator(Product.objects.order_by('name')).get_page(cursor)
+
+    def test_page_without_count_query(self, many_products):
+        paginator = KeysetPaginator(Product.objects.order_by('-created_at'), page_size=4)
+        cursor = paginator.get_page().next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            page = paginator.get_page(cursor)
+        assert len(queries) == 1
+        assert 'OFFSET' not in queries[0]['sql'] and 'COUNT' not in queries[0]['sql']
+        assert len(page) == 4
+
+    def test_estimate_count(self, many_products):
+        assert estimate_count(Product.objects.all()) == 15
+
+    def test_product_list_total_ignores_cached_facets(self, client, many_products, monkeypatch):
+        """Число страниц не берётся из фасетов: устаревший total из кэша не ломает список"""
+        real_get_facets = FacetService.get_facets
+
+        def stale_facets(*args, **kwargs):
+            return dict(real_get_facets(*args, **kwargs), total=99)
+
+        monkeypatch.setattr(FacetService, 'get_facets', stale_facets)
+        response = client.get(reverse('mybiz_core:product_list'))
+        assert response.context['total_products'] == 15
+        assert response.context['next_cursor']
+        assert client.get(reverse('mybiz_core:product_list'), {'page': '5'}).status_code == 200
+
+    def test_infinite_scroll_endpoint(self, client, many_products):
+        response = client.get(reverse('mybiz_core:product_list'), {'sort': 'price_asc'})
+        shown = [p.pk for p in response.context['products']]
+        more = client.get(response.context['more_url'] + '&cursor=' + response.context['next_cursor'])
+        data = more.json()
+        assert data['has_next'] is False
+        assert data['html'].count('role="listitem"') == 3
+        assert len(shown) == 12
+
+    def test_infinite_scroll_invalid_cursor(self, client, many_products):
+        response = client.get(reverse('mybiz_core:product_list_more'), {'cursor': 'xxx'})
+        assert response.status_code == 400
+
+    def test_api_cursor_mode(self, client, many_products):
+        url = reverse('api:product-list')
+        data = client.get(url, {'cursor': '', 'ordering': 'price', 'page_size': 10, 'estimate_total': 'true'}).json()
+        assert 'count' not in data
+        assert data['estimated_count'] == 15
+        assert len(data['results']) == 10
+        second = client.get(data['next']).json()
+        assert len(second['results']) == 5
+        assert second['next'] is None
+        ids = [item['id'] for item in data['results'] + second['results']]
+        assert len(set(ids)) == 15
+
+    def test_api_page_number_mode_unchanged(self, client, many_products):
+        data = client.get(reverse('api:product-list'), {'page': 2}).json()
+        assert data['count'] == 15
+        assert len(data['results']) == 3
+
+    def test_api_invalid_cursor(self, client, many_products):
+        response = client.get(reverse('api:product-list'), {'cursor': 'xxx'})
+        assert response.status_code == 404
+
+
+@pytest.fixture
+def deep_tree(db, category):
+    """Цепочка из 6 уровней под category, товар на самом нижнем уровне"""
+    parent = category
+    levels = [category]
+    for depth in range(1, 7):
+        parent = Category.objects.create(name=f'Уровень {depth}', slug=f'level-{depth}', parent=parent)
+        levels.append(parent)
+    Product.objects.create(
+        name='Глубокий товар', slug='deep-product', category=parent,
+        price=100, sku='DEEP-1', is_active=True
+    )
+    Category.objects.create(name='Сосед', slug='sibling')
+    return levels
+
+
+@pytest.mark.django_db
+class TestCategorySubtreeFilter:
+    """Фильтр по категории включает всё поддерево"""
+
+    def test_parent_category_lists_descendant_products(self, deep_tree):
+        products = ProductService.search_products('', {'category_slug': deep_tree[0].slug})
+        assert [p.slug for p in products] == ['deep-product']
+        assert ProductService.search_products('', {'category_slug': 'sibling'}).count() == 0
+        assert ProductService.search_products('', {'category_slug': 'missing'}).count() == 0
+
+    def test_listing_agrees_with_products_count(self, deep_tree):
+        for level in deep_tree:
+            products = ProductService.search_products('', {'category_slug': level.slug})
+            assert products.count() == level.products_count == 1
+
+    def test_query_count_does_not_depend_on_depth(self, deep_tree):
+        with CaptureQueriesContext(connection) as queries:
+            list(ProductService.search_products('', {'category_slug': deep_tree[0].slug}))
+        assert len(queries) == 2
+
+    def test_product_list_view(self, client, deep_tree):
+        url = reverse('mybiz_core:product_list_by_category', kwargs={'category_slug': deep_tree[2].slug})
+        response = client.get(url)
+        assert [p.slug for p in response.context['products']] == ['deep-product']
+
+    def test_api_filters(self, client, deep_tree):
+        url = reverse('api:product-list')
+        assert client.get(url, {'category__slug': deep_tree[1].slug}).json()['count'] == 1
+        assert client.get(url, {'category': deep_tree[0].pk}).json()['count'] == 1
+        assert client.get(url, {'category__slug': 'sibling'}).json()['count'] == 0
+
+
+@pytest.mark.django_db
+class TestCategoriesWithCounts:
+    """Пакетный подсчёт товаров по дереву категорий"""
+
+    def test_counts_include_subtree(self, deep_tree):
+        counts = {c.slug: c.products_count for c in CategoryService.get_categories_with_counts()}
+        assert all(counts[level.slug] == 1 for level in deep_tree)
+        assert counts['sibling'] == 0
+
+    def test_inactive_subcategory_products_counted_in_parent(self, deep_tree):
+        Category.objects.filter(pk=deep_tree[-1].pk).update(is_active=False)
+        categories = {c.slug: c for c in CategoryService.get_categories_with_counts()}
+        assert deep_tree[-1].slug not in categories
+        assert categories[deep_tree[0].slug].products_count == 1
+
+    def test_single_query(self, deep_tree):
+        with CaptureQueriesContext(connection) as queries:
+            categories = CategoryService.get_categories_with_counts()
+            [c.products_count for c in categories]
+        assert len(queries) == 1
+
+    def test_tree(self, deep_tree):
+        roots = CategoryService.get_category_tree()
+        assert {c.slug for c in roots} == {deep_tree[0].slug, 'sibling'}
+        node = next(c for c in roots if c.pk == deep_tree[0].pk)
+        for level in deep_tree[1:]:
+            assert [child.pk for child in node.tree_children] == [level.pk]
+            node = node.tree_children[0]
+
+    def test_page_queries_do_not_grow_with_categories(self, client, deep_tree):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                client.get(reverse('mybiz_core:product_list'))
+            return len(queries)
+
+        count_queries()  # первый запрос создаёт настройки сайта
+        before = count_queries()
+        for index in range(20):
+            Category.objects.create(name=f'Ещё категория {index}', slug=f'more-{index}')
+        assert count_queries() == before
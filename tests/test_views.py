@@ -1,7 +1,12 @@
 """
 Тесты для views mybiz_core.
 """
+import json
+import os
+
 import pytest
+from django.core.cache import cache
+from django.test import override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from mybiz_core.models import Category, Product
@@ -128,3 +133,222 @@ class TestErrorViews:
         """Проверка страницы 404"""
         response = client.get('/nonexistent-page/')
         assert response.status_code == 404
+
+
+@pytest.fixture
+def real_cache():
+    """Версии кэша, от которых зависят ETag, должны сохраняться между запросами"""
+    caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'views'}}
+    with override_settings(CACHES=caches):
+        cache.clear()
+        yield
+        cache.clear()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('real_cache')
+class TestConditionalGet:
+    """Тесты условных GET-запросов (ETag / Last-Modified)"""
+
+    def revalidate(self, client, url, **headers):
+        response = client.get(url, **headers)
+        assert response.status_code == 200
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **headers)
+
+    def test_product_detail_not_modified(self, client, product, site_settings):
+        response = self.revalidate(client, product.get_absolute_url())
+        assert response.status_code == 304
+
+    def test_product_detail_without_last_modified(self, client, product, site_settings):
+        """Дата товара не отражает изменений макета: If-Modified-Since не даёт 304"""
+        response = client.get(product.get_absolute_url())
+        assert not response.has_header('Last-Modified')
+        response = client.get(product.get_absolute_url(), HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        assert response.status_code == 200
+
+    def test_product_change_invalidates_etag(self, client, product, site_settings):
+        etag = client.get(product.get_absolute_url())['ETag']
+        product.price = 1500
+        product.save()
+        response = client.get(product.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+    def test_api_list_not_modified_without_queries(self, client, product, django_assert_num_queries):
+        url = '/api/products/?ordering=price'
+        etag = client.get(url)['ETag']
+        with django_assert_num_queries(0):
+            assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    def test_api_etag_changes_with_catalog(self, client, product, django_capture_on_commit_callbacks):
+        etag = client.get('/api/categories/')['ETag']
+        with django_capture_on_commit_callbacks(execute=True):
+            product.save()
+        assert client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_api_promotions_and_settings(self, client, site_settings):
+        assert self.revalidate(client, '/api/promotions/').status_code == 304
+        assert self.revalidate(client, '/api/site-settings/').status_code == 304
+
+
+@pytest.mark.django_db
+class TestSparseFields:
+    """Выборочные поля API: ?fields= и ?expand="""
+
+    def get_results(self, client, url):
+        response = client.get(url)
+        assert response.status_code == 200
+        return response.json()['results']
+
+    def test_fields_limit_output(self, client, product):
+        results = self.get_results(client, '/api/products/?fields=id,name,price,image')
+        assert set(results[0]) == {'id', 'name', 'price', 'image'}
+
+    def test_nested_fields(self, client, product):
+        results = self.get_results(client, '/api/products/?fields=id,category.name')
+        assert results[0] == {'id': product.pk, 'category': {'name': product.category.name}}
+
+    def test_nested_products_count_trimmed_by_fields(self, client, product):
+        results = self.get_results(client, '/api/products/')
+        assert results[0]['category']['products_count'] == 1
+        results = self.get_results(client, '/api/products/?fields=id,category.name')
+        assert 'products_count' not in results[0]['category']
+
+    def test_category_endpoint_keeps_products_count(self, client, product):
+        results = self.get_results(client, '/api/categories/')
+        assert results[0]['products_count'] == 1
+
+    def test_query_narrowed_with_only(self, client, product):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_results(client, '/api/products/?fields=id,name,price')
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT "mybiz_core_product"."id"')]
+        assert selects
+        assert not any('description' in sql or 'mybiz_core_category' in sql for sql in selects)
+
+    def test_nested_fields_join_without_stats(self, client, product):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_results(client, '/api/products/?fields=id,category.name')
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT "mybiz_core_product"."id"')]
+        assert any('"mybiz_core_category"."name"' in sql for sql in selects)
+        assert not any('categorystats' in sql or '"mybiz_core_category"."description"' in sql for sql in selects)
+
+    def test_detail_with_fields(self, client, product):
+        response = client.get(f'/api/products/{product.pk}/?fields=id,description')
+        assert response.json() == {'id': product.pk, 'description': product.description}
+
+    def test_cursor_pagination_with_fields(self, client, product):
+        response = client.get('/api/products/?cursor=&fields=id&page_size=1')
+        assert response.status_code == 200
+        assert response.json()['results'] == [{'id': product.pk}]
+
+
+@pytest.mark.django_db
+class TestValuesListMode:
+    """Список товаров через values_list: тот же JSON, что и через экземпляры"""
+
+    @pytest.fixture
+    def products(self, category):
+        from decimal import Decimal
+
+        category.image = 'categories/test.jpg'
+        category.save()
+        discounts = [None, Decimal('0'), Decimal('899.99'), Decimal('0.01'), Decimal('1500.00')]
+        prices = [Decimal('1000.00'), Decimal('999.99'), Decimal('3.00'), Decimal('0.00'), Decimal('123.45')]
+        return Product.objects.bulk_create([
+            Product(
+                name=f'Товар {index}', slug=f'values-product-{index}', category=category,
+                price=prices[index % len(prices)], discount_price=discounts[index // len(prices) % len(discounts)],
+                sku=f'VAL-{index:03d}', image=f'products/{index}.jpg' if index % 3 else '',
+                rating=Decimal(index % 50) / 10, is_new=bool(index % 2), is_featured=bool(index % 7 == 0),
+                in_stock=True, stock=index,
+            )
+            for index in range(100)
+        ])
+
+    def get_both(self, client, monkeypatch, url):
+        from api.views import ProductViewSet
+
+        fast = client.get(url)
+        monkeypatch.setattr(ProductViewSet, 'values_list_mode', False)
+        slow = client.get(url)
+        monkeypatch.setattr(ProductViewSet, 'values_list_mode', True)
+        assert fast.status_code == slow.status_code == 200
+        return fast.content, slow.content
+
+    @pytest.mark.parametrize('query', [
+        'page_size=100',
+        'page_size=100&ordering=-price',
+        'page_size=30&page=2&fields=id,display_price,discount_percentage,category.image',
+        'cursor=&page_size=100&ordering=rating',
+        'has_discount=true&page_size=100',
+    ])
+    def test_same_json(self, client, monkeypatch, products, query):
+        fast, slow = self.get_both(client, monkeypatch, f'/api/products/?{query}')
+        assert fast == slow
+
+    def test_discount_percentage_truncated(self, client, products):
+        results = client.get('/api/products/?page_size=100&fields=price,discount_price,discount_percentage').json()
+        percentages = {(row['price'], row['discount_price']): row['discount_percentage'] for row in results['results']}
+        assert percentages[('999.99', '899.99')] == 10
+        assert percentages[('3.00', '0.01')] == 99
+        assert percentages[('1000.00', '1500.00')] == -50
+        assert percentages[('0.00', '899.99')] == 0
+
+    def test_cursor_next_page(self, client, products):
+        first = client.get('/api/products/?cursor=&page_size=60&fields=id').json()
+        second = client.get(first['next']).json()
+        ids = [row['id'] for row in first['results'] + second['results']]
+        assert sorted(ids) == sorted(product.pk for product in products)
+
+    def test_products_count_keeps_values_mode(self, client, monkeypatch, rf, products):
+        from rest_framework.request import Request
+
+        from api.serializers import ProductListSerializer
+
+        fast, slow = self.get_both(client, monkeypatch, '/api/products/?page_size=5')
+        assert fast == slow
+        assert 'products_count' in json.loads(fast)['results'][0]['category']
+        serializer = ProductListSerializer(context={'request': Request(rf.get('/api/products/'))})
+        assert serializer.get_values_plan() is not None
+
+    @pytest.fixture
+    def list_serializers(self, rf):
+        """Страница из 100 товаров: через экземпляры и через values_list"""
+        from rest_framework.request import Request
+
+        from api.serializers import ProductListSerializer
+
+        request = Request(rf.get('/api/products/'))
+        queryset = Product.objects.select_related('category').order_by('-created_at', 'pk')
+
+        def standard():
+            return ProductListSerializer(list(queryset[:100]), many=True, context={'request': request}).data
+
+        def values():
+            serializer = ProductListSerializer(context={'request': request})
+            rows = list(serializer.values_queryset(queryset)[:100])
+            return serializer.to_values_representation(rows)
+
+        return standard, values
+
+    def test_serializer_output_identical(self, products, list_serializers):
+        from rest_framework.renderers import JSONRenderer
+
+        standard, values = list_serializers
+        assert JSONRenderer().render(values()) == JSONRenderer().render(standard())
+
+    @pytest.mark.slow
+    @pytest.mark.skipif(not os.environ.get('RUN_BENCHMARKS'), reason='замер времени: RUN_BENCHMARKS=1')
+    def test_benchmark(self, products, list_serializers):
+        """values_list быстрее экземпляров хотя бы на 10% (лучшее из 20 прогонов)"""
+        import timeit
+
+        standard, values = list_serializers
+        standard_time = min(timeit.repeat(standard, number=1, repeat=20))
+        values_time = min(timeit.repeat(values, number=1, repeat=20))
+        assert values_time < standard_time * 0.9